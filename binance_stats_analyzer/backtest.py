@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+import os
+import json
+import tempfile
+import argparse
+import numpy as np
+import pandas as pd
+from binance.helpers import interval_to_milliseconds
+
+from benchmark import get_commit
+from utils.klines import Klines
+from utils.backtester import Backtester
+from utils.prepared_series import get_freq
+from utils.replay_server import get_fixture_path
+from utils.stats_analyzer import StatisticalAnalyzer, get_analyzer_config
+from common_utils.common import load_yml
+from common_utils.logger import get_logger
+
+LOGGER = get_logger("statistical_analyzer/backtest")
+
+DAY_IN_MS = 86400000
+
+
+def get_backtest_config(config_path: str) -> dict:
+    """
+    Get config of the backtest.
+
+    Args:
+        config_path (str): Path of the config.
+    Returns:
+        Config of the backtest (dict).
+    """
+    return load_yml(config_path)
+
+
+def load_fixture(fixture_dir: str, symbol: str, interval: str) -> Klines:
+    """
+    Load the klines of a fixture.
+
+    Args:
+        fixture_dir (str): Directory of the fixtures.
+        symbol (str): Symbol of the cyrptocurrency on Binance.
+        interval (str): Interval of the klines.
+    Returns:
+        Klines.
+    """
+    with open(get_fixture_path(fixture_dir, symbol, interval), "r") as file:
+        return Klines.from_raw(json.load(file))
+
+
+def to_json_list(values: np.ndarray) -> list:
+    """
+    Convert an array to nested lists, None for the undefined (NaN or
+    infinite) values.
+
+    Args:
+        values (np.ndarray): Values.
+    Returns:
+        Values (list).
+    """
+    return np.where(np.isfinite(values), values, None).tolist()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Backtest the stats score.")
+    parser.add_argument(
+        "--config",
+        default="configs/stats_analyzer/backtest.yml",
+        help="Path of the backtest config.",
+    )
+    parser.add_argument("--output", help="Path of the results, overrides the config.")
+    args = parser.parse_args()
+
+    config = get_backtest_config(args.config)
+    output_path = args.output or config["output_path"]
+    interval = config["interval"]
+    analyzer_config = get_analyzer_config()
+    analyzer_config.update(
+        {
+            "interval": interval,
+            "enable_global_LightGBM": False,
+            "model_registry_dir": tempfile.mkdtemp(),
+            "forecast_store_path": f"{tempfile.mkdtemp()}/forecasts.sqlite",
+        }
+    )
+    analyzer_config.update(config.get("analyzer_config") or {})
+    stats_analyzer = StatisticalAnalyzer(analyzer_config)
+    backtester = Backtester(
+        stats_analyzer,
+        window_bars=config["window_in_days"]
+        * DAY_IN_MS
+        // interval_to_milliseconds(interval),
+        step_bars=config["step_bars"],
+        cutoffs_per_chain=config["cutoffs_per_chain"],
+    )
+    klines_by_target = {
+        target: load_fixture(config["fixture_dir"], target, interval)
+        for target in config["targets"]
+    }
+    result = backtester.run(klines_by_target, get_freq(interval))
+    if stats_analyzer.forecast_engine:
+        stats_analyzer.forecast_engine.shutdown()
+
+    for target, metrics in result["metrics"].items():
+        LOGGER.info(f"Backtest of {target}: {metrics}")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "w") as file:
+        json.dump(
+            {
+                "commit": get_commit(),
+                "created_at": pd.Timestamp.now().isoformat(),
+                "config": config,
+                "models": stats_analyzer.models,
+                "targets": result["targets"],
+                "metrics": result["metrics"],
+                "cutoff_times": [str(cutoff) for cutoff in result["cutoff_times"]],
+                "scores": to_json_list(result["scores"]),
+                "forward_returns": to_json_list(result["forward_returns"]),
+                "max_returns": to_json_list(result["max_returns"]),
+            },
+            file,
+            indent=2,
+            # NaN is not valid JSON, undefined values are written as null
+            allow_nan=False,
+        )
+    LOGGER.info(f"Saved backtest results at {output_path}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+import os
+import json
+import time
+import argparse
+import resource
+import subprocess
+import multiprocessing
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from binance.helpers import interval_to_milliseconds
+
+from common_utils.common import load_yml
+from common_utils.logger import get_logger
+
+LOGGER = get_logger("statistical_analyzer/benchmark")
+
+DAY_IN_MS = 86400000
+
+
+def get_benchmark_config(config_path: str) -> dict:
+    """
+    Get config of the forecast benchmark.
+
+    Args:
+        config_path (str): Path of the config.
+    Returns:
+        Config of the benchmark (dict).
+    """
+    return load_yml(config_path)
+
+
+def get_peak_rss_in_mb() -> float:
+    """
+    Get peak resident set size of this process.
+
+    Args:
+        None.
+    Returns:
+        Peak RSS in MB (float).
+    """
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def get_commit() -> str:
+    """
+    Get the commit of the working tree, if it is a git repository.
+
+    Args:
+        None.
+    Returns:
+        Commit hash (str), None if not available.
+    """
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_case(case: dict) -> dict:
+    """
+    Run a benchmark case, meant to run in a fresh process so that the peak
+    RSS only accounts for this case.
+
+    The klines of each target are split into a training series and the last
+    holdout_bars bars. forecast_prices is run on the training series with an
+    empty model registry. The fit time is the time of the fit calls reported
+    by the fitted models, then the fitted models predict again for the
+    predict time. The forecast time also includes the registry, the store
+    and the denormalization of the forecasts.
+
+    Args:
+        case (dict): Model, interval, duration, targets and config of the case.
+    Returns:
+        Result of the case (dict).
+    """
+    import tempfile
+    import numpy as np
+    from utils.klines import Klines
+    from utils.prepared_series import PreparedSeries, get_freq
+    from utils.replay_server import get_fixture_path
+    from utils.stats_analyzer import StatisticalAnalyzer, get_analyzer_config
+
+    baseline_rss_in_mb = get_peak_rss_in_mb()
+    model, interval, holdout_bars = (
+        case["model"],
+        case["interval"],
+        case["holdout_bars"],
+    )
+    n_bars = case["duration_in_days"] * DAY_IN_MS // interval_to_milliseconds(interval)
+
+    series, actuals = {}, {}
+    for target in case["targets"]:
+        with open(get_fixture_path(case["fixture_dir"], target, interval), "r") as file:
+            klines = Klines.from_raw(json.load(file))
+        klines = klines[-(n_bars + holdout_bars) :]
+        series[target] = PreparedSeries.from_klines(
+            klines[:-holdout_bars], get_freq(interval)
+        )
+        actuals[target] = klines.open[-holdout_bars:]
+
+    config = get_analyzer_config()
+    config.update(
+        {
+            "interval": interval,
+            "duration_in_days": case["duration_in_days"],
+            "enable_LSTM": model == "LSTM",
+            "enable_MonteCarlo": model == "MonteCarlo",
+            "enable_global_LightGBM": False,
+            "enable_parallel_forecast": False,
+            "forecast_timeout_per_model_in_seconds": 0,
+            "forecast_timeout_per_analysis_in_seconds": 0,
+            "model_registry_dir": tempfile.mkdtemp(),
+            "forecast_store_path": f"{tempfile.mkdtemp()}/forecasts.sqlite",
+        }
+    )
+    config.update(case["analyzer_config"])
+    stats_analyzer = StatisticalAnalyzer(config)
+    stats_analyzer.models = [model]
+
+    start_time = time.perf_counter()
+    forecasts = stats_analyzer.forecast_prices(series)
+    forecast_time_in_seconds = time.perf_counter() - start_time
+
+    prices_list = [target_series.raw for target_series in series.values()]
+    if model == "MonteCarlo":
+        # Nothing is fitted, the estimates of the drift and the volatility are
+        start_time = time.perf_counter()
+        stats_analyzer.model_MonteCarlo.estimate(prices_list)
+        fit_time_in_seconds = time.perf_counter() - start_time
+    else:
+        fit_time_in_seconds = sum(
+            stats_analyzer.model_registry.get(target, model).fit_time_in_seconds
+            for target in series
+        )
+
+    start_time = time.perf_counter()
+    if model == "MonteCarlo":
+        # Predicting is simulating again
+        stats_analyzer.model_MonteCarlo.simulate(prices_list)
+    else:
+        for target in series:
+            stats_analyzer.model_registry.get(target, model).model.predict(n=30)
+    predict_time_in_seconds = time.perf_counter() - start_time
+
+    errors = []
+    for target, actual in actuals.items():
+        prediction = forecasts[target][0][model][:holdout_bars]
+        errors.append(np.mean(np.abs(prediction - actual) / np.abs(actual)))
+
+    return {
+        "model": model,
+        "interval": interval,
+        "duration_in_days": case["duration_in_days"],
+        "n_targets": len(series),
+        "n_bars": min(len(target_series) for target_series in series.values()),
+        "fit_time_in_seconds": fit_time_in_seconds,
+        "predict_time_in_seconds": predict_time_in_seconds,
+        "forecast_time_in_seconds": forecast_time_in_seconds,
+        "baseline_rss_in_mb": baseline_rss_in_mb,
+        "peak_rss_in_mb": get_peak_rss_in_mb(),
+        "mape": float(np.mean(errors)),
+        "mape_per_target": dict(zip(series, map(float, errors))),
+    }
+
+
+def get_cases(config: dict) -> list:
+    """
+    Get the benchmark cases of all combinations in the config.
+
+    Args:
+        config (dict): Config of the benchmark.
+    Returns:
+        Benchmark cases (list of dict).
+    """
+    return [
+        {
+            "model": model,
+            "interval": interval,
+            "duration_in_days": duration_in_days,
+            "targets": config["targets"][:n_targets],
+            "holdout_bars": config["holdout_bars"],
+            "fixture_dir": config["fixture_dir"],
+            "analyzer_config": config.get("analyzer_config") or {},
+        }
+        for model in config["models"]
+        for interval in config["intervals"]
+        for duration_in_days in config["durations_in_days"]
+        for n_targets in config["target_counts"]
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the forecasters.")
+    parser.add_argument(
+        "--config",
+        default="configs/stats_analyzer/benchmark.yml",
+        help="Path of the benchmark config.",
+    )
+    parser.add_argument("--output", help="Path of the results, overrides the config.")
+    args = parser.parse_args()
+
+    config = get_benchmark_config(args.config)
+    output_path = args.output or config["output_path"]
+    cases = get_cases(config)
+    results = []
+    # One process per case, the peak RSS of a process never goes down
+    with ProcessPoolExecutor(
+        max_workers=1,
+        mp_context=multiprocessing.get_context("spawn"),
+        max_tasks_per_child=1,
+    ) as executor:
+        for idx, case in enumerate(cases):
+            name = f"{case['model']} {case['interval']} {case['duration_in_days']}d x {len(case['targets'])}"
+            LOGGER.info(f"Running case {idx + 1}/{len(cases)}: {name}...")
+            try:
+                result = executor.submit(run_case, case).result()
+            except Exception as err:
+                LOGGER.error(f"Case {name} failed: {err}")
+                result = {
+                    "model": case["model"],
+                    "interval": case["interval"],
+                    "duration_in_days": case["duration_in_days"],
+                    "n_targets": len(case["targets"]),
+                    "error": str(err),
+                }
+            results.append(result)
+            LOGGER.info(f"Result of {name}: {result}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "w") as file:
+        json.dump(
+            {
+                "commit": get_commit(),
+                "created_at": pd.Timestamp.now().isoformat(),
+                "config": config,
+                "results": results,
+            },
+            file,
+            indent=2,
+        )
+    LOGGER.info(f"Saved {len(results)} benchmark results at {output_path}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,11 @@ import os
 
 from time import sleep
 from utils.handler import Handler
-from utils.stats_analyzer import StatisticalAnalyzer
+from utils.render_pool import RenderPool
+from utils.stats_analyzer import StatisticalAnalyzer, get_analyzer_config
 from utils.binance_client import BinanceClient
 from common_utils.logger import get_logger
+from common_utils.artifact_store import ArtifactStore
 from common_utils.mqtt import Subscriber, Publisher, Broker
 
 LOGGER = get_logger("Statistical Analyzer")
@@ -18,7 +20,11 @@ def main() -> None:
     binance_api_secret = os.getenv("BINANCE_API_SECRET")
     binance_api = BinanceClient(binance_api_key, binance_api_secret)
     stats_analyzer = StatisticalAnalyzer()
-    handler = Handler(binance_api, stats_analyzer, publisher)
+    config = get_analyzer_config()
+    render_pool = RenderPool(
+        config["render_workers"], config["render_cache_size"], ArtifactStore()
+    )
+    handler = Handler(binance_api, stats_analyzer, publisher, render_pool)
     subscriber = Subscriber(
         "stats-analyzer-sub", Broker(), "text-analyzer-pub", [handler]
     )
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+ANALYZER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROOT_DIR = os.path.dirname(ANALYZER_DIR)
+
+# The analyzer imports its modules as utils.*, and the shared ones as common_utils.*
+sys.path[:0] = [ANALYZER_DIR, ROOT_DIR]
+
+
+@pytest.fixture(autouse=True)
+def root_dir(monkeypatch) -> str:
+    """
+    Run the tests from the root of the repository, where the configs are.
+    """
+    monkeypatch.chdir(ROOT_DIR)
+    return ROOT_DIR
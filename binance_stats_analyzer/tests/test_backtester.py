@@ -0,0 +1,110 @@
+import json
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import utils.backtester as backtester
+from utils.backtester import HORIZON, Backtester
+
+TARGETS = ["BTCUSDT", "ETHUSDT"]
+MODELS = ["ARIMA", "LightGBM"]
+N_BARS = 200
+
+
+def fake_chain(chain) -> np.ndarray:
+    """
+    Forecast model index * 1000 + target index * 100 + cutoff, so that the
+    forecasts tell where they come from.
+    """
+    value = MODELS.index(chain.model_name) * 1000 + TARGETS.index(chain.target) * 100
+    return np.repeat(value + chain.cutoffs[:, None], HORIZON, axis=1).astype(float)
+
+
+@pytest.fixture
+def stats_analyzer():
+    return SimpleNamespace(
+        models=MODELS,
+        model_ARIMA=None,
+        model_LightGBM=None,
+        order_search_every_n_bars=0,
+        order_error_threshold=0.2,
+        get_refit_schedule=lambda model: {"full_refit_every_n_bars": 7},
+        forecast_engine=None,
+    )
+
+
+@pytest.fixture
+def klines_by_target():
+    return {
+        target: SimpleNamespace(
+            open_time=np.arange(N_BARS) * 86400000, open=np.linspace(1.0, 2.0, N_BARS)
+        )
+        for target in TARGETS
+    }
+
+
+@pytest.fixture
+def evaluated(monkeypatch) -> dict:
+    """
+    Capture the arguments of Backtester.evaluate instead of scoring.
+    """
+    evaluated = {}
+
+    def evaluate(self, prices, cutoffs, forecast_max, forecast_min, *args):
+        evaluated.update(cutoffs=cutoffs, forecast_max=forecast_max)
+
+    monkeypatch.setattr(Backtester, "evaluate", evaluate)
+    return evaluated
+
+
+def test_uneven_chains_are_reassembled_in_order(
+    stats_analyzer, klines_by_target, evaluated, monkeypatch
+):
+    monkeypatch.setattr(backtester, "run_backtest_chain", fake_chain)
+    # 18 cutoffs in chains of 8, 8 and 2
+    Backtester(stats_analyzer, 50, 7, 8).run(klines_by_target)
+
+    cutoffs = evaluated["cutoffs"]
+    assert len(cutoffs) == 18
+    expected = (
+        np.arange(len(MODELS))[:, None, None] * 1000
+        + np.arange(len(TARGETS))[None, :, None] * 100
+        + cutoffs[None, None, :]
+    )
+    np.testing.assert_array_equal(evaluated["forecast_max"], expected)
+
+
+def test_monte_carlo_only_runs_without_chains(
+    stats_analyzer, klines_by_target, evaluated
+):
+    stats_analyzer.models = ["MonteCarlo"]
+    stats_analyzer.model_MonteCarlo = SimpleNamespace(
+        simulate=lambda prices: SimpleNamespace(
+            band_max=prices[:, -1] * 1.1, band_min=prices[:, -1] * 0.9
+        )
+    )
+    Backtester(stats_analyzer, 50, 7, 8).run(klines_by_target)
+    assert evaluated["forecast_max"].shape == (1, len(TARGETS), 18)
+
+
+def test_undefined_metrics_are_none(stats_analyzer):
+    stats_analyzer.target_increase = 10.0
+    prices = np.tile(np.linspace(1.0, 2.0, N_BARS), (len(TARGETS), 1))
+    backtest = Backtester(stats_analyzer, 50, 7, 8)
+    cutoffs = backtest.get_cutoffs(N_BARS)
+    # Forecasts flat at the top of the window, no score is positive
+    forecast = prices[None, :, cutoffs - 1]
+    result = backtest.evaluate(
+        prices,
+        cutoffs,
+        forecast,
+        forecast,
+        pd.to_datetime(np.arange(N_BARS) * 86400000, unit="ms"),
+        TARGETS,
+    )
+    for metrics in result["metrics"].values():
+        assert metrics["n_positive_scores"] == 0
+        assert metrics["mean_forward_return_when_positive"] is None
+    json.dumps(result["metrics"], allow_nan=False)
@@ -0,0 +1,46 @@
+import numpy as np
+
+from utils.klines import Klines
+from utils.correlation import RollingCorrelation
+
+TARGETS = ["BTCUSDT", "ETHUSDT", "BNBUSDT"]
+INTERVAL_MS = 3600000
+
+
+def make_klines(closes: np.ndarray, first_open_time: int) -> Klines:
+    """
+    Make closed hourly klines of the close prices.
+    """
+    open_time = first_open_time + np.arange(len(closes), dtype=np.int64) * INTERVAL_MS
+    return Klines(
+        open_time=open_time,
+        open=closes,
+        high=closes,
+        low=closes,
+        close=closes,
+        volume=np.ones(len(closes)),
+        close_time=open_time + INTERVAL_MS - 1,
+        number_of_trades=np.ones(len(closes), dtype=np.int64),
+    )
+
+
+def test_overflow_of_a_partly_filled_window_matches_np_cov():
+    rng = np.random.default_rng(0)
+    n_bars, window_bars = 12, 10
+    closes = 100.0 * np.exp(
+        np.cumsum(rng.normal(scale=0.01, size=(n_bars, len(TARGETS))), axis=0)
+    )
+    correlation = RollingCorrelation(TARGETS, window_bars)
+    # 7 returns first, then 4 more overflowing the window of 10
+    for first, last in [(0, 8), (8, n_bars)]:
+        correlation.update(
+            {
+                target: make_klines(closes[first:last, idx], first * INTERVAL_MS)
+                for idx, target in enumerate(TARGETS)
+            }
+        )
+    returns = np.diff(np.log(closes), axis=0)[-window_bars:]
+    np.testing.assert_allclose(correlation.covariance(), np.cov(returns.T), atol=1e-12)
+    np.testing.assert_allclose(
+        correlation.correlation(), np.corrcoef(returns.T), atol=1e-9
+    )
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.forecast_store import ForecastStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ForecastStore(str(tmp_path / "forecasts.sqlite"), 8, 30)
+    yield store
+    store.close()
+
+
+def put(store: ForecastStore, target: str, days_ago: float) -> pd.Timestamp:
+    """
+    Put a forecast of a target made days ago.
+    """
+    forecast_time = pd.Timestamp.now().floor("s") - pd.Timedelta(days=days_ago)
+    store.put(target, forecast_time, {"ARIMA": np.arange(30.0)}, 29.0, 0.0)
+    return forecast_time
+
+
+def test_expired_forecasts_are_not_read(store):
+    put(store, "BTCUSDT", 40)
+    assert store.latest("BTCUSDT") is None
+    assert list(store.query_last_days("BTCUSDT", 60)) == []
+
+    forecast_time = put(store, "BTCUSDT", 1)
+    assert store.latest("BTCUSDT").forecast_time == forecast_time
+    assert [
+        stored.forecast_time for stored in store.query_last_days("BTCUSDT", 60)
+    ] == [forecast_time]
+
+
+def test_forecasts_of_targets_no_longer_written_are_evicted(store, tmp_path):
+    put(store, "ETHUSDT", 40)
+    put(store, "ETHUSDT", 20)
+    put(store, "BTCUSDT", 1)
+    assert store.evict() == 1
+
+    store.close()
+    # Evicted on open too, once the retention is shorter
+    reopened = ForecastStore(str(tmp_path / "forecasts.sqlite"), 8, 10)
+    assert reopened.latest("ETHUSDT") is None
+    assert reopened.latest("BTCUSDT") is not None
+    rows = reopened._connection.execute("SELECT COUNT(*) FROM forecasts").fetchone()
+    assert rows == (1,)
+    reopened.close()
@@ -0,0 +1,143 @@
+import json
+import time
+
+import pandas as pd
+import pytest
+
+import utils.binance_client as binance_client
+from utils.binance_client import BinanceClient
+from utils.replay_server import StreamReplayServer, get_fixture_path
+
+SYMBOL = "BTCUSDT"
+INTERVAL = "1m"
+INTERVAL_MS = 60000
+N_BARS = 120
+
+
+def make_raw_kline(open_time: int, close: float) -> list:
+    """
+    Make a raw kline of the klines endpoint.
+    """
+    return [
+        open_time,
+        f"{close - 1:.2f}",
+        f"{close + 2:.2f}",
+        f"{close - 2:.2f}",
+        f"{close:.2f}",
+        "10.0",
+        open_time + INTERVAL_MS - 1,
+        "1000.0",
+        5,
+        "5.0",
+        "500.0",
+        "0",
+    ]
+
+
+def wait_until(condition, timeout=10.0) -> None:
+    """
+    Wait until the condition holds.
+    """
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise TimeoutError("Condition not met in time.")
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def stream_server():
+    server = StreamReplayServer()
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch, stream_server):
+    last_open_time = (int(time.time() * 1000) // INTERVAL_MS - 1) * INTERVAL_MS
+    raw_klines = [
+        make_raw_kline(last_open_time - (N_BARS - 1 - idx) * INTERVAL_MS, 100.0 + idx)
+        for idx in range(N_BARS)
+    ]
+    with open(get_fixture_path(str(tmp_path), SYMBOL, INTERVAL), "w") as file:
+        json.dump(raw_klines, file)
+
+    config = {
+        **binance_client.get_analyzer_config(),
+        "interval": INTERVAL,
+        "duration_in_days": 30 / 1440,
+        "enable_kline_store": False,
+        "enable_kline_pyramid": False,
+        "enable_kline_stream": True,
+        "kline_stream_url": stream_server.url,
+        "kline_stream_intervals": [INTERVAL],
+        "kline_stream_buffer_size": 60,
+        "binance_backend": "replay",
+        "replay_fixture_dir": str(tmp_path),
+        "replay_max_request_weight_per_minute": 0,
+    }
+    monkeypatch.setattr(binance_client, "get_analyzer_config", lambda: config)
+    monkeypatch.setattr(binance_client, "load_yml", lambda path: [SYMBOL])
+    client = BinanceClient(None, None)
+    wait_until(client.kline_streamer.is_connected)
+    yield client
+    client.kline_streamer.stop()
+    client.replay_server.stop()
+
+
+@pytest.fixture
+def rest_calls(client, monkeypatch):
+    calls = []
+    get_historical_klines = client.client.get_historical_klines
+
+    def counted(*args, **kwargs):
+        calls.append(args)
+        return get_historical_klines(*args, **kwargs)
+
+    monkeypatch.setattr(client.client, "get_historical_klines", counted)
+    return calls
+
+
+def test_reads_are_served_from_the_stream(client, stream_server, rest_calls):
+    buffer = client.kline_streamer.buffers[(SYMBOL, INTERVAL)]
+    last_open_time = buffer.get_last_open_time()
+    stream_server.publish_kline(
+        SYMBOL, INTERVAL, make_raw_kline(last_open_time, 500.0), is_closed=True
+    )
+    stream_server.publish_kline(
+        SYMBOL, INTERVAL, make_raw_kline(last_open_time + INTERVAL_MS, 600.0)
+    )
+    wait_until(lambda: buffer.get_last_open_time() == last_open_time + INTERVAL_MS)
+
+    start = (pd.Timestamp.now() - pd.Timedelta(minutes=20)).strftime(
+        "%Y-%m-%d' %H:%M:%S"
+    )
+    klines = client.get_kline_data(SYMBOL, start, INTERVAL)
+    assert klines.open_time[-2:].tolist() == [
+        last_open_time,
+        last_open_time + INTERVAL_MS,
+    ]
+    assert klines.close[-2:].tolist() == [500.0, 600.0]
+    assert client.get_price(SYMBOL, start, INTERVAL)["Price"].iloc[-1] == 599.0
+    assert client.query([SYMBOL])[SYMBOL]["Price"].iloc[-1] == 599.0
+    assert rest_calls == []
+
+
+def test_buffers_are_reseeded_on_reconnection(client, stream_server, rest_calls):
+    buffer = client.kline_streamer.buffers[(SYMBOL, INTERVAL)]
+    stream_server.disconnect()
+    wait_until(
+        lambda: stream_server.n_connections == 2
+        and client.kline_streamer.is_connected()
+    )
+    # Caught up from REST since the buffer was last covered
+    assert [(call[0], call[1]) for call in rest_calls] == [(SYMBOL, INTERVAL)]
+
+    last_open_time = buffer.get_last_open_time()
+    stream_server.publish_kline(
+        SYMBOL, INTERVAL, make_raw_kline(last_open_time + INTERVAL_MS, 700.0)
+    )
+    wait_until(lambda: buffer.get_last_open_time() == last_open_time + INTERVAL_MS)
+    assert client.query([SYMBOL])[SYMBOL]["Price"].iloc[-1] == 699.0
+    assert len(rest_calls) == 1
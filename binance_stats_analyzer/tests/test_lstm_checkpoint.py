@@ -0,0 +1,95 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from darts import TimeSeries
+from darts.models.forecasting.rnn_model import RNNModel
+
+from utils.forecast_engine import ForecastJob, run_forecast_job
+
+TRAINING_LENGTH = 12
+N_NEW_BARS = 5
+
+
+@pytest.fixture
+def template() -> RNNModel:
+    """
+    Tiny LSTM configured like the LSTM of the statistical analyzer.
+    """
+    return RNNModel(
+        input_chunk_length=4,
+        training_length=TRAINING_LENGTH,
+        hidden_dim=4,
+        model="LSTM",
+        batch_size=8,
+        n_epochs=2,
+        random_state=0,
+        force_reset=True,
+        pl_trainer_kwargs={
+            "accelerator": "cpu",
+            "enable_progress_bar": False,
+            "enable_model_summary": False,
+            "logger": False,
+        },
+    )
+
+
+@pytest.fixture
+def time_series() -> TimeSeries:
+    values = np.sin(np.arange(80) / 5.0).astype(np.float32) + 1.0
+    return TimeSeries.from_times_and_values(
+        pd.date_range("2023-01-01", periods=len(values), freq="D"), values
+    )
+
+
+def make_job(template, entry, time_series) -> ForecastJob:
+    return ForecastJob(
+        target="BTCUSDT",
+        model_name="LSTM",
+        template=template,
+        entry=entry,
+        time_series=time_series,
+        full_refit_every_n_bars=90,
+        fine_tune_epochs=1,
+        fine_tune_context_bars=TRAINING_LENGTH,
+    )
+
+
+def get_weights(model: RNNModel) -> list:
+    return [param.detach().clone() for param in model.model.parameters()]
+
+
+def test_fitted_lstm_survives_pickle(template, time_series):
+    train_series = time_series[:-N_NEW_BARS]
+    entry = run_forecast_job(make_job(template, None, train_series))
+
+    restored = pickle.loads(pickle.dumps(entry))
+
+    for param, restored_param in zip(
+        get_weights(entry.model), get_weights(restored.model)
+    ):
+        assert torch.equal(param, restored_param)
+    np.testing.assert_array_equal(
+        restored.model.predict(n=30, series=train_series).values(),
+        entry.model.predict(n=30, series=train_series).values(),
+    )
+
+
+def test_restored_lstm_is_fine_tuned_on_new_bars(template, time_series):
+    entry = run_forecast_job(make_job(template, None, time_series[:-N_NEW_BARS]))
+    restored = pickle.loads(pickle.dumps(entry))
+    weights = get_weights(restored.model)
+
+    updated = run_forecast_job(make_job(template, restored, time_series))
+
+    assert updated.bars_since_fit == N_NEW_BARS
+    assert updated.last_time == time_series.end_time()
+    assert updated.forecast.shape[0] == 30
+    assert any(
+        not torch.equal(param, updated_param)
+        for param, updated_param in zip(weights, get_weights(updated.model))
+    )
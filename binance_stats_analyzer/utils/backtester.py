@@ -0,0 +1,348 @@
+import time
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+from numpy.lib.stride_tricks import sliding_window_view
+
+from utils.prepared_series import PreparedSeries
+from utils.forecast_engine import ForecastJob, run_forecast_job
+from utils.stats_analyzer import StatisticalAnalyzer, compute_stats_score
+from common_utils.logger import get_logger
+
+LOGGER = get_logger("statistical_analyzer/utils/backtester")
+
+# Number of bars forecasted at each cutoff
+HORIZON = 30
+
+
+def to_optional_float(value) -> float:
+    """
+    Convert a metric to a float, None when it is undefined (NaN or infinite),
+    e.g. the correlation of constant scores, so that it can be written as JSON.
+
+    Args:
+        value (float): Metric.
+    Returns:
+        Metric (float), None if undefined.
+    """
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+@dataclass
+class BacktestChain:
+    """
+    Consecutive cutoffs of a (target, model) forecasted by one worker, so
+    that the fitted model is carried from a cutoff to the next one.
+
+    Attributes:
+        target (str): Target cryptocurrency.
+        model_name (str): Name of the model.
+        template (darts.models.forecasting.forecasting_model.ForecastingModel): Untrained model to fit from.
+        time_index (pd.DatetimeIndex): Time of all the bars of the target.
+        prices (np.ndarray): Prices of all the bars of the target.
+        freq (str): Frequency of the series.
+        window_bars (int): Number of bars of the training window.
+        cutoffs (np.ndarray): Cutoffs, index of the first bar after the window.
+        full_refit_every_n_bars (int): Number of new bars before a global model is refitted.
+        order_search_every_n_bars (int): Number of new bars before the ARIMA order is searched again.
+        order_error_threshold (float): Relative increase of the in-sample error triggering an order search.
+        fine_tune_epochs (int): Epochs of fine-tuning a torch model on the new bars between full fits.
+        fine_tune_context_bars (int): Number of bars before the new bars included in the fine-tuning series.
+    """
+
+    target: str
+    model_name: str
+    template: object
+    time_index: pd.DatetimeIndex
+    prices: np.ndarray
+    freq: str
+    window_bars: int
+    cutoffs: np.ndarray
+    full_refit_every_n_bars: int
+    order_search_every_n_bars: int
+    order_error_threshold: float
+    fine_tune_epochs: int = 0
+    fine_tune_context_bars: int = 0
+
+
+def run_backtest_chain(chain: BacktestChain) -> np.ndarray:
+    """
+    Forecast the next bars at every cutoff of a chain.
+
+    Args:
+        chain (BacktestChain): Backtest chain.
+    Returns:
+        Forecasts in raw prices, shape (n_cutoffs, HORIZON) (np.ndarray).
+    """
+    entry, forecasts = None, []
+    normalize = chain.model_name == "LSTM"
+    for cutoff in chain.cutoffs:
+        start = cutoff - chain.window_bars
+        series = PreparedSeries(
+            chain.time_index[start:cutoff], chain.prices[start:cutoff], chain.freq
+        )
+        entry = run_forecast_job(
+            ForecastJob(
+                target=chain.target,
+                model_name=chain.model_name,
+                template=chain.template,
+                entry=entry,
+                time_series=series.get_time_series(normalize=normalize),
+                full_refit_every_n_bars=chain.full_refit_every_n_bars,
+                order_search_every_n_bars=chain.order_search_every_n_bars,
+                order_error_threshold=chain.order_error_threshold,
+                fine_tune_epochs=chain.fine_tune_epochs,
+                fine_tune_context_bars=chain.fine_tune_context_bars,
+            )
+        )
+        forecast = np.ravel(entry.forecast)[:HORIZON]
+        forecasts.append(series.denormalize(forecast) if normalize else forecast)
+    return np.stack(forecasts)
+
+
+class Backtester:
+    """
+    Rolling-origin backtester of the stats score.
+
+    The forecasts of each (target, model) are split into chains of
+    consecutive cutoffs which run in parallel. Within a chain, the models
+    are reused across cutoffs as they are across analysis cycles: global
+    models are only refitted every full_refit_every_n_bars bars and the
+    ARIMA order is cached. The Monte Carlo bands are simulated for all the
+    targets at once per cutoff instead. The score and the realized returns
+    are then computed for all the targets and cutoffs at once.
+
+    Attributes:
+        stats_analyzer (StatisticalAnalyzer): Statistical analyzer providing the models.
+        window_bars (int): Number of bars of the training window.
+        step_bars (int): Number of bars between consecutive cutoffs.
+        cutoffs_per_chain (int): Number of consecutive cutoffs forecasted by a worker.
+    """
+
+    def __init__(
+        self,
+        stats_analyzer: StatisticalAnalyzer,
+        window_bars: int,
+        step_bars: int,
+        cutoffs_per_chain: int,
+    ) -> None:
+        """
+        Initialize backtester.
+
+        Args:
+            stats_analyzer (StatisticalAnalyzer): Statistical analyzer providing the models.
+            window_bars (int): Number of bars of the training window.
+            step_bars (int): Number of bars between consecutive cutoffs.
+            cutoffs_per_chain (int): Number of consecutive cutoffs forecasted by a worker.
+        Returns:
+            None.
+        """
+        self.stats_analyzer = stats_analyzer
+        self.window_bars = window_bars
+        self.step_bars = step_bars
+        self.cutoffs_per_chain = cutoffs_per_chain
+
+    def get_cutoffs(self, n_bars: int) -> np.ndarray:
+        """
+        Get the cutoffs having a full window before and a full horizon after.
+
+        Args:
+            n_bars (int): Number of bars of the history.
+        Returns:
+            Cutoffs, index of the first bar after the window (np.ndarray).
+        """
+        return np.arange(self.window_bars, n_bars - HORIZON + 1, self.step_bars)
+
+    def _align(self, klines_by_target: dict) -> tuple:
+        """
+        Keep the bars opened at the times shared by all the targets.
+
+        Args:
+            klines_by_target (dict): Klines by target.
+        Returns:
+            Open times (np.ndarray) and prices of shape (n_targets, n_bars) (tuple).
+        """
+        open_time = None
+        for klines in klines_by_target.values():
+            open_time = (
+                klines.open_time
+                if open_time is None
+                else np.intersect1d(open_time, klines.open_time, assume_unique=True)
+            )
+        prices = np.stack(
+            [
+                klines.open[np.searchsorted(klines.open_time, open_time)]
+                for klines in klines_by_target.values()
+            ]
+        ).astype(np.float64)
+        return open_time, prices
+
+    def run(self, klines_by_target: dict, freq="1d") -> dict:
+        """
+        Run the backtest.
+
+        Args:
+            klines_by_target (dict): Klines by target.
+            freq (str): Frequency of the series.
+        Returns:
+            Cutoff times, scores, forward returns and metrics by target (dict).
+        """
+        targets = list(klines_by_target)
+        models = [
+            model for model in self.stats_analyzer.models if model != "MonteCarlo"
+        ]
+        open_time, prices = self._align(klines_by_target)
+        time_index = pd.to_datetime(open_time, unit="ms")
+        cutoffs = self.get_cutoffs(prices.shape[1])
+        if len(cutoffs) == 0:
+            raise ValueError(
+                f"{prices.shape[1]} shared bars cannot fit a window of {self.window_bars} bars and a horizon of {HORIZON} bars."
+            )
+
+        chains = [
+            BacktestChain(
+                target=target,
+                model_name=model,
+                template=getattr(self.stats_analyzer, f"model_{model}"),
+                time_index=time_index,
+                prices=prices[target_idx],
+                freq=freq,
+                window_bars=self.window_bars,
+                cutoffs=cutoffs[chain_start : chain_start + self.cutoffs_per_chain],
+                order_search_every_n_bars=self.stats_analyzer.order_search_every_n_bars,
+                order_error_threshold=self.stats_analyzer.order_error_threshold,
+                **self.stats_analyzer.get_refit_schedule(model),
+            )
+            for model in models
+            for target_idx, target in enumerate(targets)
+            for chain_start in range(0, len(cutoffs), self.cutoffs_per_chain)
+        ]
+        LOGGER.info(
+            f"Backtesting {len(targets)} targets x {len(models)} models x {len(cutoffs)} cutoffs in {len(chains)} chains..."
+        )
+        start_time = time.time()
+        if self.stats_analyzer.forecast_engine and chains:
+            results = self.stats_analyzer.forecast_engine.map(
+                run_backtest_chain, chains
+            )
+        else:
+            results = [run_backtest_chain(chain) for chain in chains]
+        LOGGER.info(f"Forecasted all cutoffs in {time.time() - start_time:.2f}s.")
+
+        # (n_models, n_targets, n_cutoffs, HORIZON), chains are ordered as above,
+        # the last chain of a (target, model) is shorter when the cutoffs do not
+        # split evenly
+        if chains:
+            forecasts = np.concatenate(results).reshape(
+                len(models), len(targets), len(cutoffs), HORIZON
+            )
+        else:
+            forecasts = np.empty((0, len(targets), len(cutoffs), HORIZON))
+        forecast_max, forecast_min = forecasts.max(axis=-1), forecasts.min(axis=-1)
+        if "MonteCarlo" in self.stats_analyzer.models:
+            band_max, band_min = self.simulate(prices, cutoffs)
+            forecast_max = np.concatenate([forecast_max, band_max[None]])
+            forecast_min = np.concatenate([forecast_min, band_min[None]])
+        return self.evaluate(
+            prices, cutoffs, forecast_max, forecast_min, time_index, targets
+        )
+
+    def simulate(self, prices: np.ndarray, cutoffs: np.ndarray) -> tuple:
+        """
+        Simulate the Monte Carlo bands of all the targets at every cutoff.
+
+        Args:
+            prices (np.ndarray): Prices, shape (n_targets, n_bars).
+            cutoffs (np.ndarray): Cutoffs, index of the first bar after the window.
+        Returns:
+            Expected max and min over the horizon, shape (n_targets, n_cutoffs) (tuple of np.ndarray).
+        """
+        start_time = time.time()
+        band_max = np.empty((len(prices), len(cutoffs)))
+        band_min = np.empty((len(prices), len(cutoffs)))
+        for cutoff_idx, cutoff in enumerate(cutoffs):
+            bands = self.stats_analyzer.model_MonteCarlo.simulate(
+                prices[:, cutoff - self.window_bars : cutoff]
+            )
+            band_max[:, cutoff_idx] = bands.band_max
+            band_min[:, cutoff_idx] = bands.band_min
+        LOGGER.info(
+            f"Simulated {len(cutoffs)} cutoffs by MonteCarlo in {time.time() - start_time:.2f}s."
+        )
+        return band_max, band_min
+
+    def evaluate(
+        self,
+        prices: np.ndarray,
+        cutoffs: np.ndarray,
+        forecast_max: np.ndarray,
+        forecast_min: np.ndarray,
+        time_index: pd.DatetimeIndex,
+        targets: list,
+    ) -> dict:
+        """
+        Compute the scores and the realized returns of all targets and cutoffs.
+
+        Args:
+            prices (np.ndarray): Prices, shape (n_targets, n_bars).
+            cutoffs (np.ndarray): Cutoffs, index of the first bar after the window.
+            forecast_max (np.ndarray): Forecast max over the horizon, shape (n_models, n_targets, n_cutoffs).
+            forecast_min (np.ndarray): Forecast min over the horizon, shape (n_models, n_targets, n_cutoffs).
+            time_index (pd.DatetimeIndex): Time of the bars.
+            targets (list): Targets.
+        Returns:
+            Cutoff times, scores, forward returns and metrics by target (dict).
+        """
+        # Range of the training window of every cutoff, (n_targets, n_cutoffs)
+        windows = sliding_window_view(prices, self.window_bars, axis=1)
+        windows = windows[:, cutoffs - self.window_bars]
+        window_max, window_min = windows.max(axis=-1), windows.min(axis=-1)
+        window_range = window_max - window_min
+
+        price_curr = prices[:, cutoffs - 1]
+        forecast_avg_max = forecast_max.mean(axis=0)
+        forecast_avg_min = forecast_min.mean(axis=0)
+        scores = compute_stats_score(
+            (price_curr - window_min) / window_range,
+            (forecast_avg_max - window_min) / window_range,
+            (forecast_avg_min - window_min) / window_range,
+            self.stats_analyzer.target_increase,
+        )
+
+        # Realized prices over the horizon, (n_targets, n_cutoffs, HORIZON)
+        future = prices[:, cutoffs[:, None] + np.arange(HORIZON)]
+        forward_return = future[..., -1] / price_curr - 1.0
+        max_return = future.max(axis=-1) / price_curr - 1.0
+
+        is_long = scores > 0
+        hit_rate = (np.sign(scores) == np.sign(forward_return)).mean(axis=1)
+        centered_scores = scores - scores.mean(axis=1, keepdims=True)
+        centered_returns = forward_return - forward_return.mean(axis=1, keepdims=True)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            correlation = (centered_scores * centered_returns).sum(axis=1) / np.sqrt(
+                (centered_scores**2).sum(axis=1) * (centered_returns**2).sum(axis=1)
+            )
+            long_return = np.where(is_long, forward_return, 0.0).sum(
+                axis=1
+            ) / is_long.sum(axis=1)
+        metrics = {
+            target: {
+                "hit_rate": to_optional_float(hit_rate[idx]),
+                "correlation": to_optional_float(correlation[idx]),
+                "mean_forward_return": to_optional_float(forward_return[idx].mean()),
+                "mean_forward_return_when_positive": to_optional_float(
+                    long_return[idx]
+                ),
+                "n_positive_scores": int(is_long[idx].sum()),
+            }
+            for idx, target in enumerate(targets)
+        }
+        return {
+            "cutoff_times": time_index[cutoffs - 1],
+            "targets": targets,
+            "scores": scores,
+            "forward_returns": forward_return,
+            "max_returns": max_return,
+            "metrics": metrics,
+        }
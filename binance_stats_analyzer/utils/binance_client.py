@@ -1,7 +1,16 @@
 import pandas as pd
-from binance.client import Client
+from concurrent.futures import ThreadPoolExecutor
+from binance.helpers import convert_ts_str, interval_to_milliseconds
 
 from utils.stats_analyzer import get_analyzer_config
+from utils.kline_store import KlineStore
+from utils.kline_pyramid import KlinePyramid
+from utils.kline_cache import KlineCache
+from utils.klines import Klines
+from utils.kline_stream import KlineStreamer
+from utils.replay_server import ReplayServer
+from common_utils.common import load_yml
+from utils.rate_limiter import RequestWeightLimiter, ThrottledClient
 from common_utils.logger import get_logger
 
 LOGGER = get_logger("statistical_analyzer/utils/binance_client")
@@ -12,9 +21,17 @@ class BinanceClient:
     Binance client for querying data from Binance.
 
     Attributes:
-        client (binance.client.Client): Binance client.
+        client (ThrottledClient): Binance client.
         interval (str): Interval of klines.
         duration_in_days (str): Duration of klines in days.
+        kline_store (KlineStore): Persistent kline store, None if disabled.
+        kline_pyramid (KlinePyramid): Multi-resolution klines, None if disabled.
+        max_points_per_plot (int): Maximum number of bars of a kline plot.
+        max_query_workers (int): Maximum number of targets queried in parallel.
+        kline_cache (KlineCache): In-process cache of the queried klines.
+        value_dtype (str): Dtype of the OHLCV fields of the klines.
+        kline_streamer (KlineStreamer): Streamed klines buffers, None if disabled.
+        replay_server (ReplayServer): Local replay of Binance, None if live.
     """
 
     def __init__(self, api_key: str, api_secret: str) -> None:
@@ -27,46 +44,136 @@ class BinanceClient:
         Returns:
             None.
         """
-        self.client = Client(api_key, api_secret)
         config = get_analyzer_config()
+        self.max_query_workers = config["max_query_workers"]
+        limiter = RequestWeightLimiter(config["max_request_weight_per_minute"])
+        self.replay_server = None
+        if config["binance_backend"] == "replay":
+            self.replay_server = ReplayServer(
+                config["replay_fixture_dir"],
+                port=config["replay_port"],
+                latency_in_ms=config["replay_latency_in_ms"],
+                max_weight_per_minute=config["replay_max_request_weight_per_minute"],
+                reject_every_n_requests=config["replay_reject_every_n_requests"],
+            )
+            self.replay_server.start()
+        self.client = ThrottledClient(
+            api_key,
+            api_secret,
+            limiter,
+            pool_maxsize=self.max_query_workers,
+            api_url=self.replay_server.url if self.replay_server else None,
+        )
         self.interval = config["interval"]
         self.duration_in_days = config["duration_in_days"]
+        self.value_dtype = config["kline_value_dtype"]
+        self.kline_store = None
+        if config["enable_kline_store"]:
+            self.kline_store = KlineStore(config["kline_store_dir"], self.value_dtype)
+        self.kline_pyramid = None
+        self.max_points_per_plot = config["max_points_per_plot"]
+        if config["enable_kline_pyramid"] and self.kline_store:
+            self.kline_pyramid = KlinePyramid(
+                self.kline_store, config["kline_pyramid_intervals"]
+            )
+            # The configured interval is the finest resolution of the analysis
+            self.interval = self.kline_pyramid.select_interval(
+                self.duration_in_days * 86400000,
+                config["max_points_per_series"],
+                min_interval=self.interval,
+            )
+            LOGGER.info(
+                f"Analyzing {self.duration_in_days} days at {self.interval} resolution."
+            )
+        self.kline_cache = KlineCache(
+            config["kline_cache_ttl_in_seconds"], config["kline_cache_max_size"]
+        )
+        self.kline_streamer = None
+        if config["enable_kline_stream"]:
+            self.kline_streamer = KlineStreamer(
+                config["kline_stream_url"],
+                load_yml("configs/slackbot/supported_cryptocurrencies.yml"),
+                config["kline_stream_intervals"],
+                config["kline_stream_buffer_size"],
+                self._get_historical_data,
+                self.value_dtype,
+            )
+            self.kline_streamer.start()
         LOGGER.info("Initialized Binance client...")
 
-    def _get_historical_data(
-        self, symbol: str, start: str, interval: str
-    ) -> pd.DataFrame:
+    def _get_historical_data(self, symbol: str, start, interval: str) -> Klines:
         """
         Get historical data from Binance.
 
         Args:
             symbol (str): Symbol of the cyrptocurrency on Binance.
-            start_str (str): Start time of the data.
+            start (str | int): Start time of the data, string or milliseconds.
+            interval (str): Interval of the data.
+        Returns:
+            Klines of the historical data (Klines).
+        """
+        if self.kline_pyramid and interval_to_milliseconds(interval):
+            return self.kline_pyramid.get(
+                self.client, symbol, interval, convert_ts_str(start)
+            )
+        if self.kline_store and interval_to_milliseconds(interval):
+            return self.kline_store.sync(
+                self.client, symbol, interval, convert_ts_str(start)
+            )
+        return Klines.from_raw(
+            self.client.get_historical_klines(symbol, interval, start),
+            self.value_dtype,
+        )
+
+    def get_kline_data(self, symbol: str, start: str, interval: str) -> Klines:
+        """
+        Get klines from the kline buffers or the kline cache, query Binance
+        on cache miss.
+
+        The returned klines are shared with the cache and must not be modified.
+
+        Args:
+            symbol (str): Symbol of the cyrptocurrency on Binance.
+            start (str): Start time of the data.
             interval (str): Interval of the data.
         Returns:
-            Dataframe of the historical data (pd.DataFrame).
-        """
-        dataframe = pd.DataFrame(
-            self.client.get_historical_klines(symbol, interval, start)
-        ).astype(float)
-        dataframe.columns = [
-            "OpenTime",
-            "Open",
-            "High",
-            "Low",
-            "Close",
-            "Volume",
-            "CloseTime",
-            "QuoteAssetVolume",
-            "NumberOfTrades",
-            "TakerBuyBaseAssetVolume",
-            "TakerBuyQuoteAssetVolume",
-            "Ignore",
-        ]
-        dataframe = dataframe.drop(columns="Ignore")
-        dataframe["OpenTime"] = pd.to_datetime(dataframe["OpenTime"], unit="ms")
-        dataframe["CloseTime"] = pd.to_datetime(dataframe["CloseTime"], unit="ms")
-        return dataframe
+            Klines of the historical data (Klines).
+        """
+        start_in_ms = convert_ts_str(start)
+        if self.kline_streamer:
+            klines = self.kline_streamer.get(symbol, interval, start_in_ms)
+            if klines is not None:
+                return klines
+        klines = self.kline_cache.get(symbol, interval, start_in_ms)
+        if klines is None:
+            klines = self._get_historical_data(symbol, start, interval)
+            self.kline_cache.put(symbol, interval, start_in_ms, klines)
+        return klines
+
+    def get_plot_interval(self, duration_in_hours: float, interval: str) -> str:
+        """
+        Get the interval of a kline plot, coarsened to a level of the kline
+        pyramid when the plot would exceed its point budget.
+
+        Args:
+            duration_in_hours (float): Duration of the plot in hours.
+            interval (str): Requested interval.
+        Returns:
+            Interval of the plot (str).
+        """
+        duration_in_ms = int(duration_in_hours * 3600000)
+        interval_ms = interval_to_milliseconds(interval)
+        if (
+            self.kline_pyramid is None
+            or not interval_ms
+            or duration_in_ms // interval_ms <= self.max_points_per_plot
+        ):
+            return interval
+        plot_interval = self.kline_pyramid.select_interval(
+            duration_in_ms, self.max_points_per_plot, min_interval=interval
+        )
+        LOGGER.info(f"Plotting {duration_in_hours} hours at {plot_interval}.")
+        return plot_interval
 
     def get_klines(self, symbol: str, start: str, interval: str) -> pd.DataFrame:
         """
@@ -79,11 +186,8 @@ class BinanceClient:
         Returns:
             Dataframe of the klines (pd.DataFrame).
         """
-        dataframe = self._get_historical_data(
-            symbol=symbol, start=start, interval=interval
-        )
-        dataframe = dataframe.set_index("OpenTime", drop=False)
-        return dataframe[["OpenTime", "Open", "High", "Low", "Close", "Volume"]]
+        klines = self.get_kline_data(symbol=symbol, start=start, interval=interval)
+        return klines.to_ohlcv_dataframe()
 
     def get_number_of_trade(
         self, symbol: str, start: str, interval: str
@@ -98,8 +202,8 @@ class BinanceClient:
         Returns:
             Dataframe of the number of trades (pd.DataFrame).
         """
-        dataframe = self._get_historical_data(symbol, start, interval)
-        return dataframe[["OpenTime", "NumberOfTrades"]]
+        klines = self.get_kline_data(symbol, start, interval)
+        return klines.to_number_of_trade_dataframe()
 
     def get_price(self, symbol: str, start: str, interval: str) -> pd.DataFrame:
         """
@@ -112,10 +216,27 @@ class BinanceClient:
         Returns:
             Dataframe of the price (pd.DataFrame).
         """
-        dataframe = self._get_historical_data(symbol, start, interval)
-        dataframe = dataframe[["OpenTime", "Open"]]
-        dataframe.columns = ["Time", "Price"]
-        return dataframe
+        klines = self.get_kline_data(symbol, start, interval)
+        return klines.to_price_dataframe()
+
+    def query_klines(self, targets: list, interval: str, start: str) -> dict:
+        """
+        Query klines of the targets in parallel.
+
+        Args:
+            targets (list): List of symbols of the cyrptocurrencies on Binance.
+            interval (str): Interval of the data.
+            start (str): Start time of the data.
+        Returns:
+            Klines of the list of cyrptocurrencies (dict).
+        """
+        targets = list(targets)
+        with ThreadPoolExecutor(max_workers=self.max_query_workers) as executor:
+            futures = [
+                executor.submit(self.get_kline_data, target, start, interval)
+                for target in targets
+            ]
+            return {target: future.result() for target, future in zip(targets, futures)}
 
     def query(self, targets: list) -> tuple:
         """
@@ -126,11 +247,9 @@ class BinanceClient:
         Returns:
             Dataframes of prices of the list of cyrptocurrencies (dict).
         """
-        price_dataframes = {}
         start = (
             pd.Timestamp.now() - pd.Timedelta(days=self.duration_in_days)
         ).strftime("%Y-%m-%d' %H:%M:%S")
         LOGGER.info(f"Querying data from Binance, {start=}, {targets=}...")
-        for target in targets:
-            price_dataframes[target] = self.get_price(target, start, self.interval)
-        return price_dataframes
+        klines = self.query_klines(targets, self.interval, start)
+        return {target: klines[target].to_price_dataframe() for target in klines}
@@ -0,0 +1,149 @@
+import time
+import numpy as np
+
+from common_utils.logger import get_logger
+
+LOGGER = get_logger("statistical_analyzer/utils/correlation")
+
+
+class RollingCorrelation:
+    """
+    Rolling correlation and covariance of the log returns of the targets.
+
+    The returns of the last window_bars bars shared by all the targets are
+    kept in one ring buffer of shape (window_bars, n_targets), along with
+    their sums and the sums of their cross products. New bars update the
+    sums by the cross products of the entering and leaving returns, so the
+    matrices are never computed again from the whole window.
+
+    Attributes:
+        targets (list): Targets, in the order of the rows and columns of the matrices.
+        window_bars (int): Number of returns in the window.
+        last_open_time (int): Open time of the last bar in milliseconds, None before the first update.
+    """
+
+    def __init__(self, targets: list, window_bars: int) -> None:
+        """
+        Initialize rolling correlation.
+
+        Args:
+            targets (list): Targets.
+            window_bars (int): Number of returns in the window, at least 2.
+        Returns:
+            None.
+        """
+        if window_bars < 2:
+            raise ValueError(
+                f"Window of {window_bars} returns is too short for a correlation."
+            )
+        self.targets = list(targets)
+        self.window_bars = window_bars
+        self.last_open_time = None
+        self._last_close = None
+        self._returns = np.zeros((window_bars, len(self.targets)))
+        self._position = 0
+        self._count = 0
+        self._sums = np.zeros(len(self.targets))
+        self._cross_sums = np.zeros((len(self.targets), len(self.targets)))
+
+    def __len__(self) -> int:
+        """
+        Get number of returns in the window.
+
+        Args:
+            None.
+        Returns:
+            Number of returns (int).
+        """
+        return self._count
+
+    def _align(self, klines_by_target: dict) -> tuple:
+        """
+        Keep the new closed bars opened at the times shared by all the targets.
+
+        Args:
+            klines_by_target (dict): Klines by target.
+        Returns:
+            Open times (np.ndarray) and close prices of shape (n_bars, n_targets) (tuple).
+        """
+        start = -1 if self.last_open_time is None else self.last_open_time
+        klines_list = [klines_by_target[target] for target in self.targets]
+        now = int(time.time() * 1000)
+        klines_list = [klines.since(start + 1) for klines in klines_list]
+        # The bar in progress would not be updated once its return is added
+        klines_list = [klines[klines.close_time < now] for klines in klines_list]
+        open_time = klines_list[0].open_time
+        for klines in klines_list[1:]:
+            open_time = np.intersect1d(open_time, klines.open_time, assume_unique=True)
+        closes = np.stack(
+            [
+                klines.close[np.searchsorted(klines.open_time, open_time)]
+                for klines in klines_list
+            ],
+            axis=1,
+        ).astype(np.float64)
+        return open_time, closes
+
+    def update(self, klines_by_target: dict) -> int:
+        """
+        Update the window with the bars after the last bar.
+
+        Args:
+            klines_by_target (dict): Klines by target, including all the targets.
+        Returns:
+            Number of new returns (int).
+        """
+        open_time, closes = self._align(klines_by_target)
+        if len(open_time) == 0:
+            return 0
+        if self._last_close is not None:
+            closes = np.vstack([self._last_close, closes])
+        returns = np.diff(np.log(closes), axis=0)
+        self.last_open_time = int(open_time[-1])
+        self._last_close = closes[-1]
+        # Only the returns which stay in the window are needed
+        returns = returns[-self.window_bars :]
+
+        n_returns = len(returns)
+        positions = (self._position + np.arange(n_returns)) % self.window_bars
+        n_leaving = max(self._count + n_returns - self.window_bars, 0)
+        # The empty slots are written first, the oldest returns are the last ones
+        leaving = self._returns[positions[n_returns - n_leaving :]]
+        self._sums += returns.sum(axis=0) - leaving.sum(axis=0)
+        self._cross_sums += returns.T @ returns - leaving.T @ leaving
+        self._returns[positions] = returns
+        self._position = (self._position + n_returns) % self.window_bars
+        self._count = min(self._count + n_returns, self.window_bars)
+        LOGGER.debug(
+            f"Updated rolling correlation by {n_returns} returns, {self._count} in window."
+        )
+        return n_returns
+
+    def covariance(self) -> np.ndarray:
+        """
+        Get the sample covariance matrix of the returns in the window.
+
+        Args:
+            None.
+        Returns:
+            Covariance of shape (n_targets, n_targets) (np.ndarray).
+        """
+        if self._count < 2:
+            return np.full_like(self._cross_sums, np.nan)
+        mean_outer = np.outer(self._sums, self._sums) / self._count
+        return (self._cross_sums - mean_outer) / (self._count - 1)
+
+    def correlation(self) -> np.ndarray:
+        """
+        Get the correlation matrix of the returns in the window.
+
+        Args:
+            None.
+        Returns:
+            Correlation of shape (n_targets, n_targets), NaN for flat targets (np.ndarray).
+        """
+        covariance = self.covariance()
+        std = np.sqrt(np.clip(np.diag(covariance), 0.0, None))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            correlation = covariance / np.outer(std, std)
+        return np.clip(correlation, -1.0, 1.0)
@@ -0,0 +1,523 @@
+import os
+import sys
+import time
+import signal
+import threading
+import contextlib
+import dataclasses
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+
+from common_utils.logger import get_logger
+
+# Keep this module free of numpy / darts imports at the top level, the thread
+# pools of BLAS, OpenMP (LightGBM) and torch are sized when those libraries
+# load, which should happen after the worker initializer has run.
+
+LOGGER = get_logger("statistical_analyzer/utils/forecast_engine")
+
+THREAD_ENV_VARS = [
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+]
+
+
+class ForecastTimeoutError(Exception):
+    """
+    Raised when a forecast job exceeds its time budget.
+    """
+
+
+@contextlib.contextmanager
+def _time_limit(seconds: float):
+    """
+    Raise ForecastTimeoutError in the block after seconds.
+
+    The alarm is only delivered to the main thread and between Python
+    bytecodes, so a long call into native code overruns until it returns.
+    Outside of the main thread the block runs without limit.
+
+    Args:
+        seconds (float): Time budget, 0 for none.
+    Returns:
+        None.
+    """
+    if not seconds or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def _raise_timeout(signum, frame):
+        raise ForecastTimeoutError(f"Exceeded the time budget of {seconds}s.")
+
+    previous_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+    # Keep raising until the block exits, libraries like pmdarima catch the
+    # errors of single fits and carry on
+    signal.setitimer(signal.ITIMER_REAL, seconds, 0.1)
+    try:
+        yield
+    finally:
+        # A repeated alarm must neither raise out of the clean up nor reach
+        # the previous handler, so it is blocked until the timer is disarmed
+        signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGALRM})
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+        if signal.SIGALRM in signal.sigpending():
+            signal.sigwait({signal.SIGALRM})
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGALRM})
+
+
+@dataclasses.dataclass
+class ForecastJob:
+    """
+    Fit or update a model of a target and forecast the next bars.
+
+    Attributes:
+        target (str): Target cryptocurrency.
+        model_name (str): Name of the model.
+        template (darts.models.forecasting.forecasting_model.ForecastingModel): Untrained model to fit from.
+        entry (ModelEntry): Registered model of the target, None if never fitted.
+        time_series (darts.TimeSeries | list): Time series of the price, one per target when targets is set.
+        full_refit_every_n_bars (int): Number of new bars before a global model is refitted.
+        order_search_every_n_bars (int): Number of new bars before the ARIMA order is searched again, 0 to always search.
+        order_error_threshold (float): Relative increase of the in-sample error triggering an order search.
+        targets (tuple): Targets of the series when one model is fitted across targets, None otherwise.
+        timeout_in_seconds (float): Time budget of the job, 0 for none.
+        fine_tune_epochs (int): Epochs of training a torch model on the new bars between full fits, 0 for none.
+        fine_tune_context_bars (int): Number of bars before the new bars included in the fine-tuning series.
+    """
+
+    target: str
+    model_name: str
+    template: object
+    entry: object
+    time_series: object
+    full_refit_every_n_bars: int
+    order_search_every_n_bars: int = 0
+    order_error_threshold: float = 0.0
+    targets: tuple = None
+    timeout_in_seconds: float = 0.0
+    fine_tune_epochs: int = 0
+    fine_tune_context_bars: int = 0
+
+    def get_end_time(self):
+        """
+        Get time of the last bar of the series.
+
+        Args:
+            None.
+        Returns:
+            Time of the last bar (pd.Timestamp), the latest across targets.
+        """
+        if self.targets:
+            return max(time_series.end_time() for time_series in self.time_series)
+        return self.time_series.end_time()
+
+    def is_up_to_date(self) -> bool:
+        """
+        Check if the registered model has seen the last bar of the series.
+
+        Args:
+            None.
+        Returns:
+            True if the registered forecast can be reused, False otherwise (bool).
+        """
+        return (
+            bool(self.entry)
+            and self.entry.last_time == self.get_end_time()
+            and self.entry.targets == self.targets
+        )
+
+
+def run_forecast_job(job: ForecastJob):
+    """
+    Run a forecast job, in a worker process or inline.
+
+    The model is only fitted when new bars have arrived. Global models
+    (e.g. LightGBM) are conditioned on the new bars without refitting
+    until full_refit_every_n_bars bars have arrived since the last fit,
+    torch models (e.g. LSTM) are fine-tuned on the new bars meanwhile.
+
+    Args:
+        job (ForecastJob): Forecast job.
+    Returns:
+        Updated model of the target (ModelEntry).
+    """
+    with _time_limit(job.timeout_in_seconds):
+        return _run_forecast_job(job)
+
+
+def _run_forecast_job(job: ForecastJob):
+    """
+    Run a forecast job without time budget.
+
+    Args:
+        job (ForecastJob): Forecast job.
+    Returns:
+        Updated model of the target (ModelEntry).
+    """
+    import pandas as pd
+    from darts.models.forecasting.auto_arima import AutoARIMA
+    from darts.models.forecasting.forecasting_model import GlobalForecastingModel
+    from utils.model_registry import ModelEntry
+
+    entry, time_series = job.entry, job.time_series
+    last_time = job.get_end_time()
+    if job.is_up_to_date():
+        LOGGER.info(f"No new bar since last fit, reused {job.model_name} forecast.")
+        return entry
+    if job.targets:
+        return _run_multi_series_job(job)
+
+    n_new_bars = int((time_series.time_index > entry.last_time).sum()) if entry else 0
+    if (
+        entry
+        and isinstance(entry.model, GlobalForecastingModel)
+        and entry.bars_since_fit + n_new_bars < job.full_refit_every_n_bars
+    ):
+        start_time = time.time()
+        if job.fine_tune_epochs and n_new_bars:
+            LOGGER.info(
+                f"Fine-tuning {job.model_name} of {job.target} on {n_new_bars} new bars for {job.fine_tune_epochs} epochs..."
+            )
+            entry.model.fit(
+                series=time_series[-(n_new_bars + job.fine_tune_context_bars) :],
+                epochs=job.fine_tune_epochs,
+            )
+        else:
+            LOGGER.info(
+                f"Updating {job.model_name} of {job.target} with {n_new_bars} new bars..."
+            )
+        fit_time_in_seconds = time.time() - start_time
+        entry = dataclasses.replace(
+            entry,
+            forecast=entry.model.predict(n=30, series=time_series).values(),
+            bars_since_fit=entry.bars_since_fit + n_new_bars,
+            fit_time_in_seconds=fit_time_in_seconds,
+        )
+    elif isinstance(job.template, AutoARIMA):
+        entry = _fit_arima(job, n_new_bars)
+    else:
+        LOGGER.info(f"Fitting {job.model_name} of {job.target}...")
+        start_time = time.time()
+        fitted_model = job.template.untrained_model()
+        fitted_model.fit(series=time_series)
+        fit_time_in_seconds = time.time() - start_time
+        entry = ModelEntry(
+            model=fitted_model,
+            last_time=last_time,
+            forecast=fitted_model.predict(n=30).values(),
+            fitted_at=pd.Timestamp.now(),
+            fit_time_in_seconds=fit_time_in_seconds,
+        )
+    entry.last_time = last_time
+    return entry
+
+
+def _run_multi_series_job(job: ForecastJob):
+    """
+    Fit or update one global model across the series of all targets, and
+    forecast all targets with one batched predict.
+
+    Args:
+        job (ForecastJob): Forecast job with one series per target.
+    Returns:
+        Updated model with one forecast row per target (ModelEntry).
+    """
+    import numpy as np
+    import pandas as pd
+    from utils.model_registry import ModelEntry
+
+    entry, series_list = job.entry, job.time_series
+    n_new_bars = (
+        max(int((ts.time_index > entry.last_time).sum()) for ts in series_list)
+        if entry
+        else 0
+    )
+    if entry and entry.bars_since_fit + n_new_bars < job.full_refit_every_n_bars:
+        LOGGER.info(
+            f"Updating {job.model_name} across {len(series_list)} targets with {n_new_bars} new bars..."
+        )
+        fitted_model, fitted_at = entry.model, entry.fitted_at
+        bars_since_fit = entry.bars_since_fit + n_new_bars
+        fit_time_in_seconds = 0.0
+    else:
+        LOGGER.info(f"Fitting {job.model_name} across {len(series_list)} targets...")
+        start_time = time.time()
+        fitted_model, fitted_at = job.template.untrained_model(), pd.Timestamp.now()
+        fitted_model.fit(series=series_list)
+        bars_since_fit = 0
+        fit_time_in_seconds = time.time() - start_time
+        LOGGER.info(
+            f"Fitted {job.model_name} across {len(series_list)} targets in {fit_time_in_seconds:.2f}s."
+        )
+    predictions = fitted_model.predict(n=30, series=series_list)
+    return ModelEntry(
+        model=fitted_model,
+        last_time=job.get_end_time(),
+        forecast=np.stack([prediction.values() for prediction in predictions]),
+        fitted_at=fitted_at,
+        bars_since_fit=bars_since_fit,
+        targets=job.targets,
+        fit_time_in_seconds=fit_time_in_seconds,
+    )
+
+
+def _get_in_sample_error(residuals, values, d: int) -> float:
+    """
+    Get the in-sample error of an ARIMA model relative to the price level.
+
+    Args:
+        residuals (np.ndarray): In-sample one-step residuals.
+        values (np.ndarray): Values of the fitted series.
+        d (int): Order of differencing, the first d residuals are skipped.
+    Returns:
+        Mean absolute residual over mean absolute value (float).
+    """
+    import numpy as np
+
+    residuals = np.abs(np.ravel(residuals)[d:])
+    return float(residuals.mean() / np.abs(np.ravel(values)).mean())
+
+
+def _fit_arima(job: ForecastJob, n_new_bars: int):
+    """
+    Fit an ARIMA model with the cached order, or search the order.
+
+    The order found by the stepwise search of AutoARIMA is reused for a
+    fixed-order ARIMA until order_search_every_n_bars bars have arrived, or
+    until its in-sample error drifts above the error at the last search by
+    more than order_error_threshold.
+
+    Args:
+        job (ForecastJob): Forecast job of an AutoARIMA model.
+        n_new_bars (int): Number of bars arrived since the last fit.
+    Returns:
+        Updated model of the target (ModelEntry).
+    """
+    import pandas as pd
+    from darts.models.forecasting.arima import ARIMA
+    from utils.model_registry import ModelEntry
+
+    entry, time_series = job.entry, job.time_series
+    refit_time_in_seconds = 0.0
+    if (
+        entry
+        and entry.order
+        and entry.bars_since_search + n_new_bars < job.order_search_every_n_bars
+    ):
+        start_time = time.time()
+        p, d, q, trend = entry.order
+        # Orders registered with a None trend had no intercept
+        fitted_model = ARIMA(p, d, q, trend=trend or "n")
+        fitted_model.fit(series=time_series)
+        refit_time_in_seconds = time.time() - start_time
+        error = _get_in_sample_error(
+            fitted_model.model.resid, time_series.values(copy=False), d
+        )
+        LOGGER.info(
+            f"Fitted ARIMA{entry.order[:3]} of {job.target} in {refit_time_in_seconds:.2f}s, order search took {entry.search_time_in_seconds:.2f}s."
+        )
+        if error <= entry.order_error * (1.0 + job.order_error_threshold):
+            return ModelEntry(
+                model=fitted_model,
+                last_time=time_series.end_time(),
+                forecast=fitted_model.predict(n=30).values(),
+                fitted_at=pd.Timestamp.now(),
+                order=entry.order,
+                order_error=entry.order_error,
+                bars_since_search=entry.bars_since_search + n_new_bars,
+                search_time_in_seconds=entry.search_time_in_seconds,
+                fit_time_in_seconds=refit_time_in_seconds,
+            )
+        LOGGER.info(
+            f"In-sample error of {job.target} drifted from {entry.order_error:.4f} to {error:.4f}, searching the order again."
+        )
+
+    start_time = time.time()
+    fitted_model = job.template.untrained_model()
+    fitted_model.fit(series=time_series)
+    search_time_in_seconds = time.time() - start_time
+    arima = fitted_model.model.model_
+    p, d, q = arima.order
+    # Same deterministic term as pmdarima: a constant without differencing,
+    # a drift with first order differencing. "n" as statsmodels adds a
+    # constant without differencing when the trend is None
+    trend = {0: "c", 1: "t"}.get(d, "n") if arima.with_intercept else "n"
+    LOGGER.info(
+        f"Searched ARIMA({p}, {d}, {q}) of {job.target} in {search_time_in_seconds:.2f}s."
+    )
+    return ModelEntry(
+        model=fitted_model,
+        last_time=time_series.end_time(),
+        forecast=fitted_model.predict(n=30).values(),
+        fitted_at=pd.Timestamp.now(),
+        order=(p, d, q, trend),
+        order_error=_get_in_sample_error(
+            arima.resid(), time_series.values(copy=False), d
+        ),
+        search_time_in_seconds=search_time_in_seconds,
+        # The refit with the cached order rejected before the search included
+        fit_time_in_seconds=refit_time_in_seconds + search_time_in_seconds,
+    )
+
+
+def _warm_up() -> None:
+    """
+    Import the forecasting libraries in a worker ahead of the first job.
+
+    Args:
+        None.
+    Returns:
+        None.
+    """
+    import darts.models  # noqa: F401
+
+
+def _init_worker(threads_per_worker: int) -> None:
+    """
+    Limit the threads of the numerical libraries in a worker process.
+
+    Args:
+        threads_per_worker (int): Number of threads per worker.
+    Returns:
+        None.
+    """
+    for env_var in THREAD_ENV_VARS:
+        os.environ[env_var] = str(threads_per_worker)
+    # The libraries may already be loaded by the re-imported main module
+    from threadpoolctl import threadpool_limits
+
+    threadpool_limits(limits=threads_per_worker)
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads_per_worker)
+
+
+class ForecastEngine:
+    """
+    Process pool running forecast jobs in parallel.
+
+    Workers are spawned (not forked) so that they start with fresh thread
+    pools sized by threads_per_worker, which keeps workers * threads within
+    the number of cores.
+
+    Attributes:
+        max_workers (int): Number of worker processes.
+        threads_per_worker (int): Number of threads per worker.
+    """
+
+    def __init__(self, max_workers=0, threads_per_worker=0) -> None:
+        """
+        Initialize forecast engine.
+
+        Args:
+            max_workers (int): Number of worker processes, 0 for the number of cores.
+            threads_per_worker (int): Number of threads per worker, 0 to share the cores evenly.
+        Returns:
+            None.
+        """
+        n_cores = os.cpu_count() or 1
+        self.max_workers = max_workers or n_cores
+        self.threads_per_worker = threads_per_worker or max(
+            1, n_cores // self.max_workers
+        )
+        self._executor = self._create_executor()
+        LOGGER.info(
+            f"Initialized forecast engine with {self.max_workers} workers x {self.threads_per_worker} threads."
+        )
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        """
+        Create the pool of worker processes.
+
+        Args:
+            None.
+        Returns:
+            Process pool (ProcessPoolExecutor).
+        """
+        executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.threads_per_worker,),
+        )
+        # Start all the workers now, so that the budget of the first analysis
+        # is not spent on importing darts
+        for _ in range(self.max_workers):
+            executor.submit(_warm_up)
+        return executor
+
+    def _restart(self) -> None:
+        """
+        Kill the worker processes, including the busy ones, and start a new pool.
+
+        Args:
+            None.
+        Returns:
+            None.
+        """
+        for process in list(self._executor._processes.values()):
+            process.terminate()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = self._create_executor()
+
+    def run(self, jobs: list, timeout_in_seconds=0.0) -> list:
+        """
+        Run forecast jobs in parallel.
+
+        The time budget of each job is enforced in the worker. When the jobs
+        are not all done within timeout_in_seconds, the workers are killed
+        and the unfinished jobs fail with ForecastTimeoutError.
+
+        Args:
+            jobs (list): Forecast jobs (ForecastJob).
+            timeout_in_seconds (float): Time budget of all the jobs, 0 for none.
+        Returns:
+            Updated models or the errors of the jobs, in the order of the jobs (list).
+        """
+        futures = [self._executor.submit(run_forecast_job, job) for job in jobs]
+        _, not_done = wait(futures, timeout=timeout_in_seconds or None)
+        if not_done:
+            LOGGER.warning(
+                f"{len(not_done)}/{len(jobs)} forecast jobs exceeded the budget of {timeout_in_seconds}s, restarting workers..."
+            )
+            self._restart()
+        results = []
+        for future in futures:
+            if future in not_done:
+                results.append(
+                    ForecastTimeoutError(
+                        f"Exceeded the analysis budget of {timeout_in_seconds}s."
+                    )
+                )
+            elif future.exception() is not None:
+                results.append(future.exception())
+            else:
+                results.append(future.result())
+        return results
+
+    def map(self, fn, tasks: list) -> list:
+        """
+        Run a picklable function over tasks in parallel, without time budget.
+
+        Args:
+            fn (callable): Module level function of a task.
+            tasks (list): Tasks.
+        Returns:
+            Results in the order of the tasks (list).
+        """
+        futures = [self._executor.submit(fn, task) for task in tasks]
+        return [future.result() for future in futures]
+
+    def shutdown(self) -> None:
+        """
+        Shut down the worker processes.
+
+        Args:
+            None.
+        Returns:
+            None.
+        """
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,308 @@
+import os
+import sqlite3
+import threading
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+from collections import OrderedDict
+
+from common_utils.logger import get_logger
+from common_utils.common import check_and_create_dir
+
+LOGGER = get_logger("statistical_analyzer/utils/forecast_store")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS forecasts (
+    target TEXT NOT NULL,
+    forecast_time INTEGER NOT NULL,
+    models TEXT NOT NULL,
+    horizon INTEGER NOT NULL,
+    avg_max REAL NOT NULL,
+    avg_min REAL NOT NULL,
+    forecast BLOB NOT NULL,
+    PRIMARY KEY (target, forecast_time)
+) WITHOUT ROWID
+"""
+
+
+def _to_ms(timestamp: pd.Timestamp) -> int:
+    """
+    Convert a timestamp to milliseconds since epoch.
+
+    Args:
+        timestamp (pd.Timestamp): Timestamp.
+    Returns:
+        Milliseconds since epoch (int).
+    """
+    return pd.Timestamp(timestamp).value // 1000000
+
+
+@dataclass
+class StoredForecast:
+    """
+    Forecast of a target made at the time of its last bar.
+
+    Attributes:
+        target (str): Target cryptocurrency.
+        forecast_time (pd.Timestamp): Time of the last bar seen by the models.
+        forecast (dict): Forecast of the price by model.
+        avg_max (float): Forecast max averaged over the models.
+        avg_min (float): Forecast min averaged over the models.
+    """
+
+    target: str
+    forecast_time: pd.Timestamp
+    forecast: dict
+    avg_max: float
+    avg_min: float
+
+    @staticmethod
+    def from_row(row: tuple):
+        """
+        Decode a row of the forecasts table.
+
+        Args:
+            row (tuple): Row of the forecasts table.
+        Returns:
+            StoredForecast.
+        """
+        target, forecast_time, models, horizon, avg_max, avg_min, blob = row
+        models = models.split(",")
+        values = np.frombuffer(blob, dtype=np.float32).reshape(len(models), horizon)
+        return StoredForecast(
+            target=target,
+            forecast_time=pd.to_datetime(forecast_time, unit="ms"),
+            forecast=dict(zip(models, values)),
+            avg_max=avg_max,
+            avg_min=avg_min,
+        )
+
+
+class ForecastStore:
+    """
+    Persistent store of the forecasts per (target, forecast time).
+
+    The forecasts are kept in a SQLite database as float32 blobs, one row per
+    analysis of a target, so that ranges of a target are read with the
+    primary key without loading the other targets. The latest forecast of
+    the most recently used targets is kept in an LRU cache. Forecasts older
+    than the retention are never read, and are evicted on write of their
+    target, on open and by evict().
+
+    Attributes:
+        path (str): Path of the database.
+        cache_size (int): Maximum number of targets in the LRU cache.
+        retention_in_days (float): Retention of the forecasts, 0 for forever.
+    """
+
+    def __init__(self, path: str, cache_size: int, retention_in_days: float) -> None:
+        """
+        Initialize forecast store.
+
+        Args:
+            path (str): Path of the database.
+            cache_size (int): Maximum number of targets in the LRU cache.
+            retention_in_days (float): Retention of the forecasts, 0 for forever.
+        Returns:
+            None.
+        """
+        self.path = path
+        self.cache_size = cache_size
+        self.retention_in_days = retention_in_days
+        self._latest = OrderedDict()
+        self._lock = threading.Lock()
+        check_and_create_dir(os.path.dirname(os.path.abspath(path)))
+        # Analyses and Slack commands are handled in different threads
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(SCHEMA)
+        LOGGER.info(f"Initialized forecast store at {path}.")
+        self.evict()
+
+    def _get_expire_before(self) -> int:
+        """
+        Get the time before which the forecasts are expired.
+
+        Args:
+            None.
+        Returns:
+            Time in milliseconds since epoch (int), None if kept forever.
+        """
+        if not self.retention_in_days:
+            return None
+        return _to_ms(pd.Timestamp.now() - pd.Timedelta(days=self.retention_in_days))
+
+    def _cache(self, stored: StoredForecast) -> None:
+        """
+        Put the latest forecast of a target into the LRU cache.
+
+        Args:
+            stored (StoredForecast): Latest forecast of the target.
+        Returns:
+            None.
+        """
+        self._latest[stored.target] = stored
+        self._latest.move_to_end(stored.target)
+        while len(self._latest) > self.cache_size:
+            self._latest.popitem(last=False)
+
+    def put(
+        self,
+        target: str,
+        forecast_time: pd.Timestamp,
+        forecast: dict,
+        avg_max: float,
+        avg_min: float,
+    ) -> None:
+        """
+        Put the forecast of a target, replacing the one of the same time.
+
+        Args:
+            target (str): Target cryptocurrency.
+            forecast_time (pd.Timestamp): Time of the last bar seen by the models.
+            forecast (dict): Forecast of the price by model.
+            avg_max (float): Forecast max averaged over the models.
+            avg_min (float): Forecast min averaged over the models.
+        Returns:
+            None.
+        """
+        values = np.stack(list(forecast.values())).astype(np.float32)
+        row = (
+            target,
+            _to_ms(forecast_time),
+            ",".join(forecast),
+            values.shape[1],
+            float(avg_max),
+            float(avg_min),
+            values.tobytes(),
+        )
+        stored = StoredForecast.from_row(row)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO forecasts VALUES (?, ?, ?, ?, ?, ?, ?)", row
+            )
+            if self.retention_in_days:
+                expire_before = _to_ms(
+                    pd.Timestamp(forecast_time)
+                    - pd.Timedelta(days=self.retention_in_days)
+                )
+                self._connection.execute(
+                    "DELETE FROM forecasts WHERE target = ? AND forecast_time < ?",
+                    (target, expire_before),
+                )
+            latest = self._latest.get(target)
+            if latest is None or latest.forecast_time <= stored.forecast_time:
+                self._cache(stored)
+
+    def latest(self, target: str) -> StoredForecast:
+        """
+        Get the latest forecast of a target.
+
+        Args:
+            target (str): Target cryptocurrency.
+        Returns:
+            Latest forecast of the target (StoredForecast), None if never forecasted or expired.
+        """
+        expire_before = self._get_expire_before() or 0
+        with self._lock:
+            if target in self._latest:
+                stored = self._latest[target]
+                if _to_ms(stored.forecast_time) >= expire_before:
+                    self._latest.move_to_end(target)
+                    return stored
+                # Anything older in the database is expired too
+                del self._latest[target]
+                return None
+            row = self._connection.execute(
+                "SELECT * FROM forecasts WHERE target = ? AND forecast_time >= ? "
+                "ORDER BY forecast_time DESC LIMIT 1",
+                (target, expire_before),
+            ).fetchone()
+            if row is None:
+                return None
+            stored = StoredForecast.from_row(row)
+            self._cache(stored)
+            return stored
+
+    def query(self, target: str, start: pd.Timestamp, end=None):
+        """
+        Iterate over the forecasts of a target in a time range, oldest first.
+
+        The rows are decoded one by one, the range is never loaded at once.
+        The expired forecasts are skipped.
+
+        Args:
+            target (str): Target cryptocurrency.
+            start (pd.Timestamp): Earliest forecast time, inclusive.
+            end (pd.Timestamp): Latest forecast time, inclusive, None for now.
+        Returns:
+            Forecasts of the target (Iterator[StoredForecast]).
+        """
+        end = pd.Timestamp.now() if end is None else end
+        start = max(_to_ms(start), self._get_expire_before() or 0)
+        with self._lock:
+            cursor = self._connection.execute(
+                "SELECT * FROM forecasts WHERE target = ? "
+                "AND forecast_time BETWEEN ? AND ? ORDER BY forecast_time",
+                (target, start, _to_ms(end)),
+            )
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(64)
+            if not rows:
+                return
+            for row in rows:
+                yield StoredForecast.from_row(row)
+
+    def query_last_days(self, target: str, days: float):
+        """
+        Iterate over the forecasts of a target in the last days, oldest first.
+
+        Args:
+            target (str): Target cryptocurrency.
+            days (float): Number of days.
+        Returns:
+            Forecasts of the target (Iterator[StoredForecast]).
+        """
+        return self.query(target, pd.Timestamp.now() - pd.Timedelta(days=days))
+
+    def evict(self) -> int:
+        """
+        Evict the forecasts of all targets older than the retention.
+
+        Args:
+            None.
+        Returns:
+            Number of evicted forecasts (int).
+        """
+        expire_before = self._get_expire_before()
+        if expire_before is None:
+            return 0
+        with self._lock, self._connection:
+            count = self._connection.execute(
+                "DELETE FROM forecasts WHERE forecast_time < ?", (expire_before,)
+            ).rowcount
+            for target in [
+                target
+                for target, stored in self._latest.items()
+                if _to_ms(stored.forecast_time) < expire_before
+            ]:
+                del self._latest[target]
+        if count:
+            LOGGER.info(
+                f"Evicted {count} forecasts older than {self.retention_in_days} days."
+            )
+        return count
+
+    def close(self) -> None:
+        """
+        Close the database.
+
+        Args:
+            None.
+        Returns:
+            None.
+        """
+        with self._lock:
+            self._connection.close()
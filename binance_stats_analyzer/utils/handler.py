@@ -1,8 +1,18 @@
 import pandas as pd
+from concurrent.futures import Future
+from binance.helpers import interval_to_milliseconds
 
-from utils.stats_analyzer import StatisticalAnalyzer
+from utils.stats_analyzer import (
+    StatisticalAnalyzer,
+    compute_stats_score,
+    get_analyzer_config,
+)
+from utils.prepared_series import PreparedSeries, get_freq
+from utils.technical_indicators import stack_prices
+from utils.correlation import RollingCorrelation
 from utils.binance_client import BinanceClient
-from utils.visualization import plot_klines, plot_price_prediction
+from utils.render_pool import RenderPool
+from utils.visualization import plot_klines, plot_price_prediction, plot_correlation
 from common_utils.logger import get_logger
 from common_utils.mqtt import Publisher, MQTTMessage
 
@@ -20,6 +30,7 @@ class Handler:
         binance_api: BinanceClient,
         stats_analyzer: StatisticalAnalyzer,
         publisher: Publisher,
+        render_pool: RenderPool,
     ) -> None:
         """
         Initialize Handler.
@@ -28,12 +39,19 @@ class Handler:
             binance_api (BinanceClient): Binance client.
             stats_analyzer (StatisticalAnalyzer): Statistical analyzer.
             publisher (Publisher): Publisher for publishing messages to MQTT.
+            render_pool (RenderPool): Process pool rendering the charts.
         Returns:
             None.
         """
         self.publisher = publisher
         self.binance_api = binance_api
         self.stats_analyzer = stats_analyzer
+        self.render_pool = render_pool
+        config = get_analyzer_config()
+        self.max_candles_per_plot = config["max_candles_per_plot"]
+        self.max_points_per_line = config["max_points_per_line"]
+        self.n_analyses = 0
+        self.correlations = {}
         LOGGER.info("Initialized Statistical Analyzer Handler.")
 
     def on_MQTTMessage(self, mqtt_message: MQTTMessage) -> None:
@@ -67,41 +85,110 @@ class Handler:
         mqtt_message = MQTTMessage.from_str("stats-analyzer-pub", message)
         self.publisher.publish(mqtt_message)
 
+    def post_render(self, render: Future) -> None:
+        """
+        Post a rendered chart, called by the render when it is done.
+
+        Args:
+            render (Future): Render resolving to the ID of the chart artifact.
+        Returns:
+            None.
+        """
+        if render.exception() is not None:
+            LOGGER.error(f"Failed to render chart: {render.exception()}")
+            return
+        message = str(
+            {"command": "post", "args": {"type": "png", "artifact_id": render.result()}}
+        )
+        self.publish_message(message)
+
     def analyze(self, target_scores: dict) -> None:
         """
         Analyze the scores of the targets.
 
+        The forecasters only run every forecast_every_n_analyses analyses,
+        the analyses in between score with the stored forecasts. Targets
+        never forecasted are forecasted in any analysis.
+
         Args:
             target_scores (dict): Scores of the targets.
         Returns:
             None.
         """
-        targets = target_scores.keys()
+        targets = list(target_scores)
+        if self.stats_analyzer.technical_scorer:
+            self.score_fast(target_scores)
+
         price_dfs = self.binance_api.query(targets)
-        for target in targets:
-            price_max, price_min = (
-                price_dfs[target]["Price"].max(),
-                price_dfs[target]["Price"].min(),
+        freq = get_freq(self.binance_api.interval)
+        prepared = {
+            target: PreparedSeries.prepare(price_df, freq)
+            for target, price_df in price_dfs.items()
+        }
+        forecast_store = self.stats_analyzer.forecast_store
+        # Also evicts the targets no longer analyzed
+        forecast_store.evict()
+        is_forecast_due = (
+            self.n_analyses % self.stats_analyzer.forecast_every_n_analyses == 0
+        )
+        self.n_analyses += 1
+        forecast_targets = [
+            target
+            for target in targets
+            if is_forecast_due or forecast_store.latest(target) is None
+        ]
+        forecasts, paths = {}, {}
+        if forecast_targets:
+            forecasts = self.stats_analyzer.forecast_prices(
+                {target: prepared[target] for target in forecast_targets}
             )
-            norm_price_curr = (price_dfs[target]["Price"].iloc[-1] - price_min) / (
-                price_max - price_min
+        for target in targets:
+            series = prepared[target]
+            norm_price_curr = float(series.normalized[-1])
+            if target in forecasts:
+                _, price_max_predicts, price_min_predicts = forecasts[target]
+                paths[target] = self.stats_analyzer.forecast_paths.get(target, {})
+            else:
+                stored = forecast_store.latest(target)
+                price_max_predicts, price_min_predicts = stored.avg_max, stored.avg_min
+                # Scored with the forecast of an earlier analysis
+                paths[target] = {model: "stored" for model in stored.forecast}
+            norm_price_max_predicts = series.normalize(price_max_predicts)
+            norm_price_min_predicts = series.normalize(price_min_predicts)
+            target_scores[target]["stats"] = float(
+                compute_stats_score(
+                    norm_price_curr,
+                    norm_price_max_predicts,
+                    norm_price_min_predicts,
+                    self.stats_analyzer.target_increase,
+                )
             )
-            (
-                _,
-                norm_price_max_predicts,
-                norm_price_min_predicts,
-            ) = self.stats_analyzer.forecast_price(target, price_dfs[target])
-            weighting = 100.0 / self.stats_analyzer.target_increase
-            score_prediction = (
-                norm_price_max_predicts
-                - min(norm_price_curr, norm_price_min_predicts)
-                - norm_price_curr
-                - norm_price_min_predicts
-            ) * weighting
-            target_scores[target]["stats"] = min(max(-1.0, score_prediction), 1.0)
-        message = str({"command": "log", "scores": target_scores})
+        message = str({"command": "log", "scores": target_scores, "paths": paths})
         self.publish_message(message)
 
+    def score_fast(self, target_scores: dict) -> None:
+        """
+        Score the targets with the technical indicators, all at once.
+
+        Args:
+            target_scores (dict): Scores of the targets.
+        Returns:
+            None.
+        """
+        interval = self.stats_analyzer.fast_stats_interval
+        n_bars = self.stats_analyzer.fast_stats_n_bars
+        start = pd.Timestamp.now() - pd.Timedelta(
+            milliseconds=n_bars * interval_to_milliseconds(interval)
+        )
+        klines = self.binance_api.query_klines(
+            target_scores, interval, start.strftime("%Y-%m-%d' %H:%M:%S")
+        )
+        targets = [target for target in target_scores if len(klines[target])]
+        prices = stack_prices([klines[target].close for target in targets], n_bars)
+        scores = self.stats_analyzer.technical_scorer.score(prices)["score"]
+        for target, score in zip(targets, scores):
+            target_scores[target]["stats_fast"] = float(score)
+
     def show_klines(self, command_args: dict):
         """
         Show klines of the target.
@@ -117,17 +204,20 @@ class Handler:
         start_str = (pd.Timestamp.now() - pd.Timedelta(hours=duration)).strftime(
             "%Y-%m-%d' %H:%M:%S"
         )
-        klines = self.binance_api.get_klines(
-            target, start_str, command_args["interval"]
+        interval = self.binance_api.get_plot_interval(
+            duration, command_args["interval"]
         )
-        plot_klines(klines, target, "/data")
-        message = str(
-            {
-                "command": "post",
-                "args": {"type": "png", "path": f"/data/{target}_klines.png"},
-            }
+        klines = self.binance_api.get_kline_data(target, start_str, interval)
+        last_open_time = int(klines.open_time[-1]) if len(klines) else None
+        render = self.render_pool.render(
+            ("klines", target, duration, interval, last_open_time),
+            f"{target}_klines.png",
+            plot_klines,
+            klines,
+            target,
+            max_candles=self.max_candles_per_plot,
         )
-        self.publish_message(message)
+        render.add_done_callback(self.post_render)
 
     def show_last_predict(self, command_args: dict):
         """
@@ -140,17 +230,111 @@ class Handler:
         """
         target = command_args["target"].upper()
         LOGGER.info(f"Visualizing the previous prediction")
+        interval = self.binance_api.interval
+        freq = get_freq(interval)
+        # The last 30 bars at the resolution of the analysis
+        start = pd.Timestamp.now() - pd.Timedelta(
+            milliseconds=30 * interval_to_milliseconds(interval)
+        )
         price_df = self.binance_api.get_price(
+            target, start.strftime("%Y-%m-%d' %H:%M:%S"), interval
+        )
+        stored = self.stats_analyzer.forecast_store.latest(target)
+        predictions = stored.forecast if stored else None
+        if predictions is None and self.stats_analyzer.enable_global_LightGBM:
+            predictions = self.stats_analyzer.predict_global(
+                target, self.binance_api.query([target])[target], freq
+            )
+        # A new forecast within the bar is a different chart
+        render = self.render_pool.render(
+            (
+                "prediction",
+                target,
+                interval,
+                str(price_df["Time"].iloc[-1]) if len(price_df) else None,
+                stored.forecast_time if stored else None,
+            ),
+            f"{target}_prediction.png",
+            plot_price_prediction,
+            price_df,
+            predictions,
             target,
-            (pd.Timestamp.now() - pd.Timedelta(days=30)).strftime("%Y-%m-%d' %H:%M:%S"),
-            "1d",
+            freq=freq,
+            max_points=self.max_points_per_line,
         )
-        predictions = self.stats_analyzer.forecast.get(target, None)
-        plot_price_prediction(price_df, predictions, target, "/data")
-        message = str(
-            {
-                "command": "post",
-                "args": {"type": "png", "path": f"/data/{target}_prediction.png"},
-            }
+        render.add_done_callback(self.post_render)
+
+    def get_correlation(
+        self, targets: list, duration: float, interval: str
+    ) -> RollingCorrelation:
+        """
+        Get the rolling correlation of the targets, updated with the bars
+        since its last update.
+
+        The rolling correlation of an interval is kept across the commands,
+        it is only built again when the targets or the window change.
+
+        Args:
+            targets (list): Targets.
+            duration (float): Number of hours of the window.
+            interval (str): Interval of the klines.
+        Returns:
+            Rolling correlation (RollingCorrelation).
+        """
+        interval_ms = interval_to_milliseconds(interval)
+        window_bars = int(duration * 3600000 // interval_ms)
+        correlation = self.correlations.get(interval)
+        if (
+            correlation is None
+            or correlation.targets != targets
+            or correlation.window_bars != window_bars
+        ):
+            correlation = RollingCorrelation(targets, window_bars)
+            self.correlations[interval] = correlation
+        # One more bar for the first return of the window
+        start = pd.Timestamp.now() - pd.Timedelta(
+            milliseconds=(window_bars + 1) * interval_ms
         )
-        self.publish_message(message)
+        if correlation.last_open_time is not None:
+            start = max(start, pd.to_datetime(correlation.last_open_time, unit="ms"))
+        klines = self.binance_api.query_klines(
+            targets, interval, start.strftime("%Y-%m-%d' %H:%M:%S")
+        )
+        n_returns = correlation.update(klines)
+        LOGGER.info(
+            f"Updated correlation of {len(targets)} targets by {n_returns} returns."
+        )
+        return correlation
+
+    def show_correlation(self, command_args: dict):
+        """
+        Show the correlation of the returns of the targets.
+
+        Args:
+            command_args (dict): Arguments of the command.
+        Returns:
+            None.
+        """
+        targets = [target.upper() for target in command_args["targets"]]
+        LOGGER.info(f"Visualizing correlation of {targets}...")
+        try:
+            correlation = self.get_correlation(
+                targets, float(command_args["duration"]), command_args["interval"]
+            )
+        except ValueError as err:
+            LOGGER.error(f"Failed to get correlation of {targets}: {err}")
+            return
+        render = self.render_pool.render(
+            (
+                "correlation",
+                tuple(targets),
+                correlation.window_bars,
+                command_args["interval"],
+                correlation.last_open_time,
+            ),
+            "correlation.png",
+            plot_correlation,
+            correlation.correlation(),
+            targets,
+        )
+        render.add_done_callback(self.post_render)
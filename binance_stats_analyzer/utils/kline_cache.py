@@ -0,0 +1,85 @@
+import time
+import threading
+from collections import OrderedDict
+
+from utils.klines import Klines
+from common_utils.logger import get_logger
+
+LOGGER = get_logger("statistical_analyzer/utils/kline_cache")
+
+
+class KlineCache:
+    """
+    In-process LRU cache of full klines with bounded lifetime.
+
+    Entries are keyed by (symbol, interval, start). A lookup is served by any
+    live entry of the same symbol and interval starting no later than the
+    requested start, so a long history also serves shorter requests. An entry
+    expires after the TTL or when its last bar closes, whichever is earlier.
+
+    Attributes:
+        ttl_in_seconds (float): Maximum lifetime of an entry.
+        max_size (int): Maximum number of entries.
+    """
+
+    def __init__(self, ttl_in_seconds: float, max_size: int) -> None:
+        """
+        Initialize kline cache.
+
+        Args:
+            ttl_in_seconds (float): Maximum lifetime of an entry.
+            max_size (int): Maximum number of entries.
+        Returns:
+            None.
+        """
+        self.ttl_in_seconds = ttl_in_seconds
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, symbol: str, interval: str, start: int) -> Klines:
+        """
+        Get the cached klines since start.
+
+        Args:
+            symbol (str): Symbol of the cyrptocurrency on Binance.
+            interval (str): Interval of the klines.
+            start (int): Start time in milliseconds.
+        Returns:
+            Klines (Klines), None if not cached.
+        """
+        now = time.time()
+        with self._lock:
+            for key, (expire_at, klines) in list(self._entries.items()):
+                if expire_at <= now:
+                    del self._entries[key]
+                    continue
+                entry_symbol, entry_interval, entry_start = key
+                if (entry_symbol, entry_interval) == (symbol, interval) and (
+                    entry_start <= start
+                ):
+                    self._entries.move_to_end(key)
+                    LOGGER.debug(f"Cache hit, {symbol=}, {interval=}, {start=}")
+                    return klines if entry_start == start else klines.since(start)
+        return None
+
+    def put(self, symbol: str, interval: str, start: int, klines: Klines) -> None:
+        """
+        Put klines into the cache.
+
+        Args:
+            symbol (str): Symbol of the cyrptocurrency on Binance.
+            interval (str): Interval of the klines.
+            start (int): Start time in milliseconds.
+            klines (Klines): Klines.
+        Returns:
+            None.
+        """
+        expire_at = time.time() + self.ttl_in_seconds
+        if len(klines):
+            expire_at = min(expire_at, klines.close_time[-1] / 1000.0)
+        with self._lock:
+            self._entries[(symbol, interval, start)] = (expire_at, klines)
+            self._entries.move_to_end((symbol, interval, start))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
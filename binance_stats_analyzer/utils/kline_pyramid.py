@@ -0,0 +1,101 @@
+import time
+from binance.client import Client
+from binance.helpers import interval_to_milliseconds
+
+from utils.klines import Klines
+from utils.kline_store import KlineStore
+from common_utils.logger import get_logger
+
+LOGGER = get_logger("statistical_analyzer/utils/kline_pyramid")
+
+# Number of the finest bars fetched at most to extend a coarser level, one
+# request of Binance; a level further behind is synced from Binance directly
+MAX_AGGREGATED_BARS = 1000
+
+
+class KlinePyramid:
+    """
+    Multi-resolution klines per symbol, e.g. 1m, 15m, 1h and 1d.
+
+    Every level is persisted in the kline store. The finest level follows
+    Binance bar by bar; a coarser level is backfilled from Binance once and
+    then extended by aggregating the finest bars closed since its last bar.
+    A long history is served at the finest level fitting a point budget.
+
+    Attributes:
+        kline_store (KlineStore): Persistent kline store of the levels.
+        intervals (list): Intervals of the levels, from the finest.
+    """
+
+    def __init__(self, kline_store: KlineStore, intervals: list) -> None:
+        """
+        Initialize kline pyramid.
+
+        Args:
+            kline_store (KlineStore): Persistent kline store of the levels.
+            intervals (list): Intervals of the levels, of fixed length (e.g. not 1M).
+        Returns:
+            None.
+        """
+        self.kline_store = kline_store
+        self.intervals = sorted(intervals, key=interval_to_milliseconds)
+        LOGGER.info(f"Initialized kline pyramid of {self.intervals}.")
+
+    def select_interval(
+        self, duration_in_ms: int, max_points: int, min_interval=None
+    ) -> str:
+        """
+        Select the finest level with at most max_points bars over a duration.
+
+        Args:
+            duration_in_ms (int): Duration of the series in milliseconds.
+            max_points (int): Maximum number of bars of the series.
+            min_interval (str): Finest interval allowed, None for any.
+        Returns:
+            Interval of the level (str), the coarsest if none fits.
+        """
+        min_interval_ms = interval_to_milliseconds(min_interval) if min_interval else 0
+        for interval in self.intervals:
+            interval_ms = interval_to_milliseconds(interval)
+            if interval_ms >= min_interval_ms and (
+                duration_in_ms // interval_ms <= max_points
+            ):
+                return interval
+        return self.intervals[-1]
+
+    def get(self, client: Client, symbol: str, interval: str, start: int) -> Klines:
+        """
+        Get the klines of a level since start, the bar in progress included.
+
+        Args:
+            client (binance.client.Client): Binance client.
+            symbol (str): Symbol of the cyrptocurrency on Binance.
+            interval (str): Interval of the level.
+            start (int): Start time in milliseconds.
+        Returns:
+            Klines since start (Klines).
+        """
+        base_interval = self.intervals[0]
+        if interval == base_interval or interval not in self.intervals:
+            return self.kline_store.sync(client, symbol, interval, start)
+
+        interval_ms = interval_to_milliseconds(interval)
+        stored = self.kline_store.load(symbol, interval)
+        if len(stored) == 0 or not self.kline_store.covers(symbol, interval, start):
+            return self.kline_store.sync(client, symbol, interval, start)
+        aggregate_from = int(stored.open_time[-1]) + interval_ms
+        base_interval_ms = interval_to_milliseconds(base_interval)
+        if (
+            time.time() * 1000 - aggregate_from
+        ) // base_interval_ms > MAX_AGGREGATED_BARS:
+            return self.kline_store.sync(client, symbol, interval, start)
+
+        base_klines = self.kline_store.sync(
+            client, symbol, base_interval, aggregate_from
+        )
+        aggregated = base_klines.aggregate(interval_ms)
+        stored = self.kline_store.extend(symbol, interval, aggregated)
+        LOGGER.debug(
+            f"Aggregated {len(base_klines)} {base_interval} bars of {symbol} into {len(aggregated)} {interval} bars."
+        )
+        return Klines.concat(stored, aggregated).since(start)
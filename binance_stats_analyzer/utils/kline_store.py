@@ -0,0 +1,342 @@
+import os
+import json
+import threading
+import numpy as np
+import pandas as pd
+from binance.client import Client
+from binance.helpers import interval_to_milliseconds
+
+from utils.klines import Klines, KLINE_FIELDS, get_field_dtype
+from common_utils.logger import get_logger
+from common_utils.common import check_and_create_dir
+
+LOGGER = get_logger("statistical_analyzer/utils/kline_store")
+
+
+def _now_in_ms() -> int:
+    """
+    Get current time in milliseconds since epoch.
+
+    Args:
+        None.
+    Returns:
+        Current time in milliseconds (int).
+    """
+    return int(pd.Timestamp.utcnow().timestamp() * 1000)
+
+
+def find_gaps(open_time: np.ndarray, interval_ms: int) -> list:
+    """
+    Find gaps in a sorted open time array.
+
+    Args:
+        open_time (np.ndarray): Sorted open times in milliseconds.
+        interval_ms (int): Interval of the klines in milliseconds.
+    Returns:
+        Missing ranges as (start, end) in milliseconds, both inclusive (list).
+    """
+    if len(open_time) < 2:
+        return []
+    diffs = np.diff(open_time)
+    gap_idx = np.nonzero(diffs > interval_ms)[0]
+    return [
+        (int(open_time[idx] + interval_ms), int(open_time[idx + 1] - 1))
+        for idx in gap_idx
+    ]
+
+
+class KlineStore:
+    """
+    Persistent store of klines per (symbol, interval).
+
+    Each field is kept in its own raw binary file so that it can be
+    memory-mapped and appended to without rewriting the history. Only closed
+    bars are persisted; the bar in progress is always fetched again.
+
+    Attributes:
+        root_dir (str): Root directory of the store.
+        value_dtype (str): Dtype of the OHLCV fields.
+    """
+
+    def __init__(self, root_dir: str, value_dtype="float64") -> None:
+        """
+        Initialize kline store.
+
+        Args:
+            root_dir (str): Root directory of the store.
+            value_dtype (str): Dtype of the OHLCV fields.
+        Returns:
+            None.
+        """
+        self.root_dir = root_dir
+        self.value_dtype = value_dtype
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        check_and_create_dir(root_dir)
+        LOGGER.info(f"Initialized kline store at {root_dir}.")
+
+    def _get_lock(self, symbol: str, interval: str) -> threading.Lock:
+        """
+        Get the lock of a (symbol, interval) series.
+
+        Args:
+            symbol (str): Symbol of the cyrptocurrency on Binance.
+            interval (str): Interval of the klines.
+        Returns:
+            Lock of the series (threading.Lock).
+        """
+        with self._locks_lock:
+            return self._locks.setdefault((symbol, interval), threading.Lock())
+
+    def _get_series_dir(self, symbol: str, interval: str) -> str:
+        """
+        Get the directory of a (symbol, interval) series.
+
+        Args:
+            symbol (str): Symbol of the cyrptocurrency on Binance.
+            interval (str): Interval of the klines.
+        Returns:
+            Directory of the series (str).
+        """
+        return f"{self.root_dir}/{symbol}_{interval}"
+
+    def _load_meta(self, series_dir: str) -> dict:
+        """
+        Load metadata of a series.
+
+        Args:
+            series_dir (str): Directory of the series.
+        Returns:
+            Metadata of the series (dict).
+        """
+        meta_path = f"{series_dir}/meta.json"
+        if not os.path.isfile(meta_path):
+            return {"covered_from": None, "known_gaps": []}
+        with open(meta_path, "r") as file:
+            return json.load(file)
+
+    def _save_meta(self, series_dir: str, meta: dict) -> None:
+        """
+        Save metadata of a series.
+
+        Args:
+            series_dir (str): Directory of the series.
+            meta (dict): Metadata of the series.
+        Returns:
+            None.
+        """
+        tmp_path = f"{series_dir}/meta.json.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(meta, file)
+        os.replace(tmp_path, f"{series_dir}/meta.json")
+
+    def _get_field_path(self, series_dir: str, field: str) -> str:
+        """
+        Get the file path of a field, the dtype is part of the file name.
+
+        Args:
+            series_dir (str): Directory of the series.
+            field (str): Name of the field.
+        Returns:
+            File path of the field (str).
+        """
+        dtype = get_field_dtype(field, self.value_dtype)
+        return f"{series_dir}/{field}.{dtype.name}.bin"
+
+    def load(self, symbol: str, interval: str) -> Klines:
+        """
+        Load the stored klines of a series as read-only memory maps.
+
+        Args:
+            symbol (str): Symbol of the cyrptocurrency on Binance.
+            interval (str): Interval of the klines.
+        Returns:
+            Stored klines (Klines).
+        """
+        series_dir = self._get_series_dir(symbol, interval)
+        columns = {}
+        for field in KLINE_FIELDS:
+            path = self._get_field_path(series_dir, field)
+            dtype = get_field_dtype(field, self.value_dtype)
+            if os.path.isfile(path) and os.path.getsize(path) > 0:
+                columns[field] = np.memmap(path, dtype=dtype, mode="r")
+            else:
+                columns[field] = np.empty(0, dtype=dtype)
+        # A crash during an append may leave fields of different lengths
+        length = min(len(values) for values in columns.values())
+        return Klines(**columns)[:length]
+
+    def _append(self, series_dir: str, klines: Klines, stored_length: int) -> None:
+        """
+        Append closed bars to the field files of a series.
+
+        Args:
+            series_dir (str): Directory of the series.
+            klines (Klines): Klines to be appended.
+            stored_length (int): Number of consistent bars already stored.
+        Returns:
+            None.
+        """
+        for field in KLINE_FIELDS:
+            dtype = get_field_dtype(field, self.value_dtype)
+            with open(self._get_field_path(series_dir, field), "ab") as file:
+                file.truncate(stored_length * dtype.itemsize)
+                values = np.ascontiguousarray(getattr(klines, field), dtype=dtype)
+                file.write(values.tobytes())
+
+    def _rewrite(self, series_dir: str, klines: Klines) -> None:
+        """
+        Rewrite the field files of a series.
+
+        Args:
+            series_dir (str): Directory of the series.
+            klines (Klines): Klines to be written.
+        Returns:
+            None.
+        """
+        for field in KLINE_FIELDS:
+            dtype = get_field_dtype(field, self.value_dtype)
+            path = self._get_field_path(series_dir, field)
+            np.ascontiguousarray(getattr(klines, field), dtype=dtype).tofile(
+                f"{path}.tmp"
+            )
+            os.replace(f"{path}.tmp", path)
+
+    def _fetch(
+        self, client: Client, symbol: str, interval: str, start: int, end=None
+    ) -> Klines:
+        """
+        Fetch klines from Binance.
+
+        Args:
+            client (binance.client.Client): Binance client.
+            symbol (str): Symbol of the cyrptocurrency on Binance.
+            interval (str): Interval of the klines.
+            start (int): Start time in milliseconds.
+            end (int): End time in milliseconds, None for now.
+        Returns:
+            Fetched klines (Klines).
+        """
+        LOGGER.debug(f"Fetching klines, {symbol=}, {interval=}, {start=}, {end=}")
+        return Klines.from_raw(
+            client.get_historical_klines(symbol, interval, start, end),
+            self.value_dtype,
+        )
+
+    def covers(self, symbol: str, interval: str, start: int) -> bool:
+        """
+        Check if the stored series covers the bars since start, i.e. no bar
+        before the first stored bar would be fetched by sync.
+
+        Args:
+            symbol (str): Symbol of the cyrptocurrency on Binance.
+            interval (str): Interval of the klines.
+            start (int): Start time in milliseconds.
+        Returns:
+            True if the series covers start, False otherwise (bool).
+        """
+        stored = self.load(symbol, interval)
+        if len(stored) == 0:
+            return False
+        meta = self._load_meta(self._get_series_dir(symbol, interval))
+        covered_from = meta["covered_from"]
+        return start >= stored.open_time[0] or (
+            covered_from is not None and start >= covered_from
+        )
+
+    def extend(self, symbol: str, interval: str, klines: Klines) -> Klines:
+        """
+        Append closed bars built locally, e.g. aggregated from finer bars, to
+        a stored series. Bars not after the last stored bar are ignored.
+
+        Args:
+            symbol (str): Symbol of the cyrptocurrency on Binance.
+            interval (str): Interval of the klines.
+            klines (Klines): Klines to be appended.
+        Returns:
+            Stored klines (Klines).
+        """
+        series_dir = self._get_series_dir(symbol, interval)
+        with self._get_lock(symbol, interval):
+            check_and_create_dir(series_dir)
+            stored = self.load(symbol, interval)
+            if len(stored):
+                klines = klines.since(int(stored.open_time[-1]) + 1)
+            closed_klines = klines[klines.close_time < _now_in_ms()]
+            if len(closed_klines) == 0:
+                return stored
+            self._append(series_dir, closed_klines, len(stored))
+            LOGGER.debug(
+                f"Extended kline store of {symbol} {interval} by {len(closed_klines)} bars."
+            )
+            return self.load(symbol, interval)
+
+    def sync(self, client: Client, symbol: str, interval: str, start: int) -> Klines:
+        """
+        Bring the stored series up to date and return the bars since start.
+
+        Only the bars missing from the store are fetched: the bars before the
+        first stored bar, the gaps between stored bars and the bars after the
+        last stored bar.
+
+        Args:
+            client (binance.client.Client): Binance client.
+            symbol (str): Symbol of the cyrptocurrency on Binance.
+            interval (str): Interval of the klines.
+            start (int): Start time in milliseconds.
+        Returns:
+            Klines since start (Klines).
+        """
+        interval_ms = interval_to_milliseconds(interval)
+        series_dir = self._get_series_dir(symbol, interval)
+        with self._get_lock(symbol, interval):
+            check_and_create_dir(series_dir)
+            meta = self._load_meta(series_dir)
+            stored = self.load(symbol, interval)
+            open_time = stored.open_time
+            if len(open_time) == 0:
+                fetched = [self._fetch(client, symbol, interval, start)]
+                meta["covered_from"] = start
+                is_append_only = True
+            else:
+                fetched, is_append_only = [], True
+                covered_from = meta["covered_from"]
+                if start < open_time[0] and (
+                    covered_from is None or start < covered_from
+                ):
+                    fetched.append(
+                        self._fetch(
+                            client, symbol, interval, start, int(open_time[0]) - 1
+                        )
+                    )
+                    meta["covered_from"] = start
+                    is_append_only = False
+                for gap in find_gaps(open_time, interval_ms):
+                    if list(gap) in meta["known_gaps"]:
+                        continue
+                    LOGGER.info(f"Backfilling gap of {symbol} {interval}: {gap}")
+                    backfill = self._fetch(client, symbol, interval, *gap)
+                    if len(backfill) == 0:
+                        # Genuine gap on Binance (e.g. maintenance), never refetch it
+                        meta["known_gaps"].append(list(gap))
+                    fetched.append(backfill)
+                    is_append_only = False
+                fetched.append(
+                    self._fetch(
+                        client, symbol, interval, int(open_time[-1]) + interval_ms
+                    )
+                )
+
+            new_klines = Klines.concat(*fetched)
+            closed_klines = new_klines[new_klines.close_time < _now_in_ms()]
+            if is_append_only:
+                self._append(series_dir, closed_klines, len(stored))
+            else:
+                self._rewrite(series_dir, Klines.concat(stored, closed_klines))
+            self._save_meta(series_dir, meta)
+            LOGGER.info(
+                f"Synced kline store of {symbol} {interval}, "
+                f"{len(stored)} stored, {len(new_klines)} fetched."
+            )
+            klines = Klines.concat(self.load(symbol, interval), new_klines)
+        return klines.since(start)
@@ -0,0 +1,376 @@
+import json
+import time
+import asyncio
+import threading
+import websockets
+import numpy as np
+from dataclasses import fields
+from binance.helpers import interval_to_milliseconds
+
+from utils.klines import Klines, KLINE_FIELDS, get_field_dtype
+from common_utils.logger import get_logger
+
+LOGGER = get_logger("statistical_analyzer/utils/kline_stream")
+
+
+class KlineRingBuffer:
+    """
+    Fixed-size ring buffer of the most recent klines of a series.
+
+    Attributes:
+        capacity (int): Maximum number of bars kept.
+        covered_from (int): Time in milliseconds since which no bar is missing.
+    """
+
+    def __init__(self, capacity: int, value_dtype="float64") -> None:
+        """
+        Initialize kline ring buffer.
+
+        Args:
+            capacity (int): Maximum number of bars kept.
+            value_dtype (str): Dtype of the OHLCV fields.
+        Returns:
+            None.
+        """
+        self.capacity = capacity
+        self.covered_from = None
+        self._arrays = {
+            field: np.zeros(capacity, dtype=get_field_dtype(field, value_dtype))
+            for field in KLINE_FIELDS
+        }
+        self._start, self._length = 0, 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """
+        Get number of bars in the buffer.
+
+        Args:
+            None.
+        Returns:
+            Number of bars (int).
+        """
+        return self._length
+
+    def _last_index(self) -> int:
+        """
+        Get the position of the latest bar in the arrays.
+
+        Args:
+            None.
+        Returns:
+            Position of the latest bar (int).
+        """
+        return (self._start + self._length - 1) % self.capacity
+
+    def _push(self, bar: dict) -> None:
+        """
+        Append a bar, the oldest bar is overwritten when the buffer is full.
+
+        Args:
+            bar (dict): Fields of the bar.
+        Returns:
+            None.
+        """
+        if self._length == self.capacity:
+            self._start = (self._start + 1) % self.capacity
+            self.covered_from = int(self._arrays["open_time"][self._start])
+        else:
+            self._length += 1
+        idx = self._last_index()
+        for field, value in bar.items():
+            self._arrays[field][idx] = value
+
+    def reset(self, klines: Klines, covered_from: int) -> None:
+        """
+        Replace the content of the buffer with the latest bars of klines.
+
+        Args:
+            klines (Klines): Klines to fill the buffer with.
+            covered_from (int): Time in milliseconds since which no bar is missing.
+        Returns:
+            None.
+        """
+        klines = klines[-self.capacity :]
+        with self._lock:
+            for field in KLINE_FIELDS:
+                self._arrays[field][: len(klines)] = getattr(klines, field)
+            self._start, self._length = 0, len(klines)
+            self.covered_from = covered_from
+            if len(klines) == self.capacity:
+                self.covered_from = int(klines.open_time[0])
+
+    def update(self, bar: dict) -> None:
+        """
+        Update the latest bar or append a new one.
+
+        Args:
+            bar (dict): Fields of the bar.
+        Returns:
+            None.
+        """
+        with self._lock:
+            if self._length == 0:
+                self._push(bar)
+                return
+            last_open_time = self._arrays["open_time"][self._last_index()]
+            if bar["open_time"] == last_open_time:
+                for field, value in bar.items():
+                    self._arrays[field][self._last_index()] = value
+            elif bar["open_time"] > last_open_time:
+                self._push(bar)
+
+    def get_last_open_time(self) -> int:
+        """
+        Get open time of the latest bar.
+
+        Args:
+            None.
+        Returns:
+            Open time in milliseconds (int), None if empty.
+        """
+        with self._lock:
+            if self._length == 0:
+                return None
+            return int(self._arrays["open_time"][self._last_index()])
+
+    def snapshot(self) -> Klines:
+        """
+        Copy the bars in the buffer in chronological order.
+
+        Args:
+            None.
+        Returns:
+            Klines.
+        """
+        with self._lock:
+            idx = (self._start + np.arange(self._length)) % self.capacity
+            return Klines(
+                **{
+                    field.name: self._arrays[field.name][idx]
+                    for field in fields(Klines)
+                }
+            )
+
+
+def _parse_kline_event(kline: dict) -> dict:
+    """
+    Parse the kline of a kline stream event.
+
+    Args:
+        kline (dict): Kline of the event ("k" of the payload).
+    Returns:
+        Fields of the bar (dict).
+    """
+    return {
+        "open_time": kline["t"],
+        "open": float(kline["o"]),
+        "high": float(kline["h"]),
+        "low": float(kline["l"]),
+        "close": float(kline["c"]),
+        "volume": float(kline["v"]),
+        "close_time": kline["T"],
+        "number_of_trades": kline["n"],
+    }
+
+
+class KlineStreamer:
+    """
+    Keep ring buffers of klines up to date with the Binance kline streams.
+
+    The buffers are seeded by REST on start and on every reconnection, so no
+    bar is missed while the connection is down.
+
+    Attributes:
+        url (str): Base URL of the websocket streams.
+        buffers (dict): Ring buffers keyed by (symbol, interval).
+    """
+
+    def __init__(
+        self,
+        url: str,
+        symbols: list,
+        intervals: list,
+        capacity: int,
+        seed_fn,
+        value_dtype="float64",
+    ) -> None:
+        """
+        Initialize kline streamer.
+
+        Args:
+            url (str): Base URL of the websocket streams.
+            symbols (list): Symbols of the cyrptocurrencies on Binance.
+            intervals (list): Intervals of the klines.
+            capacity (int): Number of bars kept per (symbol, interval).
+            seed_fn (callable): Function (symbol, start, interval) -> Klines.
+            value_dtype (str): Dtype of the OHLCV fields.
+        Returns:
+            None.
+        """
+        self.url = url.rstrip("/")
+        self.capacity = capacity
+        self.seed_fn = seed_fn
+        self.buffers = {
+            (symbol.upper(), interval): KlineRingBuffer(capacity, value_dtype)
+            for symbol in symbols
+            for interval in intervals
+        }
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._is_connected = False
+
+    def get_stream_url(self) -> str:
+        """
+        Get URL of the combined stream of all buffers.
+
+        Args:
+            None.
+        Returns:
+            URL of the combined stream (str).
+        """
+        streams = "/".join(
+            f"{symbol.lower()}@kline_{interval}" for symbol, interval in self.buffers
+        )
+        return f"{self.url}/stream?streams={streams}"
+
+    def get(self, symbol: str, interval: str, start: int) -> Klines:
+        """
+        Get the klines since start from the buffer.
+
+        Args:
+            symbol (str): Symbol of the cyrptocurrency on Binance.
+            interval (str): Interval of the klines.
+            start (int): Start time in milliseconds.
+        Returns:
+            Klines (Klines), None if the buffer does not cover start.
+        """
+        buffer = self.buffers.get((symbol, interval))
+        if buffer is None or len(buffer) == 0 or not self.is_connected():
+            return None
+        if buffer.covered_from is None or buffer.covered_from > start:
+            return None
+        return buffer.snapshot().since(start)
+
+    def seed(self) -> None:
+        """
+        Fill or catch up all buffers from REST.
+
+        Args:
+            None.
+        Returns:
+            None.
+        """
+        for (symbol, interval), buffer in self.buffers.items():
+            start = (
+                buffer.covered_from
+                if len(buffer)
+                else self._get_capacity_start(buffer, interval)
+            )
+            try:
+                klines = self.seed_fn(symbol, start, interval)
+            except Exception as err:
+                LOGGER.error(f"Failed to seed {symbol} {interval}: {err}")
+                continue
+            buffer.reset(klines, start)
+        LOGGER.info(f"Seeded {len(self.buffers)} kline buffers.")
+
+    def _get_capacity_start(self, buffer: KlineRingBuffer, interval: str) -> int:
+        """
+        Get the start time covering a full buffer until now.
+
+        Args:
+            buffer (KlineRingBuffer): Ring buffer.
+            interval (str): Interval of the klines.
+        Returns:
+            Start time in milliseconds (int).
+        """
+        interval_ms = interval_to_milliseconds(interval)
+        now = int(time.time() * 1000)
+        return (now // interval_ms - buffer.capacity + 1) * interval_ms
+
+    def on_message(self, message: str) -> None:
+        """
+        Update the buffer with a message of the combined stream.
+
+        Args:
+            message (str): Message of the combined stream.
+        Returns:
+            None.
+        """
+        payload = json.loads(message).get("data", {})
+        if payload.get("e") != "kline":
+            return
+        kline = payload["k"]
+        buffer = self.buffers.get((kline["s"], kline["i"]))
+        if buffer is not None:
+            buffer.update(_parse_kline_event(kline))
+
+    async def _consume(self) -> None:
+        """
+        Consume the combined stream, reconnect when the connection drops.
+
+        Args:
+            None.
+        Returns:
+            None.
+        """
+        backoff = 1.0
+        while not self._stop_event.is_set():
+            try:
+                async with websockets.connect(self.get_stream_url()) as websocket:
+                    LOGGER.info(f"Connected to kline streams at {self.url}.")
+                    # Catch up on the bars missed before the connection
+                    await asyncio.get_running_loop().run_in_executor(None, self.seed)
+                    self._is_connected, backoff = True, 1.0
+                    while not self._stop_event.is_set():
+                        try:
+                            message = await asyncio.wait_for(websocket.recv(), 1.0)
+                        except asyncio.TimeoutError:
+                            continue
+                        self.on_message(message)
+                self._is_connected = False
+            except Exception as err:
+                self._is_connected = False
+                LOGGER.error(f"Kline stream disconnected: {err}, retry in {backoff}s.")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60.0)
+
+    def start(self) -> None:
+        """
+        Start consuming the streams in a background thread.
+
+        Args:
+            None.
+        Returns:
+            None.
+        """
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=asyncio.run, args=(self._consume(),), daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop consuming the streams.
+
+        Args:
+            None.
+        Returns:
+            None.
+        """
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+
+    def is_connected(self) -> bool:
+        """
+        Check if the buffers are kept up to date by a live connection.
+
+        Args:
+            None.
+        Returns:
+            True if the streams are connected, False otherwise (bool).
+        """
+        return self._is_connected and bool(self._thread and self._thread.is_alive())
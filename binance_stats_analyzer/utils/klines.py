@@ -0,0 +1,256 @@
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass, fields
+
+# Fields of the raw klines from Binance kept at parse time, (index, kind)
+KLINE_FIELDS = {
+    "open_time": (0, "time"),
+    "open": (1, "value"),
+    "high": (2, "value"),
+    "low": (3, "value"),
+    "close": (4, "value"),
+    "volume": (5, "value"),
+    "close_time": (6, "time"),
+    "number_of_trades": (8, "count"),
+}
+
+
+def get_field_dtype(field: str, value_dtype="float64") -> np.dtype:
+    """
+    Get the dtype of a kline field.
+
+    Args:
+        field (str): Name of the field.
+        value_dtype (str): Dtype of the OHLCV fields.
+    Returns:
+        Dtype of the field (np.dtype).
+    """
+    kind = KLINE_FIELDS[field][1]
+    return np.dtype(value_dtype) if kind == "value" else np.dtype(np.int64)
+
+
+@dataclass
+class Klines:
+    """
+    Compact columnar klines.
+
+    Attributes:
+        open_time (np.ndarray): Open time in epoch milliseconds (int64).
+        open (np.ndarray): Open price.
+        high (np.ndarray): High price.
+        low (np.ndarray): Low price.
+        close (np.ndarray): Close price.
+        volume (np.ndarray): Volume.
+        close_time (np.ndarray): Close time in epoch milliseconds (int64).
+        number_of_trades (np.ndarray): Number of trades (int64).
+    """
+
+    open_time: np.ndarray
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+    close_time: np.ndarray
+    number_of_trades: np.ndarray
+
+    @staticmethod
+    def empty(value_dtype="float64"):
+        """
+        Create empty klines.
+
+        Args:
+            value_dtype (str): Dtype of the OHLCV fields.
+        Returns:
+            Klines.
+        """
+        return Klines(
+            **{
+                field: np.empty(0, dtype=get_field_dtype(field, value_dtype))
+                for field in KLINE_FIELDS
+            }
+        )
+
+    @staticmethod
+    def from_raw(raw_klines: list, value_dtype="float64"):
+        """
+        Parse raw klines from Binance, the unused fields are dropped.
+
+        Args:
+            raw_klines (list): Klines returned by Binance (list of lists).
+            value_dtype (str): Dtype of the OHLCV fields.
+        Returns:
+            Klines.
+        """
+        if not raw_klines:
+            return Klines.empty(value_dtype)
+        n_klines = len(raw_klines)
+        # Prices are sent as strings, parse the five columns in one go
+        values = np.array([row[1:6] for row in raw_klines], dtype=value_dtype).T
+        values = np.ascontiguousarray(values)
+        return Klines(
+            open_time=np.fromiter((row[0] for row in raw_klines), np.int64, n_klines),
+            open=values[0],
+            high=values[1],
+            low=values[2],
+            close=values[3],
+            volume=values[4],
+            close_time=np.fromiter((row[6] for row in raw_klines), np.int64, n_klines),
+            number_of_trades=np.fromiter(
+                (row[8] for row in raw_klines), np.int64, n_klines
+            ),
+        )
+
+    @staticmethod
+    def concat(*klines_list):
+        """
+        Concatenate klines, sort them by open time and drop duplicated bars.
+
+        The latest version of a duplicated bar is kept.
+
+        Args:
+            klines_list (Klines): Klines to be concatenated.
+        Returns:
+            Klines.
+        """
+        columns = {
+            field.name: np.concatenate([getattr(k, field.name) for k in klines_list])
+            for field in fields(Klines)
+        }
+        open_time = columns["open_time"][::-1]
+        _, idx = np.unique(open_time, return_index=True)
+        idx = len(open_time) - 1 - idx
+        return Klines(**{field: values[idx] for field, values in columns.items()})
+
+    def __len__(self) -> int:
+        """
+        Get number of bars.
+
+        Args:
+            None.
+        Returns:
+            Number of bars (int).
+        """
+        return len(self.open_time)
+
+    def __getitem__(self, key):
+        """
+        Select bars by slice, index array or mask.
+
+        Args:
+            key (slice | np.ndarray): Selection of the bars.
+        Returns:
+            Klines.
+        """
+        return Klines(
+            **{field.name: getattr(self, field.name)[key] for field in fields(Klines)}
+        )
+
+    def since(self, start: int):
+        """
+        Select the bars opened since start.
+
+        Args:
+            start (int): Start time in milliseconds.
+        Returns:
+            Klines.
+        """
+        return self[np.searchsorted(self.open_time, start) :]
+
+    def aggregate(self, interval_ms: int):
+        """
+        Aggregate the bars into bars of a coarser interval, aligned to epoch
+        like the bars of Binance (e.g. 1h, 1d).
+
+        Args:
+            interval_ms (int): Interval of the aggregated bars in milliseconds.
+        Returns:
+            Klines.
+        """
+        if len(self) == 0:
+            return self
+        bucket = self.open_time // interval_ms * interval_ms
+        starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+        ends = np.r_[starts[1:], len(self)] - 1
+        return Klines(
+            open_time=bucket[starts],
+            open=self.open[starts],
+            high=np.maximum.reduceat(self.high, starts),
+            low=np.minimum.reduceat(self.low, starts),
+            close=self.close[ends],
+            volume=np.add.reduceat(self.volume, starts),
+            close_time=bucket[starts] + interval_ms - 1,
+            number_of_trades=np.add.reduceat(self.number_of_trades, starts),
+        )
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Get memory used by the arrays.
+
+        Args:
+            None.
+        Returns:
+            Number of bytes (int).
+        """
+        return sum(getattr(self, field.name).nbytes for field in fields(Klines))
+
+    def get_open_datetime(self) -> pd.DatetimeIndex:
+        """
+        Get open time as datetime.
+
+        Args:
+            None.
+        Returns:
+            Open time (pd.DatetimeIndex).
+        """
+        return pd.to_datetime(self.open_time, unit="ms")
+
+    def to_price_dataframe(self) -> pd.DataFrame:
+        """
+        Convert to the price dataframe used by the forecasters.
+
+        Args:
+            None.
+        Returns:
+            Dataframe with columns Time and Price (pd.DataFrame).
+        """
+        return pd.DataFrame({"Time": self.get_open_datetime(), "Price": self.open})
+
+    def to_ohlcv_dataframe(self) -> pd.DataFrame:
+        """
+        Convert to the OHLCV dataframe used by the kline plot.
+
+        Args:
+            None.
+        Returns:
+            Dataframe indexed by open time (pd.DataFrame).
+        """
+        open_time = self.get_open_datetime()
+        return pd.DataFrame(
+            {
+                "OpenTime": open_time,
+                "Open": self.open,
+                "High": self.high,
+                "Low": self.low,
+                "Close": self.close,
+                "Volume": self.volume,
+            },
+            index=pd.Index(open_time, name="OpenTime"),
+        )
+
+    def to_number_of_trade_dataframe(self) -> pd.DataFrame:
+        """
+        Convert to the number of trades dataframe.
+
+        Args:
+            None.
+        Returns:
+            Dataframe with columns OpenTime and NumberOfTrades (pd.DataFrame).
+        """
+        return pd.DataFrame(
+            {
+                "OpenTime": self.get_open_datetime(),
+                "NumberOfTrades": self.number_of_trades,
+            }
+        )
@@ -0,0 +1,181 @@
+import io
+import os
+import sys
+import pickle
+import threading
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+
+from common_utils.logger import get_logger
+from common_utils.common import check_and_create_dir
+
+LOGGER = get_logger("statistical_analyzer/utils/model_registry")
+
+
+def is_torch_model(model) -> bool:
+    """
+    Check if a model is a darts torch model, without importing torch.
+
+    Args:
+        model (darts.models.forecasting.forecasting_model.ForecastingModel): Model.
+    Returns:
+        True if the model is a TorchForecastingModel, False otherwise (bool).
+    """
+    if "torch" not in sys.modules:
+        return False
+    from darts.models.forecasting.torch_forecasting_model import TorchForecastingModel
+
+    return isinstance(model, TorchForecastingModel)
+
+
+@dataclass
+class ModelEntry:
+    """
+    Fitted model of a target.
+
+    Attributes:
+        model (darts.models.forecasting.forecasting_model.ForecastingModel): Fitted model.
+        last_time (pd.Timestamp): Time of the last bar seen by the model.
+        forecast (np.ndarray): Latest forecast of the model.
+        fitted_at (pd.Timestamp): Time of the last full fit.
+        bars_since_fit (int): Number of bars arrived since the last full fit.
+        order (tuple): Selected ARIMA order (p, d, q, trend), None if not searched.
+        order_error (float): In-sample error of the model fitted by the order search.
+        bars_since_search (int): Number of bars arrived since the last order search.
+        search_time_in_seconds (float): Time taken by the last order search.
+        targets (tuple): Targets of the forecast rows of a model fitted across targets.
+        fit_time_in_seconds (float): Time taken by the fit calls of the last job, without predicting, 0 if only updated.
+    """
+
+    model: object
+    last_time: pd.Timestamp
+    forecast: np.ndarray
+    fitted_at: pd.Timestamp
+    bars_since_fit: int = 0
+    order: tuple = None
+    order_error: float = None
+    bars_since_search: int = 0
+    search_time_in_seconds: float = None
+    targets: tuple = None
+    fit_time_in_seconds: float = None
+
+    def __getstate__(self) -> dict:
+        """
+        Get the state to be pickled.
+
+        darts does not pickle the LightningModule of its torch models, the
+        module is checkpointed into the state so that the weights survive the
+        registry and the forecast worker processes.
+
+        Args:
+            None.
+        Returns:
+            State of the entry (dict).
+        """
+        state = dict(self.__dict__)
+        if is_torch_model(self.model) and self.model.model_created:
+            import torch
+
+            buffer = io.BytesIO()
+            torch.save(self.model.model, buffer)
+            state["checkpoint"] = buffer.getvalue()
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        """
+        Restore the pickled state, with the weights of torch models.
+
+        Args:
+            state (dict): State of the entry.
+        Returns:
+            None.
+        """
+        checkpoint = state.pop("checkpoint", None)
+        self.__dict__.update(state)
+        if checkpoint is not None:
+            import torch
+
+            self.model.model = torch.load(
+                io.BytesIO(checkpoint), map_location="cpu", weights_only=False
+            )
+
+
+class ModelRegistry:
+    """
+    Registry of fitted models per (target, model), persisted to disk.
+
+    Attributes:
+        model_dir (str): Directory of the persisted models.
+    """
+
+    def __init__(self, model_dir: str) -> None:
+        """
+        Initialize model registry.
+
+        Args:
+            model_dir (str): Directory of the persisted models.
+        Returns:
+            None.
+        """
+        self.model_dir = model_dir
+        self._entries = {}
+        self._lock = threading.Lock()
+        check_and_create_dir(model_dir)
+
+    def _get_path(self, target: str, model_name: str) -> str:
+        """
+        Get path of a persisted model.
+
+        Args:
+            target (str): Target cryptocurrency.
+            model_name (str): Name of the model.
+        Returns:
+            Path of the persisted model (str).
+        """
+        return f"{self.model_dir}/{target}/{model_name}.pkl"
+
+    def get(self, target: str, model_name: str) -> ModelEntry:
+        """
+        Get the fitted model of a target, loaded from disk if needed.
+
+        Args:
+            target (str): Target cryptocurrency.
+            model_name (str): Name of the model.
+        Returns:
+            Fitted model of the target (ModelEntry), None if never fitted.
+        """
+        with self._lock:
+            if (target, model_name) in self._entries:
+                return self._entries[(target, model_name)]
+            path = self._get_path(target, model_name)
+            if not os.path.isfile(path):
+                return None
+            try:
+                with open(path, "rb") as file:
+                    entry = pickle.load(file)
+            except Exception as err:
+                LOGGER.error(f"Failed to load {path}: {err}, ignored.")
+                return None
+            self._entries[(target, model_name)] = entry
+            LOGGER.info(f"Loaded {model_name} of {target} fitted at {entry.fitted_at}.")
+            return entry
+
+    def put(self, target: str, model_name: str, entry: ModelEntry) -> None:
+        """
+        Put the fitted model of a target and persist it.
+
+        Args:
+            target (str): Target cryptocurrency.
+            model_name (str): Name of the model.
+            entry (ModelEntry): Fitted model of the target.
+        Returns:
+            None.
+        """
+        path = self._get_path(target, model_name)
+        with self._lock:
+            self._entries[(target, model_name)] = entry
+            check_and_create_dir(os.path.dirname(path))
+            with open(f"{path}.tmp", "wb") as file:
+                pickle.dump(entry, file)
+            os.replace(f"{path}.tmp", path)
@@ -0,0 +1,138 @@
+import numpy as np
+from dataclasses import dataclass
+
+
+@dataclass
+class PriceBands:
+    """
+    Price bands of the targets simulated at once.
+
+    Attributes:
+        median (np.ndarray): Median price of each step, shape (n_targets, horizon).
+        band_max (np.ndarray): Expected max price over the horizon, shape (n_targets,).
+        band_min (np.ndarray): Expected min price over the horizon, shape (n_targets,).
+        prob_increase (np.ndarray): Probability of a higher price at the end of the horizon.
+        prob_target_increase (np.ndarray): Probability of reaching the targeted increase.
+        prob_target_decrease (np.ndarray): Probability of reaching the targeted decrease.
+    """
+
+    median: np.ndarray
+    band_max: np.ndarray
+    band_min: np.ndarray
+    prob_increase: np.ndarray
+    prob_target_increase: np.ndarray
+    prob_target_decrease: np.ndarray
+
+    def get(self, idx: int) -> dict:
+        """
+        Get the bands and probabilities of a target.
+
+        Args:
+            idx (int): Index of the target.
+        Returns:
+            Bands and probabilities of the target (dict of float).
+        """
+        return {
+            "band_max": float(self.band_max[idx]),
+            "band_min": float(self.band_min[idx]),
+            "prob_increase": float(self.prob_increase[idx]),
+            "prob_target_increase": float(self.prob_target_increase[idx]),
+            "prob_target_decrease": float(self.prob_target_decrease[idx]),
+        }
+
+
+class MonteCarloSimulator:
+    """
+    Monte Carlo forecaster of the price bands under a geometric random walk.
+
+    The drift and the volatility of the log returns are estimated from the
+    last window_bars bars of each target, then n_paths paths of every
+    target are simulated in one batch of shape (n_targets, horizon,
+    n_paths). The log prices are normal at every step, so the median path
+    is the drift alone.
+
+    Attributes:
+        n_paths (int): Number of simulated paths per target.
+        window_bars (int): Number of bars estimating the drift and the volatility.
+        target_increase (float): Targeted percentage price increase of the probabilities.
+        horizon (int): Number of simulated steps.
+    """
+
+    def __init__(
+        self,
+        n_paths: int,
+        window_bars: int,
+        target_increase: float,
+        horizon=30,
+        seed=None,
+    ) -> None:
+        """
+        Initialize Monte Carlo simulator.
+
+        Args:
+            n_paths (int): Number of simulated paths per target.
+            window_bars (int): Number of bars estimating the drift and the volatility.
+            target_increase (float): Targeted percentage price increase of the probabilities.
+            horizon (int): Number of simulated steps.
+            seed (int): Seed of the random generator, None for a random seed.
+        Returns:
+            None.
+        """
+        self.n_paths = n_paths
+        self.window_bars = window_bars
+        self.target_increase = target_increase
+        self.horizon = horizon
+        self._rng = np.random.default_rng(seed)
+
+    def estimate(self, prices_list: list) -> tuple:
+        """
+        Estimate the drift and the volatility of the log returns.
+
+        Args:
+            prices_list (list): Prices of each target (list of np.ndarray).
+        Returns:
+            Drift and volatility per bar of each target (tuple of np.ndarray).
+        """
+        # Shorter histories are padded with NaN and ignored by the estimates
+        log_returns = np.full((len(prices_list), self.window_bars), np.nan)
+        for idx, prices in enumerate(prices_list):
+            returns = np.diff(np.log(np.asarray(prices[-self.window_bars - 1 :])))
+            if len(returns):
+                log_returns[idx, -len(returns) :] = returns
+        with np.errstate(invalid="ignore"):
+            drift = np.nan_to_num(np.nanmean(log_returns, axis=1))
+            volatility = np.nan_to_num(np.nanstd(log_returns, axis=1))
+        return drift, volatility
+
+    def simulate(self, prices_list: list) -> PriceBands:
+        """
+        Simulate the price paths of all the targets at once.
+
+        Args:
+            prices_list (list): Prices of each target (list of np.ndarray).
+        Returns:
+            Price bands of the targets (PriceBands).
+        """
+        drift, volatility = self.estimate(prices_list)
+        price_curr = np.array([prices[-1] for prices in prices_list], np.float64)
+        shape = (len(prices_list), self.horizon, self.n_paths)
+
+        # Cumulated log returns, float32 and in place to bound the memory
+        paths = self._rng.standard_normal(shape, dtype=np.float32)
+        paths *= volatility[:, None, None].astype(np.float32)
+        paths += drift[:, None, None].astype(np.float32)
+        np.cumsum(paths, axis=1, out=paths)
+        np.exp(paths, out=paths)
+
+        path_max, path_min = paths.max(axis=1), paths.min(axis=1)
+        increase = 1.0 + self.target_increase / 100.0
+        decrease = 1.0 - self.target_increase / 100.0
+        steps = np.arange(1, self.horizon + 1)
+        return PriceBands(
+            median=price_curr[:, None] * np.exp(drift[:, None] * steps),
+            band_max=path_max.mean(axis=1) * price_curr,
+            band_min=path_min.mean(axis=1) * price_curr,
+            prob_increase=(paths[:, -1] > 1.0).mean(axis=1),
+            prob_target_increase=(path_max >= increase).mean(axis=1),
+            prob_target_decrease=(path_min <= decrease).mean(axis=1),
+        )
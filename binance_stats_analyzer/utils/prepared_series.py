@@ -0,0 +1,181 @@
+import numpy as np
+import pandas as pd
+from darts import TimeSeries
+
+from utils.klines import Klines
+
+# Units of the Binance kline intervals as pandas frequencies
+INTERVAL_UNIT_TO_FREQ = {"s": "s", "m": "min", "h": "h", "d": "D", "w": "W-MON"}
+
+
+def get_freq(interval: str) -> str:
+    """
+    Get the pandas frequency of a Binance kline interval.
+
+    Args:
+        interval (str): Interval of the klines, e.g. 15m, 1d.
+    Returns:
+        Frequency of the series (str).
+    """
+    if interval == "1M":
+        return "MS"
+    return f"{interval[:-1]}{INTERVAL_UNIT_TO_FREQ[interval[-1]]}"
+
+
+class PreparedSeries:
+    """
+    Price series of a target prepared once for all the forecasters.
+
+    The raw and min-max normalized prices are the two columns of one array,
+    the darts time series are built lazily from views of these columns.
+
+    Attributes:
+        time_index (pd.DatetimeIndex): Time of the bars.
+        values (np.ndarray): Raw and normalized prices, shape (n, 2).
+        price_max (float): Maximum of the raw prices.
+        price_min (float): Minimum of the raw prices.
+        freq (str): Frequency of the series.
+    """
+
+    def __init__(self, time_index: pd.DatetimeIndex, prices, freq="1d") -> None:
+        """
+        Initialize prepared series.
+
+        Args:
+            time_index (pd.DatetimeIndex): Time of the bars.
+            prices (np.ndarray): Raw prices.
+            freq (str): Frequency of the series.
+        Returns:
+            None.
+        """
+        self.time_index = time_index
+        self.freq = freq
+        prices = np.asarray(prices)
+        dtype = prices.dtype if prices.dtype.kind == "f" else np.float64
+        self.values = np.empty((len(prices), 2), dtype=dtype)
+        self.values[:, 0] = prices
+        self.price_max, self.price_min = float(prices.max()), float(prices.min())
+        np.subtract(self.values[:, 0], self.price_min, out=self.values[:, 1])
+        self.values[:, 1] /= self.price_max - self.price_min
+        self._time_series = {}
+
+    @staticmethod
+    def from_price_dataframe(price_df: pd.DataFrame, freq="1d"):
+        """
+        Prepare the series from a price dataframe, the dataframe is not modified.
+
+        Args:
+            price_df (pd.DataFrame): Dataframe with columns Time and Price.
+            freq (str): Frequency of the series.
+        Returns:
+            PreparedSeries.
+        """
+        return PreparedSeries(
+            pd.DatetimeIndex(price_df["Time"]), price_df["Price"].to_numpy(), freq
+        )
+
+    @staticmethod
+    def from_klines(klines: Klines, freq="1d"):
+        """
+        Prepare the series from the open prices of klines.
+
+        Args:
+            klines (Klines): Klines.
+            freq (str): Frequency of the series.
+        Returns:
+            PreparedSeries.
+        """
+        return PreparedSeries(klines.get_open_datetime(), klines.open, freq)
+
+    @staticmethod
+    def prepare(price_df, freq="1d"):
+        """
+        Prepare the series from klines or a price dataframe, if not prepared yet.
+
+        Args:
+            price_df (PreparedSeries | Klines | pd.DataFrame): Price of the target.
+            freq (str): Frequency of the series.
+        Returns:
+            PreparedSeries.
+        """
+        if isinstance(price_df, PreparedSeries):
+            return price_df
+        if isinstance(price_df, Klines):
+            return PreparedSeries.from_klines(price_df, freq)
+        return PreparedSeries.from_price_dataframe(price_df, freq)
+
+    def __len__(self) -> int:
+        """
+        Get number of bars.
+
+        Args:
+            None.
+        Returns:
+            Number of bars (int).
+        """
+        return len(self.values)
+
+    @property
+    def raw(self) -> np.ndarray:
+        """
+        Get the raw prices, a view of values.
+
+        Args:
+            None.
+        Returns:
+            Raw prices (np.ndarray).
+        """
+        return self.values[:, 0]
+
+    @property
+    def normalized(self) -> np.ndarray:
+        """
+        Get the normalized prices, a view of values.
+
+        Args:
+            None.
+        Returns:
+            Normalized prices (np.ndarray).
+        """
+        return self.values[:, 1]
+
+    def get_time_series(self, normalize=False) -> TimeSeries:
+        """
+        Get the darts time series, built once per view.
+
+        Args:
+            normalize (bool): Whether to use the normalized prices.
+        Returns:
+            Time series of the price (TimeSeries).
+        """
+        if normalize not in self._time_series:
+            column = 1 if normalize else 0
+            self._time_series[normalize] = TimeSeries.from_times_and_values(
+                self.time_index,
+                self.values[:, column : column + 1],
+                freq=self.freq,
+                columns=["Price"],
+            )
+        return self._time_series[normalize]
+
+    def normalize(self, prices):
+        """
+        Normalize prices with the range of the series.
+
+        Args:
+            prices (float | np.ndarray): Raw prices.
+        Returns:
+            Normalized prices (float | np.ndarray).
+        """
+        return (prices - self.price_min) / (self.price_max - self.price_min)
+
+    def denormalize(self, prices):
+        """
+        Revert the normalization of prices.
+
+        Args:
+            prices (float | np.ndarray): Normalized prices.
+        Returns:
+            Raw prices (float | np.ndarray).
+        """
+        return prices * (self.price_max - self.price_min) + self.price_min
@@ -0,0 +1,190 @@
+import time
+import threading
+from requests.adapters import HTTPAdapter
+from binance.client import Client
+
+from common_utils.logger import get_logger
+
+LOGGER = get_logger("statistical_analyzer/utils/rate_limiter")
+
+# Request weights of the endpoints in use, other endpoints are weighted 1
+REQUEST_WEIGHTS = {"klines": 2}
+USED_WEIGHT_HEADER = "x-mbx-used-weight-1m"
+
+
+class RequestWeightLimiter:
+    """
+    Thread-safe limiter of the request weight sent to Binance per minute.
+
+    The used weight is reserved locally before each request and corrected
+    with the used weight reported by Binance after each response.
+
+    Attributes:
+        max_weight (float): Maximum request weight to be used per minute.
+    """
+
+    def __init__(self, max_weight_per_minute: int, safety_ratio=0.8) -> None:
+        """
+        Initialize request weight limiter.
+
+        Args:
+            max_weight_per_minute (int): Request weight limit of Binance per minute.
+            safety_ratio (float): Ratio of the limit to be used at most.
+        Returns:
+            None.
+        """
+        self.max_weight = max_weight_per_minute * safety_ratio
+        self._condition = threading.Condition()
+        self._used_weight = 0
+        self._window = int(time.time() // 60)
+        self._blocked_until = 0.0
+
+    def _reset_window_if_expired(self) -> None:
+        """
+        Reset the used weight when a new minute starts.
+
+        Args:
+            None.
+        Returns:
+            None.
+        """
+        window = int(time.time() // 60)
+        if window != self._window:
+            self._window, self._used_weight = window, 0
+
+    def acquire(self, weight: int) -> None:
+        """
+        Block until the weight can be used without exceeding the limit.
+
+        Args:
+            weight (int): Weight of the request.
+        Returns:
+            None.
+        """
+        with self._condition:
+            while True:
+                now = time.time()
+                self._reset_window_if_expired()
+                if now < self._blocked_until:
+                    wait_time = self._blocked_until - now
+                elif self._used_weight + weight <= self.max_weight:
+                    self._used_weight += weight
+                    return
+                else:
+                    wait_time = (self._window + 1) * 60 - now
+                LOGGER.info(
+                    f"Request weight limit reached, waiting {wait_time:.1f}s..."
+                )
+                self._condition.wait(timeout=wait_time)
+
+    def update(self, headers: dict) -> None:
+        """
+        Update the used weight with the one reported by Binance.
+
+        Args:
+            headers (dict): Headers of the response.
+        Returns:
+            None.
+        """
+        used_weight = headers.get(USED_WEIGHT_HEADER)
+        if used_weight is None:
+            return
+        with self._condition:
+            self._reset_window_if_expired()
+            self._used_weight = max(self._used_weight, int(used_weight))
+
+    def block(self, retry_after: float) -> None:
+        """
+        Block all requests for a period, used when Binance rejects a request.
+
+        Args:
+            retry_after (float): Period to block in seconds.
+        Returns:
+            None.
+        """
+        with self._condition:
+            self._blocked_until = max(self._blocked_until, time.time() + retry_after)
+
+
+class ThrottledClient(Client):
+    """
+    Binance client sharing a request weight limiter between threads.
+
+    Attributes:
+        limiter (RequestWeightLimiter): Request weight limiter.
+        max_retries (int): Maximum number of retries on rejected requests.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        api_secret: str,
+        limiter: RequestWeightLimiter,
+        pool_maxsize=10,
+        max_retries=3,
+        api_url=None,
+    ) -> None:
+        """
+        Initialize throttled Binance client.
+
+        Args:
+            api_key (str): API key of Binance.
+            api_secret (str): API secret of Binance.
+            limiter (RequestWeightLimiter): Request weight limiter.
+            pool_maxsize (int): Maximum number of pooled connections.
+            max_retries (int): Maximum number of retries on rejected requests.
+            api_url (str): Base URL of the REST API, None for Binance.
+        Returns:
+            None.
+        """
+        if api_url:
+            self.API_URL = api_url
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self._pool_maxsize = pool_maxsize
+        super().__init__(api_key, api_secret)
+
+    def _init_session(self):
+        """
+        Initialize the HTTP session with a connection pool for every worker.
+
+        Args:
+            None.
+        Returns:
+            Session (requests.Session).
+        """
+        session = super()._init_session()
+        adapter = HTTPAdapter(pool_maxsize=self._pool_maxsize)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def _request(self, method, uri: str, signed: bool, force_params=False, **kwargs):
+        """
+        Send a request once the limiter allows it, retry if it is rejected.
+
+        Args:
+            method (str): HTTP method.
+            uri (str): URI of the request.
+            signed (bool): Whether the request is signed.
+            force_params (bool): Whether to force the data as params.
+            kwargs (dict): Arguments of the request.
+        Returns:
+            Content of the response (dict).
+        """
+        weight = REQUEST_WEIGHTS.get(uri.rstrip("/").rsplit("/", 1)[-1], 1)
+        kwargs = self._get_request_kwargs(method, signed, force_params, **kwargs)
+        for retry in range(self.max_retries + 1):
+            self.limiter.acquire(weight)
+            response = getattr(self.session, method)(uri, **kwargs)
+            self.limiter.update(response.headers)
+            if response.status_code not in (418, 429) or retry == self.max_retries:
+                break
+            retry_after = float(response.headers.get("Retry-After", 60))
+            LOGGER.warning(
+                f"Request rejected with {response.status_code}, retry after {retry_after}s."
+            )
+            self.limiter.block(retry_after)
+        # The response is kept per client only for compatibility
+        self.response = response
+        return self._handle_response(response)
@@ -0,0 +1,183 @@
+import shutil
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from common_utils.logger import get_logger
+from common_utils.artifact_store import ArtifactStore
+
+LOGGER = get_logger("statistical_analyzer/utils/render_pool")
+
+
+def _init_worker() -> None:
+    """
+    Select the Agg backend and import the plotting libraries in a worker
+    ahead of the first render.
+
+    Args:
+        None.
+    Returns:
+        None.
+    """
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import utils.visualization  # noqa: F401
+
+
+def _warm_up() -> None:
+    """
+    Start a worker, the initializer does the work.
+
+    Args:
+        None.
+    Returns:
+        None.
+    """
+
+
+def _render(
+    artifact_store: ArtifactStore,
+    plot_fn,
+    filename: str,
+    args: tuple,
+    kwargs: dict,
+) -> str:
+    """
+    Render a chart in a worker and store it as an artifact.
+
+    Args:
+        artifact_store (ArtifactStore): Store of the rendered charts.
+        plot_fn (callable): Plotting function of utils/visualization.py.
+        filename (str): Filename of the chart saved by plot_fn.
+        args (tuple): Positional arguments of plot_fn, before output_dir.
+        kwargs (dict): Keyword arguments of plot_fn.
+    Returns:
+        ID of the chart artifact (str).
+    """
+    output_dir = artifact_store.make_temp_dir()
+    try:
+        plot_fn(*args, output_dir=output_dir, **kwargs)
+        return artifact_store.put(f"{output_dir}/{filename}")
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+class RenderPool:
+    """
+    Process pool rendering the charts off the MQTT thread, with a cache of
+    the rendered charts.
+
+    A chart is cached by a key describing its data, e.g. the target, the
+    duration, the interval and the time of the last bar, so that the same
+    request within a bar returns the chart already rendered, or being
+    rendered, without rendering it again. The charts are kept in the
+    artifact store, a cached chart deleted by its garbage collection is
+    rendered again.
+
+    Attributes:
+        max_workers (int): Number of worker processes.
+        cache_size (int): Maximum number of cached charts.
+        artifact_store (ArtifactStore): Store of the rendered charts.
+    """
+
+    def __init__(
+        self, max_workers: int, cache_size: int, artifact_store: ArtifactStore
+    ) -> None:
+        """
+        Initialize render pool.
+
+        Args:
+            max_workers (int): Number of worker processes.
+            cache_size (int): Maximum number of cached charts.
+            artifact_store (ArtifactStore): Store of the rendered charts.
+        Returns:
+            None.
+        """
+        self.max_workers = max_workers
+        self.cache_size = cache_size
+        self.artifact_store = artifact_store
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+        # Start all the workers now, so that the first chart does not wait for matplotlib
+        for _ in range(max_workers):
+            self._executor.submit(_warm_up)
+        LOGGER.info(f"Initialized render pool with {max_workers} workers.")
+
+    def _is_available(self, future: Future) -> bool:
+        """
+        Check if a cached render is still usable.
+
+        Args:
+            future (Future): Render of the chart.
+        Returns:
+            True if rendering or rendered and still stored, False otherwise (bool).
+        """
+        if not future.done():
+            return True
+        if future.exception() is not None:
+            return False
+        return self.artifact_store.get_path(future.result()) is not None
+
+    def _discard_failed(self, key: tuple, future: Future) -> None:
+        """
+        Remove a failed render from the cache, so that it is rendered again.
+
+        Args:
+            key (tuple): Cache key of the chart.
+            future (Future): Render of the chart.
+        Returns:
+            None.
+        """
+        if future.exception() is None:
+            return
+        with self._lock:
+            if self._cache.get(key) is future:
+                del self._cache[key]
+
+    def render(self, key: tuple, filename: str, plot_fn, *args, **kwargs) -> Future:
+        """
+        Render a chart, or get the cached render of the same key.
+
+        Args:
+            key (tuple): Cache key of the chart.
+            filename (str): Filename of the chart saved by plot_fn.
+            plot_fn (callable): Plotting function of utils/visualization.py.
+            args (tuple): Positional arguments of plot_fn, before output_dir.
+            kwargs (dict): Keyword arguments of plot_fn.
+        Returns:
+            Render resolving to the ID of the chart artifact (Future).
+        """
+        with self._lock:
+            future = self._cache.get(key)
+            if future is not None and self._is_available(future):
+                self._cache.move_to_end(key)
+                LOGGER.info(f"Render cache hit: {key}")
+                return future
+            future = self._executor.submit(
+                _render, self.artifact_store, plot_fn, filename, args, kwargs
+            )
+            self._cache[key] = future
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        future.add_done_callback(lambda future: self._discard_failed(key, future))
+        LOGGER.info(f"Submitted render: {key}")
+        return future
+
+    def shutdown(self) -> None:
+        """
+        Shut down the worker processes.
+
+        Args:
+            None.
+        Returns:
+            None.
+        """
+        self._executor.shutdown(wait=True, cancel_futures=True)
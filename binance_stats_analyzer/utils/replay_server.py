@@ -0,0 +1,476 @@
+import os
+import json
+import time
+import bisect
+import asyncio
+import argparse
+import threading
+import websockets
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from common_utils.logger import get_logger
+from common_utils.common import check_and_create_dir
+
+LOGGER = get_logger("statistical_analyzer/utils/replay_server")
+
+KLINES_REQUEST_WEIGHT = 2
+
+
+def get_fixture_path(fixture_dir: str, symbol: str, interval: str) -> str:
+    """
+    Get path of the kline fixture of a series.
+
+    Args:
+        fixture_dir (str): Directory of the fixtures.
+        symbol (str): Symbol of the cyrptocurrency on Binance.
+        interval (str): Interval of the klines.
+    Returns:
+        Path of the fixture (str).
+    """
+    return f"{fixture_dir}/{symbol}_{interval}.json"
+
+
+def record_fixture(
+    client, symbol: str, interval: str, start: str, fixture_dir: str
+) -> str:
+    """
+    Record raw klines from Binance as a fixture.
+
+    Args:
+        client (binance.client.Client): Binance client.
+        symbol (str): Symbol of the cyrptocurrency on Binance.
+        interval (str): Interval of the klines.
+        start (str): Start time of the klines.
+        fixture_dir (str): Directory of the fixtures.
+    Returns:
+        Path of the fixture (str).
+    """
+    check_and_create_dir(fixture_dir)
+    raw_klines = client.get_historical_klines(symbol, interval, start)
+    path = get_fixture_path(fixture_dir, symbol, interval)
+    with open(path, "w") as file:
+        json.dump(raw_klines, file)
+    LOGGER.info(f"Recorded {len(raw_klines)} klines of {symbol} {interval} at {path}.")
+    return path
+
+
+class _ReplayRequestHandler(BaseHTTPRequestHandler):
+    """
+    Request handler of the replay server, serving the Binance REST endpoints
+    used by the statistical analyzer.
+    """
+
+    def log_message(self, format, *args) -> None:
+        """
+        Log requests at debug level instead of stderr.
+        """
+        LOGGER.debug(format % args)
+
+    def _send_json(self, status: int, content, headers=None) -> None:
+        """
+        Send a JSON response.
+
+        Args:
+            status (int): HTTP status code.
+            content (any): Content to be serialized.
+            headers (dict): Extra headers.
+        Returns:
+            None.
+        """
+        body = json.dumps(content).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, str(value))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        """
+        Handle GET requests.
+        """
+        server = self.server.replay_server
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        endpoint = url.path.rstrip("/").rsplit("/", 1)[-1]
+        weight = KLINES_REQUEST_WEIGHT if endpoint == "klines" else 1
+
+        if server.latency_in_ms:
+            time.sleep(server.latency_in_ms / 1000.0)
+        is_accepted, used_weight, retry_after = server.consume_weight(weight)
+        headers = {"x-mbx-used-weight-1m": used_weight}
+        if not is_accepted:
+            headers["Retry-After"] = retry_after
+            self._send_json(429, {"code": -1003, "msg": "Too many requests."}, headers)
+            return
+
+        if endpoint == "ping":
+            self._send_json(200, {}, headers)
+        elif endpoint == "time":
+            self._send_json(200, {"serverTime": int(time.time() * 1000)}, headers)
+        elif endpoint == "klines":
+            klines = server.get_klines(
+                params["symbol"],
+                params["interval"],
+                int(params["startTime"]) if "startTime" in params else None,
+                int(params["endTime"]) if "endTime" in params else None,
+                min(int(params.get("limit", 500)), 1000),
+            )
+            if klines is None:
+                self._send_json(400, {"code": -1121, "msg": "Invalid symbol."}, headers)
+            else:
+                self._send_json(200, klines, headers)
+        else:
+            self._send_json(404, {"code": -1, "msg": "Not supported."}, headers)
+
+
+class ReplayServer:
+    """
+    Local stand-in of the Binance REST API serving recorded kline fixtures.
+
+    Attributes:
+        fixture_dir (str): Directory of the fixtures.
+        latency_in_ms (float): Latency injected into every response.
+        max_weight_per_minute (int): Request weight limit per minute, 0 for none.
+        reject_every_n_requests (int): Reject every n-th request with 429, 0 for none.
+    """
+
+    def __init__(
+        self,
+        fixture_dir: str,
+        host="127.0.0.1",
+        port=0,
+        latency_in_ms=0.0,
+        max_weight_per_minute=0,
+        reject_every_n_requests=0,
+    ) -> None:
+        """
+        Initialize replay server.
+
+        Args:
+            fixture_dir (str): Directory of the fixtures.
+            host (str): Host to listen on.
+            port (int): Port to listen on, 0 for any free port.
+            latency_in_ms (float): Latency injected into every response.
+            max_weight_per_minute (int): Request weight limit per minute, 0 for none.
+            reject_every_n_requests (int): Reject every n-th request, 0 for none.
+        Returns:
+            None.
+        """
+        self.fixture_dir = fixture_dir
+        self.latency_in_ms = latency_in_ms
+        self.max_weight_per_minute = max_weight_per_minute
+        self.reject_every_n_requests = reject_every_n_requests
+        self._fixtures = {}
+        self._lock = threading.Lock()
+        self._used_weight, self._window, self._n_requests = 0, None, 0
+        self._httpd = ThreadingHTTPServer((host, port), _ReplayRequestHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.replay_server = self
+
+    @property
+    def url(self) -> str:
+        """
+        Get the base URL of the REST API, to be used as API_URL of the client.
+
+        Args:
+            None.
+        Returns:
+            Base URL (str).
+        """
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/api"
+
+    def consume_weight(self, weight: int) -> tuple:
+        """
+        Account the weight of a request.
+
+        Args:
+            weight (int): Weight of the request.
+        Returns:
+            Whether the request is accepted, used weight and retry after (tuple).
+        """
+        with self._lock:
+            now = time.time()
+            window = int(now // 60)
+            if window != self._window:
+                self._window, self._used_weight = window, 0
+            self._n_requests += 1
+            retry_after = int((window + 1) * 60 - now) + 1
+            if self.reject_every_n_requests and (
+                self._n_requests % self.reject_every_n_requests == 0
+            ):
+                return False, self._used_weight, 1
+            if (
+                self.max_weight_per_minute
+                and self._used_weight + weight > self.max_weight_per_minute
+            ):
+                return False, self._used_weight, retry_after
+            self._used_weight += weight
+            return True, self._used_weight, retry_after
+
+    def _load_fixture(self, symbol: str, interval: str) -> tuple:
+        """
+        Load a fixture, the fixtures are kept in memory once loaded.
+
+        Args:
+            symbol (str): Symbol of the cyrptocurrency on Binance.
+            interval (str): Interval of the klines.
+        Returns:
+            Open times and raw klines (tuple), None if there is no fixture.
+        """
+        with self._lock:
+            if (symbol, interval) not in self._fixtures:
+                path = get_fixture_path(self.fixture_dir, symbol, interval)
+                if not os.path.isfile(path):
+                    return None
+                with open(path, "r") as file:
+                    raw_klines = sorted(json.load(file), key=lambda row: row[0])
+                open_times = [row[0] for row in raw_klines]
+                self._fixtures[(symbol, interval)] = (open_times, raw_klines)
+            return self._fixtures[(symbol, interval)]
+
+    def get_klines(
+        self, symbol: str, interval: str, start: int, end: int, limit: int
+    ) -> list:
+        """
+        Get recorded klines like the klines endpoint of Binance.
+
+        Args:
+            symbol (str): Symbol of the cyrptocurrency on Binance.
+            interval (str): Interval of the klines.
+            start (int): Start time in milliseconds, None for the earliest.
+            end (int): End time in milliseconds, None for the latest.
+            limit (int): Maximum number of klines.
+        Returns:
+            Raw klines (list), None if there is no fixture.
+        """
+        fixture = self._load_fixture(symbol, interval)
+        if fixture is None:
+            return None
+        open_times, raw_klines = fixture
+        first = 0 if start is None else bisect.bisect_left(open_times, start)
+        last = len(open_times) if end is None else bisect.bisect_right(open_times, end)
+        if start is None:
+            first = max(first, last - limit)
+        return raw_klines[first : min(last, first + limit)]
+
+    def start(self) -> None:
+        """
+        Start serving in a background thread.
+
+        Args:
+            None.
+        Returns:
+            None.
+        """
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        LOGGER.info(f"Replay server serving {self.fixture_dir} at {self.url}.")
+
+    def stop(self) -> None:
+        """
+        Stop serving.
+
+        Args:
+            None.
+        Returns:
+            None.
+        """
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class StreamReplayServer:
+    """
+    Local stand-in of the Binance websocket streams, publishing kline events
+    on the combined stream to every connected client.
+
+    Attributes:
+        host (str): Host to listen on.
+        port (int): Port to listen on, the bound port once started.
+        n_connections (int): Number of connections accepted so far.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0) -> None:
+        """
+        Initialize stream replay server.
+
+        Args:
+            host (str): Host to listen on.
+            port (int): Port to listen on, 0 for any free port.
+        Returns:
+            None.
+        """
+        self.host = host
+        self.port = port
+        self.n_connections = 0
+        self._connections = set()
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """
+        Get the base URL of the websocket streams, to be used as kline_stream_url.
+
+        Args:
+            None.
+        Returns:
+            Base URL (str).
+        """
+        return f"ws://{self.host}:{self.port}"
+
+    async def _handle(self, connection) -> None:
+        """
+        Keep a connection until it is closed.
+
+        Args:
+            connection (websockets.ServerConnection): Connection of a client.
+        Returns:
+            None.
+        """
+        self._connections.add(connection)
+        self.n_connections += 1
+        try:
+            await connection.wait_closed()
+        finally:
+            self._connections.discard(connection)
+
+    async def _serve(self):
+        """
+        Start listening, in the loop of the server.
+
+        Args:
+            None.
+        Returns:
+            Websocket server (websockets.Server).
+        """
+        return await websockets.serve(self._handle, self.host, self.port)
+
+    async def _broadcast(self, message: str) -> None:
+        """
+        Send a message to all the connected clients.
+
+        Args:
+            message (str): Message to be sent.
+        Returns:
+            None.
+        """
+        for connection in list(self._connections):
+            await connection.send(message)
+
+    async def _disconnect(self) -> None:
+        """
+        Close all the connections.
+
+        Args:
+            None.
+        Returns:
+            None.
+        """
+        for connection in list(self._connections):
+            await connection.close()
+
+    def _run(self, coroutine):
+        """
+        Run a coroutine in the loop of the server and wait for its result.
+
+        Args:
+            coroutine (coroutine): Coroutine to be run.
+        Returns:
+            Result of the coroutine (any).
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def publish_kline(
+        self, symbol: str, interval: str, raw_kline: list, is_closed=False
+    ) -> None:
+        """
+        Publish a kline event, built from a raw kline of the klines endpoint.
+
+        Args:
+            symbol (str): Symbol of the cyrptocurrency on Binance.
+            interval (str): Interval of the klines.
+            raw_kline (list): Raw kline, as returned by the klines endpoint.
+            is_closed (bool): Whether the bar is closed.
+        Returns:
+            None.
+        """
+        kline = {
+            "t": raw_kline[0],
+            "T": raw_kline[6],
+            "s": symbol,
+            "i": interval,
+            "o": raw_kline[1],
+            "h": raw_kline[2],
+            "l": raw_kline[3],
+            "c": raw_kline[4],
+            "v": raw_kline[5],
+            "n": raw_kline[8],
+            "x": is_closed,
+        }
+        message = {
+            "stream": f"{symbol.lower()}@kline_{interval}",
+            "data": {"e": "kline", "E": raw_kline[0], "s": symbol, "k": kline},
+        }
+        self._run(self._broadcast(json.dumps(message)))
+
+    def disconnect(self) -> None:
+        """
+        Drop all the connections, as Binance does on maintenance.
+
+        Args:
+            None.
+        Returns:
+            None.
+        """
+        self._run(self._disconnect())
+
+    def start(self) -> None:
+        """
+        Start serving in a background thread.
+
+        Args:
+            None.
+        Returns:
+            None.
+        """
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        self._server = self._run(self._serve())
+        self.port = self._server.sockets[0].getsockname()[1]
+        LOGGER.info(f"Stream replay server serving at {self.url}.")
+
+    def stop(self) -> None:
+        """
+        Stop serving.
+
+        Args:
+            None.
+        Returns:
+            None.
+        """
+        self._server.close()
+        self._run(self._server.wait_closed())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record kline fixtures.")
+    parser.add_argument("fixture_dir", help="Directory of the fixtures.")
+    parser.add_argument("interval", help="Interval of the klines, e.g. 1d.")
+    parser.add_argument("start", help='Start time, e.g. "1825 days ago UTC".')
+    parser.add_argument("symbols", nargs="+", help="Symbols, e.g. BTCUSDT.")
+    args = parser.parse_args()
+
+    from binance.client import Client
+
+    client = Client(os.getenv("BINANCE_API_KEY"), os.getenv("BINANCE_API_SECRET"))
+    for symbol in args.symbols:
+        record_fixture(client, symbol, args.interval, args.start, args.fixture_dir)
@@ -1,14 +1,30 @@
-import pandas as pd
+import time
 import numpy as np
-from darts import TimeSeries
 from darts.models.forecasting.auto_arima import AutoARIMA
 from darts.models.forecasting.lgbm import LightGBMModel
+from darts.models.forecasting.baselines import NaiveDrift
+from darts.models.forecasting.exponential_smoothing import ExponentialSmoothing
+from darts.models.forecasting.forecasting_model import GlobalForecastingModel
 
+from utils.prepared_series import PreparedSeries
+from utils.model_registry import ModelRegistry, ModelEntry
+from utils.forecast_store import ForecastStore
+from utils.technical_indicators import TechnicalScorer
+from utils.monte_carlo import MonteCarloSimulator
+from utils.forecast_engine import (
+    ForecastEngine,
+    ForecastJob,
+    ForecastTimeoutError,
+    run_forecast_job,
+)
 from common_utils.common import load_yml
 from common_utils.logger import get_logger
 
 LOGGER = get_logger("statistical_analyzer/utils/stats_analyzer")
 
+# Registry key of the models fitted across all targets
+GLOBAL_TARGET = "__global__"
+
 
 def get_analyzer_config() -> dict:
     """
@@ -22,22 +38,49 @@ def get_analyzer_config() -> dict:
     return load_yml("configs/stats_analyzer/analyzer.yml")
 
 
+def compute_stats_score(
+    norm_price_curr,
+    norm_price_max_predicts,
+    norm_price_min_predicts,
+    target_increase: float,
+):
+    """
+    Compute the stats score from normalized prices, element-wise.
+
+    Args:
+        norm_price_curr (float | np.ndarray): Normalized current price.
+        norm_price_max_predicts (float | np.ndarray): Normalized average forecast max.
+        norm_price_min_predicts (float | np.ndarray): Normalized average forecast min.
+        target_increase (float): Targeted percentage price increase.
+    Returns:
+        Stats score in [-1, 1] (float | np.ndarray).
+    """
+    weighting = 100.0 / target_increase
+    score_prediction = (
+        norm_price_max_predicts
+        - np.minimum(norm_price_curr, norm_price_min_predicts)
+        - norm_price_curr
+        - norm_price_min_predicts
+    ) * weighting
+    return np.clip(score_prediction, -1.0, 1.0)
+
+
 class StatisticalAnalyzer:
     """
     Statistical analyzer for analyzing the scores of the cryptocurrency.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, config=None) -> None:
         """
         Initialize statistical analyzer.
 
         Args:
-            None.
+            config (dict): Config of statistical analyzer, None to load analyzer.yml.
         Returns:
             None.
         """
         LOGGER.debug("Initializing statistical analyzer...")
-        config = get_analyzer_config()
+        config = config or get_analyzer_config()
         self.model_LightGBM = LightGBMModel(lags=10, output_chunk_length=30)
         self.model_AutoARIMA = AutoARIMA(start_p=10, max_p=30, start_q=10, max_q=30)
         self.models = ["AutoARIMA", "LightGBM"]
@@ -50,82 +93,335 @@ class StatisticalAnalyzer:
                 optimizer_kwargs={"lr": 1e-3},
                 model="LSTM",
                 batch_size=16,
-                n_epochs=50,
+                n_epochs=config["lstm_n_epochs"],
                 force_reset=True,
             )
             self.models.append("LSTM")
-        self.forecast, self.forecast_avg_max, self.forecast_avg_min = {}, {}, {}
+        if config["enable_MonteCarlo"]:
+            self.model_MonteCarlo = MonteCarloSimulator(
+                config["monte_carlo_n_paths"],
+                config["monte_carlo_window_bars"],
+                config["target_increase"],
+                seed=config["monte_carlo_seed"],
+            )
+            self.models.append("MonteCarlo")
+        self.lstm_fine_tune_epochs = config["lstm_fine_tune_epochs"]
+        self.lstm_full_retrain_every_n_bars = config["lstm_full_retrain_every_n_bars"]
+        self.forecast_store = ForecastStore(
+            config["forecast_store_path"],
+            config["forecast_store_cache_size"],
+            config["forecast_retention_in_days"],
+        )
+        self.forecast_paths = {}
+        self.forecast_bands = {}
         self.target_increase = config["target_increase"]
+        self.model_registry = ModelRegistry(config["model_registry_dir"])
+        self.full_refit_every_n_bars = config["full_refit_every_n_bars"]
+        self.order_search_every_n_bars = config["arima_order_search_every_n_bars"]
+        self.order_error_threshold = config["arima_order_error_threshold"]
+        self.enable_global_LightGBM = config["enable_global_LightGBM"]
+        self.timeout_per_model = config["forecast_timeout_per_model_in_seconds"]
+        self.timeout_per_analysis = config["forecast_timeout_per_analysis_in_seconds"]
+        if config["fallback_model"] == "ExponentialSmoothing":
+            self.model_fallback = ExponentialSmoothing()
+        else:
+            self.model_fallback = NaiveDrift()
+        self.technical_scorer = None
+        if config["enable_fast_stats"]:
+            self.technical_scorer = TechnicalScorer(
+                config["rsi_period"],
+                config["macd_periods"],
+                config["fast_stats_window"],
+            )
+        self.fast_stats_interval = config["fast_stats_interval"]
+        self.fast_stats_n_bars = config["fast_stats_n_bars"]
+        self.forecast_every_n_analyses = config["forecast_every_n_analyses"]
+        self.forecast_engine = None
+        if config["enable_parallel_forecast"]:
+            self.forecast_engine = ForecastEngine(
+                config["forecast_workers"], config["threads_per_forecast_worker"]
+            )
         LOGGER.info("Initialized statistical analyzer.")
 
-    def forecast_price(self, target: str, price_df: pd.DataFrame) -> tuple:
+    def get_refit_schedule(self, model: str) -> dict:
+        """
+        Get the refit schedule of a model.
+
+        The LSTM is fine-tuned on the new bars and only retrained from
+        scratch periodically, the other global models are conditioned on
+        the new bars until their full refit.
+
+        Args:
+            model (str): Name of the model.
+        Returns:
+            Refit arguments of the forecast jobs of the model (dict).
+        """
+        if model == "LSTM":
+            return {
+                "full_refit_every_n_bars": self.lstm_full_retrain_every_n_bars,
+                "fine_tune_epochs": self.lstm_fine_tune_epochs,
+                "fine_tune_context_bars": self.model_LSTM.training_length,
+            }
+        return {"full_refit_every_n_bars": self.full_refit_every_n_bars}
+
+    def forecast_price(self, target: str, price_df) -> tuple:
         """
         Forecast the price of the cryptocurrency.
 
         Args:
             target (str): Target cryptocurrency.
-            price_df (pd.DataFrame): Dataframe of the price of the cryptocurrency.
+            price_df (PreparedSeries | Klines | pd.DataFrame): Price of the target.
         Returns:
             Forecast of the price of the cryptocurrency (tuple).
         """
-        forecast, forecast_avg_max, forecast_avg_min = {}, 0.0, 0.0
-        for model in self.models:
-            if model == "LSTM":
-                price_max, price_min, time_series = self.transform_price_dataframe(
-                    price_df, normalize=True
+        return self.forecast_prices({target: price_df})[target]
+
+    def forecast_prices(self, price_dfs: dict) -> dict:
+        """
+        Forecast the prices of the cryptocurrencies, the (target, model) jobs
+        run in parallel when the forecast engine is enabled.
+
+        Args:
+            price_dfs (dict): Prepared series, klines or dataframes of the price by target.
+        Returns:
+            Forecast of the price of each cryptocurrency (dict of tuple).
+        """
+        prepared = {
+            target: PreparedSeries.prepare(price_df)
+            for target, price_df in price_dfs.items()
+        }
+        jobs, global_series = [], []
+        for target, series in prepared.items():
+            for model in self.models:
+                if model == "MonteCarlo":
+                    # Simulated for all the targets at once below
+                    continue
+                if model == "LightGBM" and self.enable_global_LightGBM:
+                    # Scaled per target so that one model fits all the targets
+                    global_series.append(series.get_time_series(normalize=True))
+                    continue
+                jobs.append(
+                    ForecastJob(
+                        target=target,
+                        model_name=model,
+                        template=getattr(self, f"model_{model}"),
+                        entry=self.model_registry.get(target, model),
+                        time_series=series.get_time_series(normalize=model == "LSTM"),
+                        order_search_every_n_bars=self.order_search_every_n_bars,
+                        order_error_threshold=self.order_error_threshold,
+                        **self.get_refit_schedule(model),
+                    )
+                )
+
+        if global_series:
+            jobs.append(
+                ForecastJob(
+                    target=GLOBAL_TARGET,
+                    model_name="LightGBM",
+                    template=self.model_LightGBM,
+                    entry=self.model_registry.get(GLOBAL_TARGET, "LightGBM"),
+                    time_series=global_series,
+                    full_refit_every_n_bars=self.full_refit_every_n_bars,
+                    targets=tuple(price_dfs),
                 )
+            )
+
+        # Jobs without new bars reuse the registered forecast in place
+        paths = {target: {} for target in price_dfs}
+        pending_jobs = [job for job in jobs if not job.is_up_to_date()]
+        for job in pending_jobs:
+            job.timeout_in_seconds = self.timeout_per_model
+        start_time = time.time()
+        if self.forecast_engine and pending_jobs:
+            results = self.forecast_engine.run(pending_jobs, self.timeout_per_analysis)
+        else:
+            results = self._run_jobs_inline(pending_jobs)
+        LOGGER.info(
+            f"Ran {len(pending_jobs)}/{len(jobs)} forecast jobs in {time.time() - start_time:.2f}s."
+        )
+        for job, result in zip(pending_jobs, results):
+            if isinstance(result, Exception):
+                LOGGER.error(f"Failed to forecast by {job.model_name}: {result}")
+                job.entry, path = self._fall_back(job)
+            else:
+                self.model_registry.put(job.target, job.model_name, result)
+                job.entry, path = result, "fit"
+            for target in job.targets or (job.target,):
+                paths[target][job.model_name] = path
+        # The up to date jobs did not run, their registered forecast is used
+        for job in jobs:
+            for target in job.targets or (job.target,):
+                paths[target].setdefault(job.model_name, "reused")
+
+        # Forecasts of the models fitted on normalized prices are reverted,
+        # the max and min of each forecast are those of its values
+        model_forecasts = []
+        for job in jobs:
+            if job.targets:
+                for target, values in zip(job.targets, job.entry.forecast):
+                    values = prepared[target].denormalize(values)
+                    model_forecasts.append((target, job.model_name, values, None))
+            elif job.model_name == "LSTM":
+                values = prepared[job.target].denormalize(job.entry.forecast)
+                model_forecasts.append((job.target, job.model_name, values, None))
             else:
-                price_max, price_min, time_series = self.transform_price_dataframe(
-                    price_df
+                model_forecasts.append(
+                    (job.target, job.model_name, job.entry.forecast, None)
                 )
-            getattr(self, f"model_{model}").fit(series=time_series)
-            forecast[model] = getattr(self, f"model_{model}").predict(n=30).values()
-            model_forecast_avg_max = forecast[model].max()
+        if "MonteCarlo" in self.models and prepared:
+            model_forecasts.extend(self._simulate(prepared, paths))
+
+        forecasts = {target: ({}, 0.0, 0.0) for target in price_dfs}
+        for target, model, values, band in model_forecasts:
+            forecast, forecast_avg_max, forecast_avg_min = forecasts[target]
+            model_forecast_avg_max, model_forecast_avg_min = band or (
+                values.max(),
+                values.min(),
+            )
             forecast_avg_max += model_forecast_avg_max / len(self.models)
-            model_forecast_avg_min = forecast[model].min()
             forecast_avg_min += model_forecast_avg_min / len(self.models)
-            if model == "LSTM":
-                forecast[model] = (
-                    np.hstack(forecast[model]) * (price_max - price_min) + price_min
-                )
-            else:
-                forecast[model] = np.hstack(forecast[model])
+            forecast[model] = np.hstack(values)
             LOGGER.info(
-                f"Predicted by {model}, max in 30 days: {model_forecast_avg_max}, min in 30 days: {model_forecast_avg_min}"
+                f"Predicted {target} by {model}, max in 30 days: {model_forecast_avg_max}, min in 30 days: {model_forecast_avg_min}"
             )
-        (
-            self.forecast[target],
-            self.forecast_avg_max[target],
-            self.forecast_avg_min[target],
-        ) = (
-            forecast,
-            forecast_avg_max,
-            forecast_avg_min,
-        )
-        return (forecast, forecast_avg_max, forecast_avg_min)
+            forecasts[target] = (forecast, forecast_avg_max, forecast_avg_min)
 
-    def transform_price_dataframe(
-        self, dataframe: pd.DataFrame, freq="1d", normalize=False
-    ) -> tuple:
+        for target, (forecast, forecast_avg_max, forecast_avg_min) in forecasts.items():
+            self.forecast_paths[target] = paths[target]
+            if forecast:
+                self.forecast_store.put(
+                    target,
+                    prepared[target].time_index[-1],
+                    forecast,
+                    forecast_avg_max,
+                    forecast_avg_min,
+                )
+        return forecasts
+
+    def _simulate(self, prepared: dict, paths: dict) -> list:
         """
-        Transform the price dataframe.
+        Simulate the Monte Carlo price bands of all the targets in one batch.
+
+        The median path is kept as the forecast, while the expected max and
+        min over the paths replace the max and min of the forecast.
 
         Args:
-            dataframe (pd.DataFrame): Dataframe of the price of the cryptocurrency.
-            freq (str): Frequency of the data.
-            normalize (bool): Whether to normalize the data.
+            prepared (dict): Prepared series of the price by target.
+            paths (dict): Paths used to forecast by target and model, updated in place.
         Returns:
-            Transformed dataframe (tuple).
+            Forecasts as (target, model, values, (max, min)) (list of tuple).
         """
-        price_max, price_min = dataframe["Price"].max(), dataframe["Price"].min()
-        if normalize:
-            dataframe["Price"] = (dataframe["Price"] - price_min) / (
-                price_max - price_min
+        start_time = time.time()
+        targets = list(prepared)
+        bands = self.model_MonteCarlo.simulate(
+            [prepared[target].raw for target in targets]
+        )
+        LOGGER.info(
+            f"Simulated {len(targets)} targets by MonteCarlo in {time.time() - start_time:.3f}s."
+        )
+        model_forecasts = []
+        for idx, target in enumerate(targets):
+            self.forecast_bands[target] = bands.get(idx)
+            paths[target]["MonteCarlo"] = "simulated"
+            LOGGER.info(f"Simulated bands of {target}: {self.forecast_bands[target]}")
+            model_forecasts.append(
+                (
+                    target,
+                    "MonteCarlo",
+                    bands.median[idx],
+                    (bands.band_max[idx], bands.band_min[idx]),
+                )
             )
+        return model_forecasts
+
+    def _run_jobs_inline(self, jobs: list) -> list:
+        """
+        Run forecast jobs one by one in this process.
+
+        The time budget of each job is only enforced in the main thread, the
+        jobs left when the analysis budget runs out are not run.
+
+        Args:
+            jobs (list): Forecast jobs (ForecastJob).
+        Returns:
+            Updated models or the errors of the jobs, in the order of the jobs (list).
+        """
+        deadline = time.time() + (self.timeout_per_analysis or float("inf"))
+        results = []
+        for job in jobs:
+            if time.time() >= deadline:
+                results.append(
+                    ForecastTimeoutError(
+                        f"Exceeded the analysis budget of {self.timeout_per_analysis}s."
+                    )
+                )
+                continue
+            try:
+                results.append(run_forecast_job(job))
+            except Exception as err:
+                results.append(err)
+        return results
+
+    def _fall_back(self, job: ForecastJob) -> tuple:
+        """
+        Forecast with a cheaper path when a forecast job failed or timed out.
+
+        In order of preference: the last fitted global model conditioned on
+        the latest bars, the last forecast of the model, or the fallback model
+        fitted on the latest bars. The result is not registered, so the model
+        is fitted again in the next analysis.
+
+        Args:
+            job (ForecastJob): Failed forecast job.
+        Returns:
+            Model with the fallback forecast (ModelEntry) and path used (str).
+        """
+        entry, series_list = job.entry, job.time_series
+        if not job.targets:
+            series_list = [series_list]
+        if entry and isinstance(entry.model, GlobalForecastingModel):
+            path = "last_fit"
+            predictions = entry.model.predict(n=30, series=series_list)
+        elif entry and entry.targets == job.targets:
+            return entry, "cached"
+        else:
+            path = "fallback"
+            predictions = []
+            for time_series in series_list:
+                model = self.model_fallback.untrained_model()
+                model.fit(series=time_series)
+                predictions.append(model.predict(n=30))
+        forecast = np.stack([prediction.values() for prediction in predictions])
+        LOGGER.info(f"Forecasted by {job.model_name} through the {path} path.")
         return (
-            price_max,
-            price_min,
-            TimeSeries.from_dataframe(
-                df=dataframe, time_col="Time", value_cols="Price", freq=freq
+            ModelEntry(
+                model=entry.model if entry else None,
+                last_time=job.get_end_time(),
+                forecast=forecast if job.targets else forecast[0],
+                fitted_at=entry.fitted_at if entry else None,
+                targets=job.targets,
             ),
+            path,
         )
+
+    def predict_global(self, target: str, price_df, freq="1d") -> dict:
+        """
+        Forecast the price of a cryptocurrency with the LightGBM model fitted
+        across targets, without fitting.
+
+        Args:
+            target (str): Target cryptocurrency.
+            price_df (PreparedSeries | Klines | pd.DataFrame): Price of the target.
+            freq (str): Frequency of the series.
+        Returns:
+            Forecast of the price by model (dict), None if there is no global model.
+        """
+        entry = self.model_registry.get(GLOBAL_TARGET, "LightGBM")
+        if not self.enable_global_LightGBM or entry is None:
+            return None
+        series = PreparedSeries.prepare(price_df, freq)
+        forecast = entry.model.predict(
+            n=30, series=series.get_time_series(normalize=True)
+        ).values()
+        LOGGER.info(f"Predicted {target} by global LightGBM.")
+        return {"LightGBM": series.denormalize(np.hstack(forecast))}
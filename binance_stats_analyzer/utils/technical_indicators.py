@@ -0,0 +1,169 @@
+import numpy as np
+from scipy.signal import lfilter
+
+
+def stack_prices(prices_list: list, n_bars: int) -> np.ndarray:
+    """
+    Stack the latest bars of the targets into one array, right-aligned.
+
+    A target with a shorter history is padded with its first price, so that
+    its indicators see a flat price before its first bar.
+
+    Args:
+        prices_list (list): Prices of each target (list of np.ndarray).
+        n_bars (int): Number of bars kept per target.
+    Returns:
+        Prices of shape (n_targets, n_bars) (np.ndarray).
+    """
+    stacked = np.empty((len(prices_list), n_bars), dtype=np.float64)
+    for idx, prices in enumerate(prices_list):
+        prices = np.asarray(prices)[-n_bars:]
+        stacked[idx, : n_bars - len(prices)] = prices[0]
+        stacked[idx, n_bars - len(prices) :] = prices
+    return stacked
+
+
+def ema(values: np.ndarray, alpha: float) -> np.ndarray:
+    """
+    Exponential moving average along the bars, seeded with the first bar.
+
+    Args:
+        values (np.ndarray): Values of shape (n_targets, n_bars).
+        alpha (float): Smoothing factor.
+    Returns:
+        Moving average of shape (n_targets, n_bars) (np.ndarray).
+    """
+    initial = (1.0 - alpha) * values[:, :1]
+    averages, _ = lfilter([alpha], [1.0, alpha - 1.0], values, axis=1, zi=initial)
+    return averages
+
+
+def rsi(prices: np.ndarray, period: int) -> np.ndarray:
+    """
+    Relative strength index of the last bar, with Wilder's smoothing.
+
+    Args:
+        prices (np.ndarray): Prices of shape (n_targets, n_bars).
+        period (int): Period of the index.
+    Returns:
+        RSI in [0, 100] of each target (np.ndarray).
+    """
+    changes = np.diff(prices, axis=1)
+    gains = ema(np.maximum(changes, 0.0), 1.0 / period)[:, -1]
+    losses = ema(np.maximum(-changes, 0.0), 1.0 / period)[:, -1]
+    total = gains + losses
+    # A flat price has neither gains nor losses, treated as neutral
+    return np.divide(
+        100.0 * gains, total, out=np.full_like(total, 50.0), where=total > 0
+    )
+
+
+def macd(prices: np.ndarray, fast: int, slow: int, signal: int) -> tuple:
+    """
+    Moving average convergence divergence of the last bar.
+
+    Args:
+        prices (np.ndarray): Prices of shape (n_targets, n_bars).
+        fast (int): Span of the fast moving average.
+        slow (int): Span of the slow moving average.
+        signal (int): Span of the signal line.
+    Returns:
+        MACD, signal line and histogram of each target (tuple of np.ndarray).
+    """
+    line = ema(prices, 2.0 / (fast + 1)) - ema(prices, 2.0 / (slow + 1))
+    signal_line = ema(line, 2.0 / (signal + 1))
+    return line[:, -1], signal_line[:, -1], line[:, -1] - signal_line[:, -1]
+
+
+def rolling_volatility(prices: np.ndarray, window: int) -> np.ndarray:
+    """
+    Standard deviation of the log returns over the last bars.
+
+    Args:
+        prices (np.ndarray): Prices of shape (n_targets, n_bars).
+        window (int): Number of returns.
+    Returns:
+        Volatility per bar of each target (np.ndarray).
+    """
+    return np.diff(np.log(prices[:, -window - 1 :]), axis=1).std(axis=1)
+
+
+def zscore(prices: np.ndarray, window: int) -> np.ndarray:
+    """
+    Z-score of the last price against the last bars.
+
+    Args:
+        prices (np.ndarray): Prices of shape (n_targets, n_bars).
+        window (int): Number of bars.
+    Returns:
+        Z-score of each target (np.ndarray).
+    """
+    recent = prices[:, -window:]
+    std = recent.std(axis=1)
+    deviation = recent[:, -1] - recent.mean(axis=1)
+    return np.divide(deviation, std, out=np.zeros_like(std), where=std > 0)
+
+
+class TechnicalScorer:
+    """
+    Cheap score of the targets from technical indicators, computed for all
+    the targets at once.
+
+    Each indicator is turned into a signal in [-1, 1], positive when an
+    increase is expected: RSI below 50 (oversold), a positive MACD
+    histogram relative to the volatility, and a price below its rolling
+    mean. The score is the average of the signals.
+
+    Attributes:
+        rsi_period (int): Period of the RSI.
+        macd_periods (list): Spans of the fast, slow and signal lines of the MACD.
+        window (int): Number of bars of the volatility and the z-score.
+    """
+
+    def __init__(self, rsi_period: int, macd_periods: list, window: int) -> None:
+        """
+        Initialize technical scorer.
+
+        Args:
+            rsi_period (int): Period of the RSI.
+            macd_periods (list): Spans of the fast, slow and signal lines of the MACD.
+            window (int): Number of bars of the volatility and the z-score.
+        Returns:
+            None.
+        """
+        self.rsi_period = rsi_period
+        self.macd_periods = macd_periods
+        self.window = window
+
+    def score(self, prices: np.ndarray) -> dict:
+        """
+        Score the targets.
+
+        Args:
+            prices (np.ndarray): Prices of shape (n_targets, n_bars).
+        Returns:
+            Indicators and scores in [-1, 1] of each target (dict of np.ndarray).
+        """
+        rsi_values = rsi(prices, self.rsi_period)
+        _, _, histogram = macd(prices, *self.macd_periods)
+        volatility = rolling_volatility(prices, self.window)
+        zscores = zscore(prices, self.window)
+
+        scale = prices[:, -1] * volatility
+        relative_histogram = np.divide(
+            histogram, scale, out=np.zeros_like(scale), where=scale > 0
+        )
+        signals = np.stack(
+            [
+                (50.0 - rsi_values) / 50.0,
+                np.tanh(relative_histogram),
+                -np.tanh(zscores / 2.0),
+            ]
+        )
+        return {
+            "rsi": rsi_values,
+            "macd_histogram": histogram,
+            "volatility": volatility,
+            "zscore": zscores,
+            "score": np.clip(signals.mean(axis=0), -1.0, 1.0),
+        }
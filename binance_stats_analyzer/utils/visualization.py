@@ -5,6 +5,7 @@ import seaborn as sns
 import numpy as np
 
 from dataclasses import dataclass
+from utils.klines import Klines
 from common_utils.logger import get_logger
 from common_utils.common import check_and_create_dir
 
@@ -100,19 +101,93 @@ def savefig_and_close(filename: str, output_dir=None, close=True) -> None:
         plt.close()
 
 
-def plot_klines(klines: pd.DataFrame, target: str, output_dir=None, close=True) -> None:
+def aggregate_candles(ohlcv_df: pd.DataFrame, max_candles=None) -> pd.DataFrame:
+    """
+    Aggregate consecutive candles into at most max_candles candles.
+
+    Args:
+        ohlcv_df (pd.DataFrame): OHLCV dataframe indexed by open time.
+        max_candles (int): Maximum number of candles, None for no limit.
+    Returns:
+        Aggregated OHLCV dataframe (pd.DataFrame).
+    """
+    n_candles = len(ohlcv_df)
+    if not max_candles or n_candles <= max_candles:
+        return ohlcv_df
+    # Candles of the same number of bars, the last one may be shorter
+    size = -(-n_candles // max_candles)
+    starts = np.arange(0, n_candles, size)
+    ends = np.r_[starts[1:], n_candles] - 1
+    open_time = ohlcv_df.index[starts]
+    LOGGER.info(f"Aggregating {n_candles} candles by {size} into {len(starts)}.")
+    return pd.DataFrame(
+        {
+            "OpenTime": open_time,
+            "Open": ohlcv_df["Open"].to_numpy()[starts],
+            "High": np.maximum.reduceat(ohlcv_df["High"].to_numpy(), starts),
+            "Low": np.minimum.reduceat(ohlcv_df["Low"].to_numpy(), starts),
+            "Close": ohlcv_df["Close"].to_numpy()[ends],
+            "Volume": np.add.reduceat(ohlcv_df["Volume"].to_numpy(), starts),
+        },
+        index=pd.Index(open_time, name="OpenTime"),
+    )
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Select the points of a line by Largest-Triangle-Three-Buckets.
+
+    The first and last points are kept, each bucket in between keeps the
+    point forming the largest triangle with the point kept in the previous
+    bucket and the average of the next bucket.
+
+    Args:
+        x (np.ndarray): X values, sorted.
+        y (np.ndarray): Y values.
+        n_out (int): Number of points kept.
+    Returns:
+        Indices of the kept points, sorted (np.ndarray).
+    """
+    n_points = len(x)
+    if n_out >= n_points or n_out < 3:
+        return np.arange(n_points)
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    edges = np.r_[np.linspace(1, n_points - 1, n_out - 1).astype(np.int64), n_points]
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, n_points - 1
+    selected = 0
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2]
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+        areas = np.abs(
+            (x[selected] - next_x) * (y[start:end] - y[selected])
+            - (x[selected] - x[start:end]) * (next_y - y[selected])
+        )
+        selected = start + int(areas.argmax())
+        indices[bucket + 1] = selected
+    return indices
+
+
+def plot_klines(
+    klines, target: str, output_dir=None, close=True, max_candles=None
+) -> None:
     """
     Plot klines of the target.
 
     Args:
-        klines (pd.DataFrame): Dataframe of the klines.
+        klines (Klines | pd.DataFrame): Klines or dataframe of the klines.
         target (str): Target cryptocurrency.
         output_dir (str): Output directory of the plot.
         close (bool): Whether to close the plot.
+        max_candles (int): Maximum number of candles, None for no limit.
     Returns:
         None.
     """
     LOGGER.info(f"Plotting kine of {target}...")
+    if isinstance(klines, Klines):
+        klines = klines.to_ohlcv_dataframe()
+    klines = aggregate_candles(klines, max_candles)
     labels = Labels(target)
     _, ax = initialize_plot(labels=labels)
     mpf.plot(data=klines, type="candle", show_nontrading=True, ax=ax)
@@ -120,20 +195,39 @@ def plot_klines(klines: pd.DataFrame, target: str, output_dir=None, close=True)
 
 
 def plot_price_prediction(
-    price_df: pd.DataFrame, predictions: dict, target: str, output_dir=None, close=True
+    price_df,
+    predictions: dict,
+    target: str,
+    output_dir=None,
+    close=True,
+    freq="1d",
+    max_points=None,
 ) -> None:
     """
     Plot price prediction of the target.
 
     Args:
-        price_df (pd.DataFrame): Dataframe of the price.
+        price_df (Klines | pd.DataFrame): Klines or dataframe of the price.
         predictions (dict): Predictions of the price.
         target (str): Target cryptocurrency.
         output_dir (str): Output directory of the plot.
         close (bool): Whether to close the plot.
+        freq (str): Frequency of the predicted bars.
+        max_points (int): Maximum number of points of the real data, None for no limit.
     Returns:
         None.
     """
+    if isinstance(price_df, Klines):
+        price_df = price_df.to_price_dataframe()
+    if max_points and len(price_df) > max_points:
+        LOGGER.info(f"Downsampling {len(price_df)} prices into {max_points}.")
+        price_df = price_df.iloc[
+            lttb(
+                price_df["Time"].to_numpy().astype(np.int64),
+                price_df["Price"],
+                max_points,
+            )
+        ]
     labels = Labels(f"{target} latest forecasting")
     _, ax = initialize_plot(labels=labels)
     sns.lineplot(data=price_df, x="Time", y="Price", ax=ax, label="Real data")
@@ -143,7 +237,7 @@ def plot_price_prediction(
                 price_prediction, 0, price_df["Price"].iloc[-1]
             )
             prediction_time = pd.date_range(
-                start=price_df["Time"].iloc[-1], freq="1d", periods=31
+                start=price_df["Time"].iloc[-1], freq=freq, periods=31
             )
             prediction_df = pd.DataFrame(
                 {"Time": prediction_time, "Price": price_prediction}
@@ -156,3 +250,35 @@ def plot_price_prediction(
                 label=f"Prediction ({model})",
             )
     savefig_and_close(f"{target}_prediction.png", output_dir, close)
+
+
+def plot_correlation(
+    correlation: np.ndarray, targets: list, output_dir=None, close=True
+) -> None:
+    """
+    Plot correlation matrix of the targets as a heatmap.
+
+    Args:
+        correlation (np.ndarray): Correlation of shape (n_targets, n_targets).
+        targets (list): Targets.
+        output_dir (str): Output directory of the plot.
+        close (bool): Whether to close the plot.
+    Returns:
+        None.
+    """
+    LOGGER.info(f"Plotting correlation of {len(targets)} targets...")
+    labels = Labels("Correlation of returns")
+    # The figure grows with the targets, the values are only written when readable
+    size = min(max(6, 0.3 * len(targets)), 40)
+    _, ax = initialize_plot(figsize=(size + 2, size), labels=labels)
+    sns.heatmap(
+        pd.DataFrame(correlation, index=targets, columns=targets),
+        vmin=-1.0,
+        vmax=1.0,
+        cmap="coolwarm",
+        annot=len(targets) <= 15,
+        fmt=".2f",
+        square=True,
+        ax=ax,
+    )
+    savefig_and_close("correlation.png", output_dir, close)
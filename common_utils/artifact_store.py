@@ -0,0 +1,156 @@
+import os
+import re
+import time
+import shutil
+import hashlib
+import tempfile
+
+from .logger import get_logger
+from .common import load_yml, check_and_create_dir
+
+LOGGER = get_logger("common_utils/artifact_store")
+
+# Artifact IDs are the content hash and the extension, e.g. 3f2a...9c.png
+ARTIFACT_ID_PATTERN = re.compile(r"^[0-9a-f]{32}\.[0-9a-z]+$")
+
+# Temporary directories left by a crash are deleted after this age
+TEMP_DIR_MAX_AGE_IN_SECONDS = 86400
+
+
+def load_artifact_store_config() -> dict:
+    """
+    Load artifact store config.
+
+    Args:
+        None.
+    Returns:
+        Artifact store config (dict).
+    """
+    return load_yml("./configs/common/artifact_store.yml")
+
+
+class ArtifactStore:
+    """
+    Content-addressed store of the files shared between the containers.
+
+    A file is stored under the hash of its content, so the same content is
+    stored once and gets the same artifact ID, which is passed over MQTT
+    instead of a path. The least recently stored artifacts are deleted when
+    the store exceeds its size, and any artifact older than the maximum age.
+
+    Attributes:
+        root_dir (str): Directory of the artifacts.
+        max_size_in_mb (float): Maximum total size of the artifacts, 0 for no limit.
+        max_age_in_days (float): Maximum age of an artifact, 0 for no limit.
+    """
+
+    def __init__(self, config=None) -> None:
+        """
+        Initialize artifact store.
+
+        Args:
+            config (dict): Config of the artifact store, None to load artifact_store.yml.
+        Returns:
+            None.
+        """
+        config = config or load_artifact_store_config()
+        self.root_dir = config["root_dir"]
+        self.max_size_in_mb = config["max_size_in_mb"]
+        self.max_age_in_days = config["max_age_in_days"]
+        check_and_create_dir(self.root_dir)
+        LOGGER.info(f"Initialized artifact store at {self.root_dir}.")
+
+    def make_temp_dir(self) -> str:
+        """
+        Create a temporary directory in the store, so that the files written
+        there are moved into the store without copy.
+
+        Args:
+            None.
+        Returns:
+            Path of the temporary directory (str).
+        """
+        return tempfile.mkdtemp(prefix=".tmp", dir=self.root_dir)
+
+    def get_path(self, artifact_id: str) -> str:
+        """
+        Get the path of an artifact.
+
+        Args:
+            artifact_id (str): ID of the artifact.
+        Returns:
+            Path of the artifact, None if the ID is invalid or the artifact is gone (str).
+        """
+        if not ARTIFACT_ID_PATTERN.match(artifact_id or ""):
+            LOGGER.error(f"Invalid artifact ID: {artifact_id}")
+            return None
+        path = f"{self.root_dir}/{artifact_id}"
+        return path if os.path.isfile(path) else None
+
+    def put(self, path: str) -> str:
+        """
+        Move a file into the store.
+
+        Args:
+            path (str): Path of the file, removed once stored.
+        Returns:
+            ID of the artifact (str).
+        """
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+        extension = os.path.splitext(path)[1].lstrip(".").lower() or "bin"
+        artifact_id = f"{digest.hexdigest()[:32]}.{extension}"
+        artifact_path = f"{self.root_dir}/{artifact_id}"
+        try:
+            # Refresh the stored artifact, it is the most recently stored again
+            os.utime(artifact_path)
+            os.remove(path)
+            LOGGER.info(f"Deduplicated artifact {artifact_id}.")
+        except FileNotFoundError:
+            os.replace(path, artifact_path)
+            LOGGER.info(f"Stored artifact {artifact_id}.")
+        self.gc()
+        return artifact_id
+
+    def gc(self) -> None:
+        """
+        Delete the artifacts older than the maximum age, then the least
+        recently stored ones until the store fits its size.
+
+        Args:
+            None.
+        Returns:
+            None.
+        """
+        now, artifacts = time.time(), []
+        for entry in os.scandir(self.root_dir):
+            if entry.is_file() and ARTIFACT_ID_PATTERN.match(entry.name):
+                stat = entry.stat()
+                artifacts.append((stat.st_mtime, stat.st_size, entry.path))
+            elif entry.is_dir() and entry.name.startswith(".tmp"):
+                if now - entry.stat().st_mtime > TEMP_DIR_MAX_AGE_IN_SECONDS:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+        artifacts.sort()
+
+        total_size = sum(size for _, size, _ in artifacts)
+        max_size = self.max_size_in_mb * 1024 * 1024
+        n_deleted = 0
+        for mtime, size, path in artifacts:
+            is_expired = self.max_age_in_days and (
+                now - mtime > self.max_age_in_days * 86400
+            )
+            is_oversized = self.max_size_in_mb and total_size > max_size
+            if not (is_expired or is_oversized):
+                # The artifacts left are newer and the store fits its size
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Deleted by the store of another container
+                pass
+            total_size -= size
+            n_deleted += 1
+        if n_deleted:
+            LOGGER.info(f"Deleted {n_deleted} artifacts, {total_size} bytes left.")
@@ -1,14 +1,22 @@
 import os
 import pandas as pd
+from collections import OrderedDict
 from time import sleep
 from slack_sdk.web import WebClient
 
 from common_utils.mqtt import Publisher, MQTTMessage
 from common_utils.common import load_yml
 from common_utils.logger import get_logger
+from common_utils.artifact_store import ArtifactStore
 
 LOGGER = get_logger("slackbot/utils/command_exector")
 
+# Number of uploaded artifacts remembered to link instead of uploading again
+MAX_UPLOADED_ARTIFACTS = 256
+
+# Minutes of the units of the intervals of Binance
+INTERVAL_UNIT_IN_MINUTES = {"m": 1, "h": 60, "d": 1440}
+
 
 def _load_supported_cryptocurrencies() -> list:
     """
@@ -60,6 +68,8 @@ class SlackCommandExector:
         self.analysis_waittime = pd.Timedelta(seconds=analysis_waittime)
         self.supported_targets = _load_supported_cryptocurrencies()
         self.commands = _load_command_list()
+        self.artifact_store = ArtifactStore()
+        self.uploaded_artifacts = OrderedDict()
         LOGGER.debug("Initialized Slackbot Command Exector.")
 
     def wait_if_after_analysis(self) -> None:
@@ -119,7 +129,7 @@ class SlackCommandExector:
         ]
         LOGGER.info(f"Successfully sent message: {sent_message}")
 
-    def _post_attachment(self, title: str, file: str, channel: str) -> None:
+    def _post_attachment(self, title: str, file: str, channel: str) -> dict:
         """
         Post attachment to Slack.
 
@@ -128,13 +138,14 @@ class SlackCommandExector:
             file (str): File of the attachment.
             channel (str): Channel of the attachment.
         Returns:
-            None.
+            Uploaded file (dict).
         """
         LOGGER.debug(f"Sending attachment to Slack, channel: {channel}, file: {file}")
         sent_attachment = self.web_client.files_upload_v2(
             title=title, file=file, channel=channel
         )
         LOGGER.info(f"Successfully sent attachment: {sent_attachment}")
+        return sent_attachment.get("file") or {}
 
     def help(self, text: str, user: str, channel: str) -> None:
         """
@@ -390,6 +401,64 @@ class SlackCommandExector:
             mqtt_message = MQTTMessage.from_str("slackbot-pub", message)
             self.publisher.publish(mqtt_message)
 
+    def s_show_correlation(self, text: str, user: str, channel: str) -> None:
+        """
+        S-Show-Correlation command.
+
+        Args:
+            text (str): Text of the message.
+            user (str): User of the message.
+            channel (str): Channel of the message.
+        Returns:
+            None.
+        """
+        if not self.log_channel:
+            LOGGER.info(
+                f"Log channel not set, set channel for logging: from {self.log_channel} to {channel}..."
+            )
+            self.log_channel = channel
+            self._post_message(
+                "Log channel not set, set this channel for logging.", channel
+            )
+        args = text.split(" ")[1:]
+        message = None
+        if len(args) != 2:
+            message = "Wrong command format, please check help."
+        elif len(self.targets) < 2:
+            message = "Not able to show, at least 2 targets are needed."
+        elif args[1][-1] not in ["m", "h", "d"]:
+            message = 'Unit of interval should be in ["m", "h", "d"].'
+        else:
+            try:
+                interval_in_minutes = (
+                    int(args[1][:-1]) * INTERVAL_UNIT_IN_MINUTES[args[1][-1]]
+                )
+                duration_in_minutes = float(args[0]) * 60
+            except ValueError:
+                message = "Type of duration should be float / Value in interval should be integer."
+            else:
+                # The correlation needs at least 2 returns in the window
+                if (
+                    interval_in_minutes <= 0
+                    or duration_in_minutes // interval_in_minutes < 2
+                ):
+                    message = "Duration should cover at least 2 intervals."
+        if message:
+            self._post_message(message, channel)
+        else:
+            message = str(
+                {
+                    "scommand": "show_correlation",
+                    "args": {
+                        "targets": self.targets,
+                        "duration": args[0],
+                        "interval": args[1],
+                    },
+                }
+            )
+            mqtt_message = MQTTMessage.from_str("slackbot-pub", message)
+            self.publisher.publish(mqtt_message)
+
     def post(self, command_args: dict) -> None:
         """
         Post command.
@@ -400,19 +469,38 @@ class SlackCommandExector:
             None.
         """
         posttype = command_args.get("type", None)
-        if posttype in ["csv", "png"]:
-            self._post_attachment(
-                "User requested analysis results",
-                command_args.get("path", None),
-                self.log_channel,
+        if posttype not in ["csv", "png"]:
+            return
+        artifact_id = command_args.get("artifact_id", None)
+        # The same artifact is linked to instead of uploaded again
+        permalink = self.uploaded_artifacts.get((artifact_id, self.log_channel))
+        if permalink:
+            self.uploaded_artifacts.move_to_end((artifact_id, self.log_channel))
+            self._post_message(
+                f"Same result as uploaded before: {permalink}", self.log_channel
             )
+            return
+        path = self.artifact_store.get_path(artifact_id)
+        if path is None:
+            LOGGER.error(f"Artifact {artifact_id} is not found, ignored post.")
+            return
+        uploaded_file = self._post_attachment(
+            "User requested analysis results", path, self.log_channel
+        )
+        if uploaded_file.get("permalink"):
+            self.uploaded_artifacts[(artifact_id, self.log_channel)] = uploaded_file[
+                "permalink"
+            ]
+            while len(self.uploaded_artifacts) > MAX_UPLOADED_ARTIFACTS:
+                self.uploaded_artifacts.popitem(last=False)
 
-    def log_scores(self, scores: dict) -> None:
+    def log_scores(self, scores: dict, paths=None) -> None:
         """
         Log scores to Slack channel.
 
         Args:
             scores (dict): Scores of the targets.
+            paths (dict): Forecast path used by each model of the targets.
         Returns:
             None.
         """
@@ -422,6 +510,11 @@ class SlackCommandExector:
             message += f"\n\t- {target}:"
             for analyzer, score in scores[target].items():
                 message += f" {analyzer}: {score:.3f} |"
+            if paths and paths.get(target):
+                model_paths = ", ".join(
+                    f"{model}={path}" for model, path in paths[target].items()
+                )
+                message += f" paths: {model_paths} |"
         LOGGER.info(message)
         if self.log_channel:
             self._post_message(message, self.log_channel)
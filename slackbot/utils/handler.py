@@ -38,7 +38,8 @@ class MQTTHandler:
         if command == "log":
             scores = mqtt_message.content.get("scores", None)
             if scores:
-                self.command_exector.log_scores(scores)
+                paths = mqtt_message.content.get("paths", None)
+                self.command_exector.log_scores(scores, paths)
         if command == "post":
             self.command_exector.post(command_args=mqtt_message.content["args"])
 
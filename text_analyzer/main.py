@@ -8,6 +8,7 @@ from utils.news_scraper import NewsScraper
 from utils.social_media_scraper import RedditScraper, TwitterScraper
 from utils.classification_inference import ClassificationInference
 from common_utils.logger import get_logger
+from common_utils.artifact_store import ArtifactStore
 from common_utils.mqtt import Subscriber, Publisher, Broker
 
 LOGGER = get_logger("Text Analyzer")
@@ -48,7 +49,12 @@ def main() -> None:
     text_inference = ClassificationInference(os.getenv("TEXT_INFERENCE_PRETRAINED"))
     publisher = Publisher("text-analyzer-pub", Broker())
     handler = Handler(
-        text_scraper, reddit_scraper, twitter_scraper, text_inference, publisher
+        text_scraper,
+        reddit_scraper,
+        twitter_scraper,
+        text_inference,
+        publisher,
+        ArtifactStore(),
     )
     subscriber = Subscriber("text-analyzer-sub", Broker(), "slackbot-pub", [handler])
     subscriber.start()
@@ -1,4 +1,5 @@
 import torch
+import numpy as np
 from torch import nn
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
 
@@ -21,6 +22,48 @@ def _get_class_to_label():
     return load_yml("./configs/text_analyzer/class_to_label.yml")
 
 
+def _get_inference_config():
+    """
+    Get config of text classification inference.
+
+    Args:
+        None.
+    Returns:
+        Config of text classification inference (dict).
+    """
+    return load_yml("./configs/text_analyzer/inference.yml")
+
+
+def _make_batches(lengths: list, max_tokens: int, max_batch_size: int) -> list:
+    """
+    Group prompts of similar token lengths into batches, so that little of
+    a batch is padding.
+
+    The prompts are sorted by length and a batch takes the next prompts
+    until its size times its longest prompt exceeds max_tokens. A prompt
+    longer than max_tokens is batched alone.
+
+    Args:
+        lengths (list): Token length of each prompt.
+        max_tokens (int): Maximum number of tokens of a batch, padding included.
+        max_batch_size (int): Maximum number of prompts of a batch.
+    Returns:
+        Indices of the prompts of each batch (list).
+    """
+    batches, batch = [], []
+    for idx in np.argsort(lengths, kind="stable"):
+        # Sorted by length, the prompt is the longest of the batch
+        if batch and (
+            len(batch) >= max_batch_size or (len(batch) + 1) * lengths[idx] > max_tokens
+        ):
+            batches.append(batch)
+            batch = []
+        batch.append(int(idx))
+    if batch:
+        batches.append(batch)
+    return batches
+
+
 class ClassificationInference:
     """
     Text classification inference.
@@ -39,9 +82,58 @@ class ClassificationInference:
         self.tokenizer = AutoTokenizer.from_pretrained(pretrained)
         self.model = AutoModelForSequenceClassification.from_pretrained(pretrained)
         self.model.to(DEVICE)
+        self.model.eval()
         self.labels = _get_class_to_label()
+        # Weights of the classes in the order of the model outputs
+        self.weights = torch.tensor(
+            [self.labels[idx]["weights"] for idx in range(len(self.labels))],
+            dtype=torch.float32,
+            device=DEVICE,
+        )
+        config = _get_inference_config()
+        self.batch_size = config["batch_size"]
+        self.max_length = config["max_length"]
+        self.max_tokens_per_batch = config["max_tokens_per_batch"]
         LOGGER.info("Initialized text classification inference.")
 
+    def _classify(self, prompts: list) -> torch.Tensor:
+        """
+        Classify the prompts in batches of similar token lengths.
+
+        Args:
+            prompts (list): Prompts to be classified.
+        Returns:
+            Class probabilities of shape (n_prompts, n_classes), in the order of the prompts (torch.Tensor).
+        """
+        encodings = self.tokenizer(prompts, truncation=True, max_length=self.max_length)
+        lengths = [len(input_ids) for input_ids in encodings["input_ids"]]
+        batches = _make_batches(lengths, self.max_tokens_per_batch, self.batch_size)
+        probabilities = torch.empty(
+            len(prompts), len(self.labels), dtype=torch.float32, device=DEVICE
+        )
+        for batch in batches:
+            model_input = self.tokenizer.pad(
+                {
+                    "input_ids": [encodings["input_ids"][idx] for idx in batch],
+                    "attention_mask": [
+                        encodings["attention_mask"][idx] for idx in batch
+                    ],
+                },
+                return_tensors="pt",
+            ).to(DEVICE)
+            with torch.inference_mode():
+                logits = self.model(
+                    model_input["input_ids"],
+                    attention_mask=model_input["attention_mask"],
+                ).logits
+                # Back to the order of the prompts
+                probabilities[batch] = nn.functional.softmax(logits, dim=-1)
+        LOGGER.debug(
+            f"Classified {len(prompts)} prompts in {len(batches)} batches, "
+            f"{sum(lengths)} tokens."
+        )
+        return probabilities
+
     def __call__(self, prompt):
         """
         Call text classification inference.
@@ -49,21 +141,27 @@ class ClassificationInference:
         Args:
             prompt (str): Prompt to be classified.
         Returns:
-            Class scores (list).
+            Class scores (np.ndarray).
         """
         LOGGER.info(f"Input: {prompt=}")
-        model_input = self.tokenizer(
-            prompt, padding=True, truncation=True, max_length=512, return_tensors="pt"
-        )
-        model_output = self.model(
-            model_input["input_ids"], attention_mask=model_input["attention_mask"]
-        )
-        model_output = (
-            nn.functional.softmax(model_output.logits, dim=-1).detach().numpy()[0]
-        )
+        model_output = self._classify([prompt]).cpu().numpy()[0]
         LOGGER.info(f"Output: {model_output=}")
         return model_output
 
+    def get_scores(self, prompts: list) -> np.ndarray:
+        """
+        Get scores of the prompts.
+
+        Args:
+            prompts (list): Prompts to be classified.
+        Returns:
+            Score of each prompt (np.ndarray).
+        """
+        if not prompts:
+            return np.empty(0, dtype=np.float32)
+        # Weighted sum of the class probabilities of all the prompts at once
+        return (self._classify(prompts) @ self.weights).cpu().numpy()
+
     def get_score(self, prompt: str) -> float:
         """
         Get score of the prompt.
@@ -73,12 +171,9 @@ class ClassificationInference:
         Returns:
             Score of the prompt (float).
         """
-        target_score = 0
-        class_scores = self.__call__(prompt)
-        for idx, score in enumerate(class_scores):
-            target_score += self.labels[idx]["weights"] * score
+        score = float(self.get_scores([prompt])[0])
         LOGGER.info(f"{prompt=}, {score=}")
-        return target_score
+        return score
 
     def get_prompts_scores(self, prompts: list) -> float:
         """
@@ -87,12 +182,9 @@ class ClassificationInference:
         Args:
             prompts (list): Prompts to be classified.
         Returns:
-            Score of the prompts (float).
+            Average score of the prompts (float).
         """
         LOGGER.info(f"Received number of prompts: {len(prompts)}")
-        target_score = 0
-        for prompt in prompts:
-            class_scores = self.__call__(prompt)
-            for idx, score in enumerate(class_scores):
-                target_score += (self.labels[idx]["weights"] * score) / len(prompts)
-        return target_score
+        if not prompts:
+            return 0.0
+        return float(self.get_scores(list(prompts)).mean())
@@ -1,9 +1,11 @@
+import shutil
 import pandas as pd
 
 from .news_scraper import NewsScraper
 from .social_media_scraper import RedditScraper, TwitterScraper
 from .classification_inference import ClassificationInference
 from common_utils.logger import get_logger
+from common_utils.artifact_store import ArtifactStore
 from common_utils.mqtt import Publisher, MQTTMessage
 
 LOGGER = get_logger("text_analyzer/utils/handler")
@@ -21,6 +23,7 @@ class Handler:
         twitter_scraper: TwitterScraper,
         text_inference: ClassificationInference,
         publisher: Publisher,
+        artifact_store: ArtifactStore,
     ) -> None:
         """
         Initialize Handler.
@@ -31,6 +34,7 @@ class Handler:
             twitter_scraper (TwitterScraper): Twitter scraper.
             text_inference (ClassificationInference): Text inference.
             publisher (Publisher): Publisher for publishing messages to MQTT.
+            artifact_store (ArtifactStore): Store of the analysis results.
         Returns:
             None.
         """
@@ -39,6 +43,7 @@ class Handler:
         self.twitter_scraper = twitter_scraper
         self.text_inference = text_inference
         self.text_scraper = news_scraper
+        self.artifact_store = artifact_store
         LOGGER.info("Initialized Text Analyzer Handler.")
 
     def on_MQTTMessage(self, mqtt_message: MQTTMessage) -> None:
@@ -118,27 +123,37 @@ class Handler:
         Returns:
             None.
         """
-        results = []
+        prompts, types = [], []
         news_prompts = self.text_scraper.scrape(command_args["keywords"])
-        for prompt in news_prompts:
-            results.append([self.text_inference.get_score(prompt), "news", prompt])
+        prompts.extend(news_prompts)
+        types.extend(["news"] * len(news_prompts))
 
         if self.reddit_scraper:
             reddit_prompts = self.reddit_scraper.scrape(command_args["keywords"])
-            for prompt in reddit_prompts:
-                results.append(
-                    [self.text_inference.get_score(prompt), "reddit", prompt]
-                )
+            prompts.extend(reddit_prompts)
+            types.extend(["reddit"] * len(reddit_prompts))
 
         if self.twitter_scraper:
             twitter_prompts = self.twitter_scraper.scrape(command_args["keywords"])
-            for prompt in twitter_prompts:
-                results.append([self.text_inference.get_score(prompt), "tweet", prompt])
-
-        pd.DataFrame(results, columns=["Score", "Type", "Content"]).to_csv(
-            "/data/t_analysis.csv", index=None
-        )
+            prompts.extend(twitter_prompts)
+            types.extend(["tweet"] * len(twitter_prompts))
+
+        # All the prompts are classified in batches at once
+        scores = self.text_inference.get_scores(prompts)
+        results = [
+            [float(score), prompt_type, prompt]
+            for score, prompt_type, prompt in zip(scores, types, prompts)
+        ]
+
+        output_dir = self.artifact_store.make_temp_dir()
+        try:
+            pd.DataFrame(results, columns=["Score", "Type", "Content"]).to_csv(
+                f"{output_dir}/t_analysis.csv", index=None
+            )
+            artifact_id = self.artifact_store.put(f"{output_dir}/t_analysis.csv")
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
         message = str(
-            {"command": "post", "args": {"type": "csv", "path": "/data/t_analysis.csv"}}
+            {"command": "post", "args": {"type": "csv", "artifact_id": artifact_id}}
         )
         self._publish_message(message)